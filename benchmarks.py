@@ -0,0 +1,644 @@
+"""Бенчмарки на синтетических данных: работают на Linux без Windows и дисплея
+
+    python benchmarks.py memory --count 100000
+    python benchmarks.py tree --count 10000 [--tk]
+    python benchmarks.py importtime
+    python benchmarks.py classify --count 50000
+    python benchmarks.py arrange --count 20000 --monitors 3
+    python benchmarks.py watch --count 2000 --polls 500
+    python benchmarks.py profile --count 5000 [--output FILE] [--baseline FILE]
+    python benchmarks.py suite [--sizes 10 100 1000] [--save-baseline FILE] [--baseline FILE]
+    python benchmarks.py stream --size-mb 200
+    python benchmarks.py search --layouts 2000 --count 100
+
+benchmarks_baseline.json - результаты suite с параметрами по умолчанию для сравнения через --baseline.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import main
+
+
+class LegacyShortcut:
+    """Прежнее представление ярлыка: обычный класс с __dict__ и ISO-строками"""
+
+    def __init__(self, data):
+        self.name = data['name']
+        self.position = data['position']
+        self.pidl = data['pidl']
+        self.icon_type = data.get('icon_type', 'неопознано')
+        self.tags = data.get('tags', [])
+        self.description = data.get('description', '')
+        self.custom_color = data.get('custom_color')
+        self.importance = data.get('importance', 1)
+        self.created = data['created']
+        self.modified = data['modified']
+
+
+def synthetic_layout(count, legacy_pidls=False):
+    """Словарь layout с count ярлыками, как после json.load"""
+    backend = main.InMemoryShellBackend.generate(count)
+    types = list(main.ICON_TYPES)
+    shortcuts = []
+    for i, item in enumerate(backend.items):
+        pidl = str(item['pidl']) if legacy_pidls else main.encode_pidl(item['pidl'])
+        shortcuts.append({
+            'name': item['name'],
+            'position': list(item['position']),
+            'pidl': pidl,
+            'icon_type': types[i % len(types)],
+            'tags': ['steam'] if i % 3 == 0 else [],
+            'description': '',
+            'custom_color': None,
+            'importance': 1 + i % 5,
+            'created': f"2025-09-22T15:34:{i % 60:02d}.{i % 1000000:06d}",
+            'modified': f"2025-09-22T15:35:{i % 60:02d}.{i % 1000000:06d}"
+        })
+    return {'name': 'bench', 'description': '', 'version': main.LAYOUT_VERSION, 'shortcuts': shortcuts}
+
+
+def retained_memory(text, build):
+    """Память, оставшаяся занятой результатом build после разбора JSON"""
+    tracemalloc.start()
+    result = build(json.loads(text))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def bench_memory(count):
+    legacy_text = json.dumps(synthetic_layout(count, legacy_pidls=True), ensure_ascii=False)
+    text = json.dumps(synthetic_layout(count), ensure_ascii=False)
+    results = {
+        'legacy': retained_memory(legacy_text, lambda data: [LegacyShortcut(s) for s in data['shortcuts']]),
+        'slots': retained_memory(text, main.DesktopLayout.from_dict),
+        'columnar': retained_memory(text, main.ColumnarDesktopLayout.from_dict)
+    }
+    print(f"Память на {count} ярлыков:")
+    for name, size in results.items():
+        print(f"  {name:10} {size / 2 ** 20:8.1f} МБ  {size / count:6.0f} байт/ярлык")
+    return results
+
+
+class StubTreeview:
+    """Заглушка ttk.Treeview: хранит строки и считает обращения к виджету"""
+
+    def __init__(self):
+        self.items = {}
+        self.calls = 0
+
+    def insert(self, parent, index, iid=None, values=()):
+        self.calls += 1
+        self.items[iid] = values
+        return iid
+
+    def item(self, iid, values=None):
+        self.calls += 1
+        self.items[iid] = values
+
+    def delete(self, *iids):
+        self.calls += 1
+        for iid in iids:
+            del self.items[iid]
+
+
+def make_treeview(use_tk):
+    if not use_tk:
+        return StubTreeview(), None
+    import tkinter as tk
+    from tkinter import ttk
+    root = tk.Tk()
+    tree = ttk.Treeview(root, columns=('name', 'type', 'importance', 'description'), show='headings')
+    return tree, root
+
+
+def timed(action):
+    start = time.perf_counter()
+    action()
+    return time.perf_counter() - start
+
+
+def bench_tree(count, use_tk=False):
+    layout = main.DesktopLayout.from_dict(synthetic_layout(count))
+    other = main.DesktopLayout.from_dict(synthetic_layout(count))
+    other.shortcuts[0].update(name="Changed")
+
+    results = {}
+    for page_size in (main.PagedShortcutsTree.PAGE_SIZE, None):
+        tree, root = make_treeview(use_tk)
+        sync = main.PagedShortcutsTree(tree, page_size=page_size)
+        mode = f"page={page_size}" if page_size else "full"
+        results[f"{mode} initial"] = timed(lambda: sync.show(layout))
+        shortcut = layout.shortcuts[1]
+        shortcut.update(importance=5)
+        results[f"{mode} edit one row"] = timed(lambda: sync.update_row(shortcut))
+        results[f"{mode} reload same"] = timed(lambda: sync.show(layout))
+        results[f"{mode} load other"] = timed(lambda: sync.show(other))
+        if root is not None:
+            root.destroy()
+
+    print(f"Обновление дерева, {count} строк ({'Tk' if use_tk else 'заглушка'}):")
+    for name, seconds in results.items():
+        print(f"  {name:24} {seconds * 1000:9.2f} мс")
+    return results
+
+
+def import_times(module):
+    """Разбор вывода -X importtime: {модуль: суммарное время импорта, мкс}"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                               capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def bench_importtime():
+    headless = import_times("main")
+    gui = import_times("gui")
+    heavy = [name for name in headless if name.split('.')[0] in ('tkinter', '_tkinter', 'win32com', 'pythoncom')]
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    with tempfile.TemporaryDirectory() as layouts_dir:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, '--layouts-dir', layouts_dir, 'list', '--json'],
+                       capture_output=True, check=True)
+        cli_seconds = time.perf_counter() - start
+
+    results = {
+        'import_main_us': headless.get('main', 0),
+        'import_gui_us': gui.get('gui', 0),
+        'heavy_modules_in_headless': heavy,
+        'cli_list_seconds': cli_seconds
+    }
+    print(f"Импорт main (консоль): {results['import_main_us'] / 1000:8.1f} мс")
+    print(f"Импорт gui (Tk):       {results['import_gui_us'] / 1000:8.1f} мс")
+    print(f"main.py list --json:   {cli_seconds * 1000:8.1f} мс (весь процесс)")
+    print(f"tkinter/pywin32 в консольном режиме: {', '.join(heavy) if heavy else 'нет'}")
+    return results
+
+
+CLASSIFY_NAMES = ["Steam", "Google Chrome", "Отчет.docx", "Visual Studio Code", "Корзина",
+                  "VLC media player", "Telegram", "Minecraft", "notes.txt", "Моя папка", "Unknown Tool"]
+
+
+def bench_classify(count):
+    layout = main.DesktopLayout.from_dict(synthetic_layout(count))
+    for i, shortcut in enumerate(layout.shortcuts):
+        shortcut.name = f"{i} {CLASSIFY_NAMES[i % len(CLASSIFY_NAMES)]}"
+
+    classifier = main.IconClassifier()
+    shortcuts = layout.shortcuts
+    cold = timed(lambda: classifier.classify_many(shortcuts))
+    warm = timed(lambda: classifier.classify_many(shortcuts))
+    types = classifier.classify_many(shortcuts)
+    counts = {}
+    for icon_type in types:
+        counts[icon_type] = counts.get(icon_type, 0) + 1
+
+    print(f"Классификация {count} ярлыков:")
+    print(f"  первый проход      {cold * 1000:9.1f} мс")
+    print(f"  повтор (кэш PIDL)  {warm * 1000:9.1f} мс")
+    print(f"  типы: {counts}")
+    return {'cold_seconds': cold, 'warm_seconds': warm}
+
+
+def bench_arrange(count, monitors):
+    """Раскладка по типам на нескольких мониторах; 5% иконок закреплены на местах"""
+    rows = 40
+    columns = -(-count * 5 // 4 // monitors // rows) + len(main.ICON_TYPES)
+    width, height = main.DEFAULT_ICON_SPACING
+    regions = [(i * columns * width, 0, columns * width, rows * height) for i in range(monitors)]
+
+    results = {}
+    for size in (count // 4, count // 2, count):
+        layout = main.DesktopLayout.from_dict(synthetic_layout(size))
+        keep = [shortcut.id for shortcut in layout.shortcuts[::20]]
+        arranger = main.LayoutArranger(regions)
+        results[size] = timed(lambda: arranger.arrange(layout, keep=keep))
+
+    backend = main.InMemoryShellBackend.generate(count)
+    backend.regions = regions
+    manager = main.DesktopIconManager(backend=backend, layouts_dir=tempfile.mkdtemp())
+    manager.error_handler = main.cli_error
+    manager.auto_classify = False
+    layout = manager.create_layout("bench")
+    for i, shortcut in enumerate(layout.shortcuts):
+        shortcut.update(icon_type=list(main.ICON_TYPES)[i % len(main.ICON_TYPES)], importance=1 + i % 5)
+    arranged = manager.arrange_layout(layout)
+    restore_seconds = timed(lambda: manager.restore_layout(arranged))
+
+    print(f"Раскладка по типам, {monitors} монитора по {columns}x{rows} ячеек:")
+    for size, seconds in results.items():
+        print(f"  {size:7} иконок  {seconds * 1000:9.1f} мс  {seconds / size * 1e6:6.2f} мкс/иконку")
+    print(f"  restore_layout упорядоченного: {restore_seconds * 1000:.1f} мс, "
+          f"{manager.last_restore_plan.stats()}")
+    return results
+
+
+def bench_watch(count, polls):
+    """Стоимость опроса DesktopWatcher в простое и обработка серии перемещений"""
+    backend = main.SimulatedShellBackend.generate(count)
+    manager = main.DesktopIconManager(backend=backend, layouts_dir=tempfile.mkdtemp())
+    manager.error_handler = main.cli_error
+    layout = manager.create_layout("watch")
+    manager.save_layout(layout)
+    now = [0.0]
+    watcher = main.DesktopWatcher(manager, layout, clock=lambda: now[0])
+
+    backend.calls = dict.fromkeys(backend.calls, 0)
+    idle_seconds = timed(lambda: [watcher.step() for _ in range(polls)]) / polls
+    idle_calls = dict(backend.calls)
+
+    # Серия: 10 опросов подряд по 5 перемещений, затем стол успокаивается
+    backend.calls = dict.fromkeys(backend.calls, 0)
+    changes = 0
+    for i in range(10 + 3):
+        if i < 10:
+            backend.move_random(5)
+        now[0] += watcher.interval
+        changes += watcher.step()
+    burst_calls = dict(backend.calls)
+    full_seconds = timed(lambda: manager.get_desktop_items())
+
+    print(f"Наблюдение за столом из {count} иконок:")
+    print(f"  опрос в простое      {idle_seconds * 1e6:9.1f} мкс "
+          f"({idle_seconds / watcher.interval * 100:.4f}% CPU при интервале {watcher.interval:g} с)")
+    print(f"  полное перечисление  {full_seconds * 1e6:9.1f} мкс")
+    print(f"  обращения в простое за {polls} опросов: {idle_calls}")
+    print(f"  серия из 50 перемещений: обновлений layout {watcher.syncs}, изменений {changes}, "
+          f"обращения {burst_calls}")
+    return {'idle_poll_seconds': idle_seconds, 'full_seconds': full_seconds, 'syncs': watcher.syncs}
+
+
+def profile_scenario(count):
+    """Захват, сохранение, загрузка, восстановление и опросы на SimulatedShellBackend"""
+    backend = main.SimulatedShellBackend.generate(count)
+    manager = main.DesktopIconManager(backend=backend, layouts_dir=tempfile.mkdtemp())
+    manager.error_handler = main.cli_error
+    layout = manager.create_layout("profile")
+    manager.save_layout(layout)
+    manager.layout_cache = main.LayoutCache()
+    manager.load_layout("profile.json")
+    manager.load_layout("profile.json")
+    layout.shortcuts[0].update(importance=5)
+    manager.save_layout(layout)
+    backend.move_random(count // 10)
+    manager.restore_layout(layout)
+    watcher = main.DesktopWatcher(manager, layout)
+    for _ in range(10):
+        watcher.step()
+    return manager
+
+
+def compare_with_baseline(report, baseline, tolerance):
+    """Счетчики операций, выросшие больше чем на tolerance относительно baseline"""
+    regressions = []
+    for operation, expected in baseline['operations'].items():
+        actual = report['operations'].get(operation, {})
+        for name, value in expected.get('counters', {}).items():
+            current = actual.get('counters', {}).get(name, 0)
+            if current > value * (1 + tolerance):
+                regressions.append(f"{operation}.{name}: {current} > {value}")
+        if actual.get('calls', 0) > expected.get('calls', 0):
+            regressions.append(f"{operation}.calls: {actual['calls']} > {expected['calls']}")
+    return regressions
+
+
+def bench_profile(count, output=None, baseline=None, tolerance=0.05):
+    main.metrics.enable(False)
+    profile_scenario(count)  # прогрев: первый прогон платит за импорты и компиляцию регулярных выражений
+    disabled = timed(lambda: profile_scenario(count))
+    main.metrics.reset()
+    main.metrics.enable()
+    managers = []
+    enabled = timed(lambda: managers.append(profile_scenario(count)))
+    main.metrics.enable(False)
+    report = managers[0].metrics_report()
+    report['count'] = count
+
+    print(f"Профиль сценария на {count} иконках (метрики выключены: {disabled * 1000:.1f} мс, "
+          f"включены: {enabled * 1000:.1f} мс):")
+    for operation, entry in report['operations'].items():
+        counters = ", ".join(f"{name}={value}" for name, value in entry.get('counters', {}).items())
+        seconds = entry.get('seconds', 0.0)
+        print(f"  {operation:60} {entry.get('calls', 0):4} x {seconds * 1000:9.2f} мс  {counters}")
+    for name, stats in report['caches'].items():
+        if stats:
+            print(f"  кэш {name}: попаданий {stats['hits']}, промахов {stats['misses']}")
+    if output:
+        main.atomic_write_json(output, report)
+
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_with_baseline(report, json.load(f), tolerance)
+        for regression in regressions:
+            print(f"  РЕГРЕССИЯ {regression}")
+        return not regressions
+    return True
+
+
+SUITE_SIZES = (10, 100, 1000, 10000, 100000)
+SUITE_OPERATIONS = ('capture', 'save', 'load', 'lookup', 'restore')
+
+
+def suite_case(count, name_collisions, pidl_size, seed):
+    """Один прогон набора на рабочем столе из count иконок: {операция: секунды}"""
+    backend = main.InMemoryShellBackend.generate(count, name_collisions=name_collisions,
+                                                 pidl_size=pidl_size, seed=seed)
+    with tempfile.TemporaryDirectory() as layouts_dir:
+        manager = main.DesktopIconManager(backend=backend, layouts_dir=layouts_dir)
+        manager.error_handler = main.cli_error
+        results = {}
+        captured = []
+        results['capture'] = timed(lambda: captured.append(manager.create_layout("suite")))
+        layout = captured[0]
+        results['save'] = timed(lambda: manager.save_layout(layout))
+        manager.layout_cache = main.LayoutCache()
+        results['load'] = timed(lambda: manager.load_layout("suite.json"))
+
+        pidls = [shortcut.pidl for shortcut in layout.shortcuts]
+        results['lookup'] = timed(lambda: [layout.get_shortcut(pidl) for pidl in pidls])
+
+        # Каждая 10-я иконка сдвинута, каждая 20-я пересоздана с новым PIDL и ищется по имени
+        for i, item in enumerate(backend.items):
+            if i % 10 == 0:
+                x, y = item['position']
+                item['position'] = (x + 100, y)
+            if i % 20 == 5:
+                item['pidl'] = item['pidl'][:6] + b"\x01" + item['pidl'][7:]
+        results['restore'] = timed(lambda: manager.restore_layout(layout))
+        return results, manager.last_restore_plan.stats()
+
+
+def bench_suite(sizes, name_collisions, pidl_size, seed, repeat):
+    params = {'name_collisions': name_collisions, 'pidl_size': pidl_size, 'seed': seed}
+    results = {}
+    pidl = f"PIDL {pidl_size} байт" if pidl_size else "PIDL минимального размера"
+    print(f"Набор бенчмарков (совпадения имен {name_collisions:.0%}, {pidl}, лучший из {repeat}):")
+    print(f"  {'иконок':>7}  " + "  ".join(f"{operation:>10}" for operation in SUITE_OPERATIONS) + "  (мс)")
+    for count in sizes:
+        best = None
+        for _ in range(repeat):
+            timings, plan_stats = suite_case(count, name_collisions, pidl_size, seed)
+            best = timings if best is None else {op: min(best[op], timings[op]) for op in best}
+        results[str(count)] = best
+        print(f"  {count:7}  " + "  ".join(f"{best[op] * 1000:10.2f}" for op in SUITE_OPERATIONS)
+              + f"  неоднозначно: {plan_stats['ambiguous']}, не найдено: {plan_stats['unmatched']}")
+    return {'params': params, 'results': results}
+
+
+def suite_regressions(report, baseline, threshold, min_seconds=0.001):
+    """Операции, ставшие медленнее baseline в threshold раз (и не меньше чем на min_seconds)"""
+    if report['params'] != baseline.get('params'):
+        print(f"  Внимание: параметры отличаются от baseline {baseline.get('params')}")
+    regressions = []
+    for count, timings in report['results'].items():
+        expected = baseline['results'].get(count, {})
+        for operation, seconds in timings.items():
+            before = expected.get(operation)
+            if before is not None and seconds > before * threshold and seconds - before > min_seconds:
+                regressions.append(f"{count} иконок, {operation}: {seconds * 1000:.2f} мс "
+                                   f"(было {before * 1000:.2f} мс)")
+    return regressions
+
+
+def synthetic_records(count):
+    """Словари ярлыков для файла layout любого размера, без списка в памяти"""
+    types = list(main.ICON_TYPES)
+    for i in range(count):
+        yield {
+            'name': f"Icon {i}",
+            'position': [(i // 20) * 100, (i % 20) * 100],
+            'pidl': main.encode_pidl(main.InMemoryShellBackend.make_pidl(i, 64)),
+            'icon_type': types[i % len(types)],
+            'tags': ['steam'] if i % 3 == 0 else [],
+            'description': f"Ярлык номер {i}",
+            'custom_color': None,
+            'importance': 1 + i % 5,
+            'created': f"2025-09-22T15:34:{i % 60:02d}.{i % 1000000:06d}",
+            'modified': f"2025-09-22T15:35:{i % 60:02d}.{i % 1000000:06d}"
+        }
+
+
+def memory_status_mb():
+    """(текущий RSS, пиковый RSS) процесса в МБ из /proc/self/status"""
+    values = {}
+    with open('/proc/self/status', 'r', encoding='ascii') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'VmHWM'):
+                values[key] = int(value.split()[0]) / 1024
+    return values['VmRSS'], values['VmHWM']
+
+
+def reset_peak_rss():
+    """Сбросить пиковый RSS (Linux 4.0+), чтобы замерить пик одной фазы"""
+    with open('/proc/self/clear_refs', 'w', encoding='ascii') as f:
+        f.write("5")
+
+
+def stream_worker(mode, path, count):
+    """Один замер в отдельном процессе: пиковая память не смешивается с другими замерами"""
+    serializer = main.LayoutSerializer()
+    header = {'name': 'stream', 'description': '', 'created': '2025-09-22T15:34:18.987659',
+              'modified': '2025-09-22T15:34:21.463140', 'version': main.LAYOUT_VERSION}
+    layout = None
+    if mode in ('save-stream', 'save-json'):
+        # Замеряются накладные расходы сохранения поверх уже загруженного layout
+        with open(path, 'r', encoding='utf-8') as f:
+            layout = serializer.read(f)
+    reset_peak_rss()
+    base, _ = memory_status_mb()
+    start = time.perf_counter()
+    if mode == 'write':
+        with open(path, 'w', encoding='utf-8') as f:
+            serializer.write_records(f, header, synthetic_records(count))
+    elif mode == 'read':
+        with open(path, 'r', encoding='utf-8') as f:
+            _, records = serializer.read_records(f)
+            count = sum(1 for _ in records)
+    elif mode == 'json-load':
+        with open(path, 'r', encoding='utf-8') as f:
+            count = len(json.load(f)['shortcuts'])
+    else:
+        with open(os.devnull, 'w', encoding='utf-8') as f:
+            if mode == 'save-stream':
+                serializer.write(f, layout)
+            else:
+                json.dump(layout.to_dict(), f, indent=2, ensure_ascii=False)
+        count = len(layout.shortcuts)
+    seconds = time.perf_counter() - start
+    _, peak = memory_status_mb()
+    print(json.dumps({'count': count, 'seconds': seconds, 'base_mb': base, 'peak_mb': peak}))
+
+
+def run_stream_worker(mode, path, count=0):
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), 'stream', '--worker', mode,
+                                '--path', path, '--count', str(count)],
+                               capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout)
+
+
+def bench_stream(size_mb):
+    """Пик памяти потоковых записи и чтения против json.load/json.dump на файлах 1/10 и полного размера
+
+    Каждый замер идет в отдельном процессе; пик берется из VmHWM, поэтому нужен Linux.
+    """
+    record_size = len(main.LayoutSerializer().encode_record(next(synthetic_records(1)))) + 2
+    print(f"Потоковый JSON layout (orjson: {'да' if main.LayoutSerializer().orjson else 'нет'}):")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (size_mb / 10, size_mb):
+            path = os.path.join(directory, f"layout_{size:g}.json")
+            count = int(size * 2 ** 20 / record_size)
+            rows = {'запись потоком': run_stream_worker('write', path, count)}
+            file_mb = os.path.getsize(path) / 2 ** 20
+            rows['чтение потоком'] = run_stream_worker('read', path)
+            rows['json.load'] = run_stream_worker('json-load', path)
+            rows['сохранение layout потоком'] = run_stream_worker('save-stream', path)
+            rows['сохранение layout json.dump'] = run_stream_worker('save-json', path)
+            print(f"  файл {file_mb:.0f} МБ, {count} ярлыков:")
+            for name, row in rows.items():
+                print(f"    {name:30} пик +{row['peak_mb'] - row['base_mb']:8.1f} МБ  {row['seconds']:7.2f} с")
+            results[f"{size:g}"] = rows
+    return results
+
+
+SEARCH_QUERIES = ('type:игра tag:steam importance>=4', 'icon 12', 'ic', 'tag:steam -type:папка', 'importance=5')
+
+
+def bench_search(layouts, count, repeat=20):
+    """Построение и загрузка индекса поиска и запросы по layouts x count ярлыков"""
+    data = synthetic_layout(count)
+    types = list(main.ICON_TYPES)
+    with tempfile.TemporaryDirectory() as directory:
+        for n in range(layouts):
+            data['name'] = f"layout {n}"
+            for i, shortcut in enumerate(data['shortcuts']):
+                shortcut['icon_type'] = types[(i + n) % len(types)]
+            with open(os.path.join(directory, f"layout_{n}.json"), 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+
+        manager = main.DesktopIconManager(layouts_dir=directory)
+        manager.error_handler = main.cli_error
+        build_seconds = timed(lambda: manager.search_index.refresh())
+        reopened = main.DesktopIconManager(layouts_dir=directory)
+        load_seconds = timed(lambda: reopened.search_index.refresh())
+        index_mb = os.path.getsize(reopened.search_index.index_path) / 2 ** 20
+
+        print(f"Поиск по {layouts} layouts x {count} ярлыков:")
+        print(f"  построение индекса   {build_seconds:8.3f} с")
+        print(f"  загрузка индекса     {load_seconds:8.3f} с ({index_mb:.1f} МБ)")
+        results = {'build_seconds': build_seconds, 'load_seconds': load_seconds, 'queries': {}}
+        for query in SEARCH_QUERIES:
+            hits = len(reopened.search_shortcuts(query))
+            seconds = min(timed(lambda: reopened.search_shortcuts(query, limit=100)) for _ in range(repeat))
+            results['queries'][query] = seconds
+            print(f"  {query:36} {seconds * 1000:8.2f} мс, найдено {hits}")
+
+        layout = reopened.load_layout("layout_0.json")
+        layout.shortcuts[0].update(tags=['bench'])
+        save_seconds = timed(lambda: reopened.save_layout(layout))
+        found = len(reopened.search_shortcuts("tag:bench"))
+        print(f"  сохранение с обновлением индекса {save_seconds * 1000:8.2f} мс, найдено tag:bench {found}")
+        results['save_seconds'] = save_seconds
+    return results
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки DesktopSorting")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    memory_parser = subparsers.add_parser('memory', help="память Shortcut/DesktopLayout")
+    memory_parser.add_argument('--count', type=int, default=100000)
+    tree_parser = subparsers.add_parser('tree', help="обновление Treeview")
+    tree_parser.add_argument('--count', type=int, default=10000)
+    tree_parser.add_argument('--tk', action='store_true',
+                             help="настоящий ttk.Treeview (нужен дисплей, например Xvfb)")
+    subparsers.add_parser('importtime', help="время импорта консольного режима и GUI")
+    classify_parser = subparsers.add_parser('classify', help="классификация ярлыков")
+    classify_parser.add_argument('--count', type=int, default=50000)
+    arrange_parser = subparsers.add_parser('arrange', help="автоматическая раскладка по типам")
+    arrange_parser.add_argument('--count', type=int, default=20000)
+    arrange_parser.add_argument('--monitors', type=int, default=3)
+    watch_parser = subparsers.add_parser('watch', help="опрос рабочего стола в режиме наблюдения")
+    watch_parser.add_argument('--count', type=int, default=2000)
+    watch_parser.add_argument('--polls', type=int, default=500)
+    profile_parser = subparsers.add_parser('profile', help="метрики сценария на фейковом рабочем столе")
+    profile_parser.add_argument('--count', type=int, default=5000)
+    profile_parser.add_argument('--output', help="сохранить отчет в JSON (например, как baseline)")
+    profile_parser.add_argument('--baseline', help="сравнить счетчики с сохраненным отчетом; "
+                                                   "при росте код возврата 1")
+    profile_parser.add_argument('--tolerance', type=float, default=0.05, help="допустимый рост счетчиков")
+    suite_parser = subparsers.add_parser('suite', help="захват, восстановление, сохранение, загрузка и "
+                                                       "поиск от 10 до 100k иконок")
+    suite_parser.add_argument('--sizes', type=int, nargs='+', default=list(SUITE_SIZES))
+    suite_parser.add_argument('--name-collisions', type=float, default=0.05,
+                              help="доля иконок с уже занятым именем")
+    suite_parser.add_argument('--pidl-size', type=int, default=0, help="размер PIDL в байтах")
+    suite_parser.add_argument('--seed', type=int, default=0)
+    suite_parser.add_argument('--repeat', type=int, default=3)
+    suite_parser.add_argument('--save-baseline', help="сохранить результаты в JSON")
+    suite_parser.add_argument('--baseline', help="сравнить с сохраненными результатами; "
+                                                 "при замедлении код возврата 1")
+    suite_parser.add_argument('--threshold', type=float, default=1.5, help="допустимое замедление, раз")
+    stream_parser = subparsers.add_parser('stream', help="пиковая память потокового чтения и записи layout")
+    stream_parser.add_argument('--size-mb', type=float, default=200)
+    stream_parser.add_argument('--worker', help=argparse.SUPPRESS)
+    stream_parser.add_argument('--path', help=argparse.SUPPRESS)
+    stream_parser.add_argument('--count', type=int, default=0, help=argparse.SUPPRESS)
+    search_parser = subparsers.add_parser('search', help="индекс поиска по ярлыкам всех layouts")
+    search_parser.add_argument('--layouts', type=int, default=2000)
+    search_parser.add_argument('--count', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    if args.command == 'memory':
+        bench_memory(args.count)
+    elif args.command == 'tree':
+        bench_tree(args.count, use_tk=args.tk and bool(os.environ.get('DISPLAY')))
+    elif args.command == 'importtime':
+        results = bench_importtime()
+        if results['heavy_modules_in_headless']:
+            return 1
+    elif args.command == 'classify':
+        bench_classify(args.count)
+    elif args.command == 'arrange':
+        bench_arrange(args.count, args.monitors)
+    elif args.command == 'watch':
+        bench_watch(args.count, args.polls)
+    elif args.command == 'profile':
+        if not bench_profile(args.count, args.output, args.baseline, args.tolerance):
+            return 1
+    elif args.command == 'stream':
+        if args.worker:
+            stream_worker(args.worker, args.path, args.count)
+        else:
+            bench_stream(args.size_mb)
+    elif args.command == 'search':
+        bench_search(args.layouts, args.count)
+    elif args.command == 'suite':
+        report = bench_suite(args.sizes, args.name_collisions, args.pidl_size or None, args.seed, args.repeat)
+        if args.save_baseline:
+            main.atomic_write_json(args.save_baseline, report)
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                regressions = suite_regressions(report, json.load(f), args.threshold)
+            for regression in regressions:
+                print(f"  РЕГРЕССИЯ {regression}")
+            if regressions:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
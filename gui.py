@@ -0,0 +1,523 @@
+import tkinter as tk
+from tkinter import messagebox, ttk, simpledialog
+
+from main import (ICON_TYPES, DesktopIconManager, DesktopWatcher, DiffEntry, JobCancelled, JobRunner,
+                  PagedShortcutsTree, TkCallbackQueue, summarize_diff)
+
+
+class IconEditorDialog(simpledialog.Dialog):
+    def __init__(self, parent, shortcut, title="Редактирование ярлыка"):
+        self.shortcut = shortcut
+        super().__init__(parent, title)
+
+    def body(self, frame):
+        ttk.Label(frame, text="Название:").grid(row=0, column=0, sticky="w", padx=5, pady=5)
+        self.name_var = tk.StringVar(value=self.shortcut.name)
+        ttk.Entry(frame, textvariable=self.name_var, width=30).grid(row=0, column=1, padx=5, pady=5)
+
+        ttk.Label(frame, text="Тип:").grid(row=1, column=0, sticky="w", padx=5, pady=5)
+        self.type_var = tk.StringVar(value=self.shortcut.icon_type)
+        type_combo = ttk.Combobox(frame, textvariable=self.type_var, values=list(ICON_TYPES.keys()))
+        type_combo.grid(row=1, column=1, padx=5, pady=5)
+
+        ttk.Label(frame, text="Важность (1-5):").grid(row=2, column=0, sticky="w", padx=5, pady=5)
+        self.importance_var = tk.IntVar(value=self.shortcut.importance)
+        ttk.Spinbox(frame, from_=1, to=5, textvariable=self.importance_var, width=5).grid(row=2, column=1, padx=5,
+                                                                                          pady=5)
+
+        ttk.Label(frame, text="Описание:").grid(row=3, column=0, sticky="w", padx=5, pady=5)
+        self.desc_var = tk.StringVar(value=self.shortcut.description)
+        ttk.Entry(frame, textvariable=self.desc_var, width=30).grid(row=3, column=1, padx=5, pady=5)
+
+        ttk.Label(frame, text="Теги (через запятую):").grid(row=4, column=0, sticky="w", padx=5, pady=5)
+        self.tags_var = tk.StringVar(value=", ".join(self.shortcut.tags))
+        ttk.Entry(frame, textvariable=self.tags_var, width=30).grid(row=4, column=1, padx=5, pady=5)
+
+        return frame
+
+    def apply(self):
+        self.shortcut.update(
+            name=self.name_var.get(),
+            icon_type=self.type_var.get(),
+            importance=self.importance_var.get(),
+            description=self.desc_var.get(),
+            tags=[tag.strip() for tag in self.tags_var.get().split(',') if tag.strip()]
+        )
+        self.result = True
+
+
+class DesktopIconApp:
+    SEARCH_LIMIT = 500  # результатов поиска в окне
+
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Продвинутый менеджер рабочего стола")
+        self.root.geometry("800x600")
+
+        self.manager = DesktopIconManager()
+        self.current_layout = None
+
+        # COM-операции выполняются в рабочем потоке, колбэки возвращаются в главный цикл Tk
+        self.jobs = JobRunner(TkCallbackQueue(self.root))
+        self.current_job = None
+        self.watcher = None  # DesktopWatcher, пока включено наблюдение
+        self.search_window = None
+        self.search_hits = {}  # iid строки результатов -> найденный ярлык
+        self.manager.error_handler = lambda title, message: self.jobs.dispatch(
+            messagebox.showerror, title, message)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        self.setup_ui()
+        self.refresh_layouts_list()
+
+    def setup_ui(self):
+        """Настройка пользовательского интерфейса"""
+        # Основные фреймы
+        main_frame = ttk.Frame(self.root, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        # Левая панель - управление layouts
+        left_frame = ttk.LabelFrame(main_frame, text="Управление сохранениями", padding=10)
+        left_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 10))
+
+        # Правая панель - редактирование
+        right_frame = ttk.LabelFrame(main_frame, text="Редактирование ярлыков", padding=10)
+        right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+
+        # Левая панель - элементы
+        ttk.Button(left_frame, text="Создать новое сохранение",
+                   command=self.create_new_layout).pack(pady=5, fill=tk.X)
+
+        ttk.Label(left_frame, text="Сохраненные layouts:").pack(pady=(10, 5), anchor="w")
+
+        self.layouts_listbox = tk.Listbox(left_frame, height=10)
+        self.layouts_listbox.pack(fill=tk.BOTH, expand=True, pady=5)
+        self.layouts_listbox.bind('<<ListboxSelect>>', self.on_layout_select)
+        self.layouts_listbox.bind('<Double-1>', lambda event: self.load_selected_layout())
+
+        button_frame = ttk.Frame(left_frame)
+        button_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Button(button_frame, text="Загрузить",
+                   command=self.load_selected_layout).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        ttk.Button(button_frame, text="Удалить",
+                   command=self.delete_selected_layout).pack(side=tk.RIGHT, fill=tk.X, expand=True, padx=2)
+
+        ttk.Button(left_frame, text="Восстановить на рабочий стол",
+                   command=self.restore_current_layout).pack(pady=5, fill=tk.X)
+        ttk.Button(left_frame, text="Что изменится?",
+                   command=self.preview_current_layout).pack(pady=5, fill=tk.X)
+        ttk.Button(left_frame, text="Упорядочить по типам",
+                   command=self.arrange_current_layout).pack(pady=5, fill=tk.X)
+        ttk.Button(left_frame, text="Отменить операцию",
+                   command=self.cancel_current_job).pack(pady=5, fill=tk.X)
+        self.watch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(left_frame, text="Следить за рабочим столом", variable=self.watch_var,
+                        command=self.toggle_watch).pack(pady=5, anchor="w")
+
+        # Правая панель - поиск по всем сохранениям и Treeview для ярлыков
+        search_frame = ttk.Frame(right_frame)
+        search_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(search_frame, text="Поиск:").pack(side=tk.LEFT, padx=2)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        search_entry.bind('<Return>', lambda event: self.search_shortcuts())
+        ttk.Button(search_frame, text="Найти",
+                   command=self.search_shortcuts).pack(side=tk.LEFT, padx=2)
+
+        self.setup_shortcuts_tree(right_frame)
+
+        # Статусная строка
+        self.status_var = tk.StringVar(value="Готов к работе")
+        status_label = ttk.Label(main_frame, textvariable=self.status_var,
+                                 foreground="green", font=('Arial', 9))
+        status_label.pack(side=tk.BOTTOM, fill=tk.X, pady=5)
+
+    def setup_shortcuts_tree(self, parent):
+        """Настройка TreeView для ярлыков"""
+        # Создаем фрейм для TreeView и скроллбара
+        tree_frame = ttk.Frame(parent)
+        tree_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+
+        # Создаем TreeView с правильными колонками
+        self.shortcuts_tree = ttk.Treeview(tree_frame, columns=('name', 'type', 'importance', 'description'),
+                                           show='headings', height=15)
+
+        # Настраиваем заголовки колонок
+        self.shortcuts_tree.heading('name', text='Название')
+        self.shortcuts_tree.heading('type', text='Тип')
+        self.shortcuts_tree.heading('importance', text='Важность')
+        self.shortcuts_tree.heading('description', text='Описание')
+
+        # Настраиваем ширину колонок
+        self.shortcuts_tree.column('name', width=150)
+        self.shortcuts_tree.column('type', width=100)
+        self.shortcuts_tree.column('importance', width=80)
+        self.shortcuts_tree.column('description', width=200)
+
+        # Добавляем скроллбар
+        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.shortcuts_tree.yview)
+        self.shortcuts_tree.configure(yscrollcommand=scrollbar.set)
+
+        # Размещаем TreeView и скроллбар
+        self.shortcuts_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # Биндим события
+        self.shortcuts_tree.bind('<Double-1>', self.on_shortcut_double_click)
+
+        # Кнопки редактирования
+        edit_frame = ttk.Frame(parent)
+        edit_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Button(edit_frame, text="Редактировать",
+                   command=self.edit_selected_shortcut).pack(side=tk.LEFT, padx=2)
+        ttk.Button(edit_frame, text="Определить типы",
+                   command=self.classify_current_layout).pack(side=tk.LEFT, padx=2)
+        ttk.Button(edit_frame, text="Сохранить изменения",
+                   command=self.save_current_layout).pack(side=tk.RIGHT, padx=2)
+
+        # Постраничная навигация для больших layouts
+        ttk.Button(edit_frame, text="<", width=3,
+                   command=lambda: self.show_tree_page(self.tree_sync.page - 1)).pack(side=tk.LEFT, padx=(10, 2))
+        self.page_var = tk.StringVar(value="")
+        ttk.Label(edit_frame, textvariable=self.page_var).pack(side=tk.LEFT, padx=2)
+        ttk.Button(edit_frame, text=">", width=3,
+                   command=lambda: self.show_tree_page(self.tree_sync.page + 1)).pack(side=tk.LEFT, padx=2)
+
+        self.tree_sync = PagedShortcutsTree(self.shortcuts_tree)
+
+    def refresh_layouts_list(self):
+        """Обновить список layouts"""
+        self.layouts_listbox.delete(0, tk.END)
+        for layout_file in self.manager.get_saved_layouts():
+            self.layouts_listbox.insert(tk.END, layout_file)
+
+    def create_new_layout(self):
+        """Создать новое сохранение"""
+        name = simpledialog.askstring("Новое сохранение", "Введите название сохранения:")
+        if name:
+            description = simpledialog.askstring("Описание", "Введите описание (необязательно):")
+            self.start_job(self.manager.create_layout, name, description or "",
+                           on_done=self.on_layout_created, action="Сканирование")
+
+    def on_layout_created(self, layout):
+        """Сохранение нового layout после сканирования в рабочем потоке"""
+        self.current_job = None
+        if self.manager.save_layout(layout):
+            self.current_layout = layout
+            self.refresh_layouts_list()
+            self.update_shortcuts_tree()
+            self.status_var.set(f"Создано сохранение: {layout.name}")
+
+    def load_selected_layout(self):
+        """Загрузить выбранное сохранение"""
+        selection = self.layouts_listbox.curselection()
+        if selection:
+            filename = self.layouts_listbox.get(selection[0])
+            layout = self.manager.load_layout(filename)
+            if layout:
+                self.current_layout = layout
+                self.update_shortcuts_tree()
+                self.status_var.set(f"Загружено: {layout.name}")
+
+    def delete_selected_layout(self):
+        """Удалить выбранное сохранение"""
+        selection = self.layouts_listbox.curselection()
+        if selection:
+            filename = self.layouts_listbox.get(selection[0])
+            if messagebox.askyesno("Подтверждение", f"Удалить сохранение {filename}?"):
+                if self.manager.delete_layout(filename):
+                    self.refresh_layouts_list()
+                    self.status_var.set(f"Удалено: {filename}")
+
+    def restore_current_layout(self):
+        """Восстановить текущий layout на рабочий стол"""
+        if self.current_layout:
+            self.start_job(self.restore_in_worker, self.current_layout.copy(),
+                           on_done=self.on_layout_restored, action="Восстановление")
+        else:
+            messagebox.showwarning("Внимание", "Сначала загрузите сохранение!")
+
+    def preview_current_layout(self):
+        """Показать, что изменит восстановление, и восстановить по подтверждению"""
+        if self.current_layout:
+            self.start_job(self.manager.preview_restore, self.current_layout.copy(),
+                           on_done=self.on_restore_previewed, action="Сравнение")
+        else:
+            messagebox.showwarning("Внимание", "Сначала загрузите сохранение!")
+
+    def on_restore_previewed(self, entries):
+        self.current_job = None
+        # Стол уже перечислен в рабочем потоке, записи по готовому плану собираются быстро
+        entries = list(entries)
+        summary = summarize_diff(entries)
+        moved = [entry for entry in entries if entry.kind == DiffEntry.MOVED]
+        lines = [f"Будет перемещено: {summary[DiffEntry.MOVED]}",
+                 f"Нет на рабочем столе: {summary[DiffEntry.ADDED]}",
+                 f"Нет в сохранении: {summary[DiffEntry.REMOVED]}"]
+        if summary[DiffEntry.AMBIGUOUS]:
+            lines.append(f"Неоднозначные имена, не будут перемещены: {summary[DiffEntry.AMBIGUOUS]}")
+        for entry in moved[:15]:
+            lines.append(f"  {entry.name}: {entry.distance:.0f} px")
+        if len(moved) > 15:
+            lines.append(f"  ... и еще {len(moved) - 15}")
+        self.status_var.set(f"Изменится иконок: {summary[DiffEntry.MOVED]}")
+        if moved and messagebox.askyesno("Предпросмотр", "\n".join(lines) + "\n\nВосстановить?"):
+            self.restore_current_layout()
+        elif not moved:
+            messagebox.showinfo("Предпросмотр", "\n".join(lines))
+
+    def arrange_current_layout(self):
+        """Создать упорядоченную копию текущего layout по мониторам рабочего стола"""
+        if self.current_layout:
+            self.start_job(self.manager.arrange_layout, self.current_layout.copy(),
+                           on_done=self.on_layout_arranged, action="Раскладка")
+        else:
+            messagebox.showwarning("Внимание", "Сначала загрузите сохранение!")
+
+    def on_layout_arranged(self, layout):
+        """Сохранить упорядоченный layout; применяется обычным восстановлением"""
+        self.current_job = None
+        if layout and self.manager.save_layout(layout):
+            self.current_layout = layout
+            self.refresh_layouts_list()
+            self.update_shortcuts_tree()
+            self.status_var.set(f"Создано сохранение: {layout.name}. Восстановите его, чтобы применить")
+
+    def restore_in_worker(self, layout, progress=None):
+        """Восстановление в рабочем потоке; план возвращается вместе с итогом"""
+        count = self.manager.restore_layout(layout, progress=progress)
+        return count, self.manager.last_restore_plan
+
+    def on_layout_restored(self, result):
+        """Итог восстановления из рабочего потока"""
+        self.current_job = None
+        count, plan = result
+        status = f"Восстановлено {count} иконок"
+        if plan:
+            status += f" (перемещено: {plan.moves_issued}, на месте: {plan.moves_skipped}"
+            if plan.unmatched or plan.ambiguous:
+                status += f", не найдено: {len(plan.unmatched)}, неоднозначно: {len(plan.ambiguous)}"
+            if plan.failures:
+                status += f", ошибок: {plan.moves_failed}"
+            status += ")"
+        self.status_var.set(status)
+
+    def start_job(self, func, *args, on_done, action):
+        """Запустить COM-операцию в рабочем потоке с прогрессом в статусной строке
+
+        Layout передается в задачу копией (DesktopLayout.copy): пока она идет,
+        текущий layout редактируется в потоке интерфейса.
+        """
+        if self.current_job and not self.current_job.done():
+            messagebox.showwarning("Внимание", "Дождитесь завершения текущей операции")
+            return
+        self.status_var.set(f"{action}...")
+        self.current_job = self.jobs.submit(
+            func, *args,
+            on_done=on_done,
+            on_error=self.on_job_error,
+            on_progress=lambda done, total: self.status_var.set(f"{action}: {done} из {total} иконок")
+        )
+
+    def on_job_error(self, error):
+        self.current_job = None
+        if isinstance(error, JobCancelled):
+            self.status_var.set("Операция отменена")
+        else:
+            self.status_var.set("Ошибка операции")
+            messagebox.showerror("Ошибка", str(error))
+
+    def cancel_current_job(self):
+        if self.current_job and not self.current_job.done():
+            self.current_job.cancel()
+
+    def toggle_watch(self):
+        """Включить или выключить запись изменений рабочего стола в текущий layout"""
+        if not self.watch_var.get():
+            self.watcher = None
+            self.status_var.set("Наблюдение выключено")
+            return
+        if not self.current_layout:
+            self.watch_var.set(False)
+            messagebox.showwarning("Внимание", "Сначала загрузите сохранение!")
+            return
+        self.watcher = DesktopWatcher(self.manager, self.current_layout)
+        self.status_var.set(f"Наблюдение за рабочим столом: {self.current_layout.name}")
+        self.schedule_watch_poll()
+
+    def schedule_watch_poll(self):
+        if self.watcher:
+            self.root.after(int(self.watcher.interval * 1000), self.poll_watcher)
+
+    def poll_watcher(self):
+        """Опрос в рабочем потоке; пока идет другая операция, опрос откладывается"""
+        watcher = self.watcher
+        if not watcher:
+            return
+        if watcher.layout is not self.current_layout:
+            # Загружен другой layout - наблюдение за прежним прекращается
+            self.watcher = None
+            self.watch_var.set(False)
+            return
+        if self.current_job and not self.current_job.done():
+            self.schedule_watch_poll()
+            return
+        self.jobs.submit(watcher.poll,
+                         on_done=lambda items: self.on_watch_polled(watcher, items),
+                         on_error=lambda error: self.on_watch_failed(watcher, error))
+
+    def on_watch_polled(self, watcher, items):
+        """Изменения применяются к layout в главном потоке, где его показывает дерево"""
+        if watcher is not self.watcher:
+            return
+        if items is not None and watcher.layout is self.current_layout:
+            changes = watcher.apply(items)
+            if changes:
+                self.update_shortcuts_tree()
+                self.status_var.set(f"Наблюдение: записано изменений - {changes}")
+        self.schedule_watch_poll()
+
+    def on_watch_failed(self, watcher, error):
+        if watcher is self.watcher:
+            self.watcher = None
+            self.watch_var.set(False)
+            self.status_var.set(f"Наблюдение остановлено: {error}")
+
+    def search_shortcuts(self):
+        """Поиск по ярлыкам всех сохранений, например: type:игра tag:steam importance>=4"""
+        query = self.search_var.get().strip()
+        if not query:
+            return
+        self.status_var.set("Поиск...")
+        # Поиск не занимает current_job: он не трогает рабочий стол и обычно быстрый
+        self.jobs.submit(self.manager.search_shortcuts, query, self.SEARCH_LIMIT,
+                         on_done=lambda hits: self.show_search_results(query, hits),
+                         on_error=lambda error: self.status_var.set(f"Ошибка поиска: {error}"),
+                         on_progress=lambda done, total: self.status_var.set(
+                             f"Индексация: {done} из {total} сохранений"))
+
+    def show_search_results(self, query, hits):
+        """Показать найденные ярлыки; двойной клик открывает layout на этом ярлыке"""
+        if len(hits) >= self.SEARCH_LIMIT:
+            self.status_var.set(f"Найдено больше {self.SEARCH_LIMIT}, показаны первые: {query}")
+        else:
+            self.status_var.set(f"Найдено ярлыков: {len(hits)}")
+        if self.search_window is None or not self.search_window.winfo_exists():
+            self.search_window = tk.Toplevel(self.root)
+            self.search_window.geometry("700x400")
+            tree = ttk.Treeview(self.search_window, columns=('layout', 'name', 'type', 'importance', 'tags'),
+                                show='headings')
+            for column, text, width in (('layout', 'Сохранение', 150), ('name', 'Название', 180),
+                                        ('type', 'Тип', 100), ('importance', 'Важность', 70),
+                                        ('tags', 'Теги', 150)):
+                tree.heading(column, text=text)
+                tree.column(column, width=width)
+            scrollbar = ttk.Scrollbar(self.search_window, orient=tk.VERTICAL, command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            tree.bind('<Double-1>', lambda event: self.open_search_hit(tree))
+            self.search_results_tree = tree
+        self.search_window.title(f"Поиск: {query}")
+        tree = self.search_results_tree
+        tree.delete(*tree.get_children())
+        self.search_hits = {}
+        for hit in hits:
+            iid = tree.insert('', tk.END, values=(hit['file'], hit['name'], hit['icon_type'],
+                                                  hit['importance'], ", ".join(hit['tags'])))
+            self.search_hits[iid] = hit
+        self.search_window.lift()
+
+    def open_search_hit(self, tree):
+        """Загрузить layout найденного ярлыка и выделить ярлык в дереве"""
+        selection = tree.selection()
+        hit = self.search_hits.get(selection[0]) if selection else None
+        if not hit:
+            return
+        layout = self.manager.load_layout(hit['file'])
+        if not layout:
+            return
+        self.current_layout = layout
+        self.update_shortcuts_tree()
+        if hit['index'] < len(layout.shortcuts):
+            shortcut = layout.shortcuts[hit['index']]
+            if self.tree_sync.page_size:
+                self.show_tree_page(hit['index'] // self.tree_sync.page_size)
+            iid = str(shortcut.id)
+            self.shortcuts_tree.selection_set(iid)
+            self.shortcuts_tree.see(iid)
+        self.status_var.set(f"Загружено: {layout.name}")
+
+    def on_close(self):
+        self.watcher = None
+        self.cancel_current_job()
+        self.jobs.shutdown()
+        self.root.destroy()
+
+    def update_shortcuts_tree(self):
+        """Обновить дерево ярлыков"""
+        self.tree_sync.show(self.current_layout)
+        self.page_var.set(self.tree_sync.page_label())
+
+    def show_tree_page(self, page):
+        """Перейти на страницу дерева ярлыков"""
+        self.tree_sync.set_page(page)
+        self.page_var.set(self.tree_sync.page_label())
+
+    def on_shortcut_double_click(self, event):
+        """Обработчик двойного клика по ярлыку"""
+        self.edit_selected_shortcut()
+
+    def edit_selected_shortcut(self):
+        """Редактировать выбранный ярлык"""
+        selection = self.shortcuts_tree.selection()
+        if selection and self.current_layout:
+            # iid строки дерева - id ярлыка в layout
+            shortcut = self.current_layout.get_shortcut_by_id(int(selection[0]))
+            if shortcut:
+                dialog = IconEditorDialog(self.root, shortcut)
+                if dialog.result:
+                    self.tree_sync.update_row(shortcut)
+                    self.status_var.set(f"Обновлен: {shortcut.name}")
+
+    def classify_current_layout(self):
+        """Заполнить неопознанные типы ярлыков по правилам"""
+        if self.current_layout:
+            changed = self.manager.classify_layout(self.current_layout)
+            self.update_shortcuts_tree()
+            self.status_var.set(f"Определен тип для {changed} ярлыков")
+        else:
+            messagebox.showwarning("Внимание", "Нет активного сохранения!")
+
+    def save_current_layout(self):
+        """Сохранить текущий layout"""
+        if self.current_layout:
+            if self.manager.save_layout(self.current_layout):
+                self.status_var.set(f"Сохранено: {self.current_layout.name}")
+            else:
+                self.status_var.set("Ошибка сохранения")
+        else:
+            messagebox.showwarning("Внимание", "Нет активного сохранения!")
+
+    def on_layout_select(self, event):
+        """Обработчик выбора layout: показать сведения из каталога без загрузки"""
+        selection = self.layouts_listbox.curselection()
+        if not selection:
+            return
+        info = self.manager.get_layout_info(self.layouts_listbox.get(selection[0]))
+        if info:
+            status = f"{info['name']}: {info['shortcut_count']} ярлыков, изменено {info['modified'][:16]}"
+            if info['description']:
+                status += f" - {info['description']}"
+            self.status_var.set(status)
+
+
+def run():
+    """Запустить графический интерфейс"""
+    root = tk.Tk()
+    app = DesktopIconApp(root)
+    root.mainloop()
+    return app
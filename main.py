@@ -1,17 +1,36 @@
 import os
+import sys
 import json
-import tkinter as tk
-from tkinter import messagebox, ttk, simpledialog, filedialog
-from datetime import datetime
-import pythoncom
-import win32com.client as wcomcli
-from win32com.shell import shell, shellcon
+import base64
+import hashlib
+import io
+import time
+import queue
+import threading
+from array import array
+import re
+import math
+import argparse
+import functools
+import bisect
+import heapq
+import itertools
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+# tkinter и pywin32 загружаются лениво: консольные команды (list, diff)
+# не платят за их импорт, а без Windows доступен только InMemoryShellBackend
+pythoncom = wcomcli = shell = shellcon = None
 
 # Константы
 CLSID_ShellWindows = "{9BA05972-F6A8-11CF-A442-00A0C90A8F39}"
 IID_IFolderView = "{CDE725B0-CCC9-4519-917E-325D72FAB4CE}"
 SWC_DESKTOP = 0x08
 SWFO_NEEDDISPATCH = 0x01
+DEFAULT_ICON_SPACING = (100, 100)  # шаг сетки иконок, если рабочий стол его не сообщил
+
+# Версия формата файла layout: 1.1 - PIDL хранится в base64
+LAYOUT_VERSION = "1.1"
 
 # Типы иконок
 ICON_TYPES = {
@@ -27,27 +46,258 @@ ICON_TYPES = {
 
 
 
+def load_win32():
+    """Импортировать pywin32 при первой работе с настоящим рабочим столом"""
+    global pythoncom, wcomcli, shell, shellcon
+    if pythoncom is None:
+        import pythoncom as pythoncom_module
+        import win32com.client as wcomcli_module
+        from win32com.shell import shell as shell_module, shellcon as shellcon_module
+        pythoncom, wcomcli = pythoncom_module, wcomcli_module
+        shell, shellcon = shell_module, shellcon_module
+
+
+def show_error_dialog(title, message):
+    from tkinter import messagebox
+    messagebox.showerror(title, message)
+
+
+class NullPhase:
+    """Фаза выключенных метрик: вход и выход ничего не делают"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class MetricsPhase:
+    """Замер одной фазы; вложенная фаза получает путь вида restore_layout/plan"""
+
+    __slots__ = ('metrics', 'name', 'path', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        stack = self.metrics.stack()
+        stack.append(self.name)
+        self.path = "/".join(stack)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.stack().pop()
+        with self.metrics.lock:
+            timer = self.metrics.timers.setdefault(self.path, [0, 0.0])
+            timer[0] += 1
+            timer[1] += elapsed
+        return False
+
+
+class Metrics:
+    """Таймеры фаз и счетчики (обращения к COM, байты, промахи кэшей) по операциям
+
+    Выключены по умолчанию: тогда phase() возвращает общий пустой контекст,
+    а count() - одну проверку флага. Счетчик относится к внешней фазе
+    потока, в которой он увеличен.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}    # путь фазы -> [вызовы, секунды]
+            self.counters = {}  # (операция, счетчик) -> значение
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        return MetricsPhase(self, name)
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        stack = self.stack()
+        key = (stack[0] if stack else "", name)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def snapshot(self):
+        """Операции с таймерами и счетчиками в виде словаря для JSON"""
+        operations = {}
+        with self.lock:
+            for path, (calls, seconds) in sorted(self.timers.items()):
+                operations[path] = {'calls': calls, 'seconds': round(seconds, 6)}
+            for (operation, name), value in sorted(self.counters.items()):
+                entry = operations.setdefault(operation or "-", {})
+                entry.setdefault('counters', {})[name] = value
+        return operations
+
+
+metrics = Metrics()
+
+
+def measured(name):
+    """Декоратор: вызов функции - фаза name, когда метрики включены"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            with MetricsPhase(metrics, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def encode_pidl(pidl):
+    """PIDL (bytes) -> компактная строка base64 для JSON"""
+    if pidl is None:
+        return None
+    return base64.b64encode(pidl).decode('ascii')
+
+
+def decode_pidl(value):
+    """Строка из JSON -> PIDL (bytes); понимает и старый формат str(bytes)"""
+    if value is None or isinstance(value, bytes):
+        return value
+    if value.startswith(("b'", 'b"')):
+        import ast
+        return ast.literal_eval(value)
+    return base64.b64decode(value)
+
+
+def version_outdated(version):
+    """Версия формата файла старше LAYOUT_VERSION - файл нужно переписать целиком"""
+    try:
+        return tuple(map(int, version.split('.'))) < tuple(map(int, LAYOUT_VERSION.split('.')))
+    except (AttributeError, ValueError):
+        return True
+
+
+# Отметки времени хранятся как целые микросекунды от эпохи (локальное время без зоны)
+EPOCH = datetime(1970, 1, 1)
+
+
+def now_timestamp():
+    return (datetime.now() - EPOCH) // timedelta(microseconds=1)
+
+
+def timestamp_from_iso(value):
+    """ISO-строка -> целые микросекунды
+
+    Время с зоной (+03:00, Z) переводится в локальное. Нераспознанное
+    значение возвращается как есть и так же записывается обратно.
+    """
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def timestamp_to_iso(value):
+    if not isinstance(value, int):
+        return value
+    return (EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+def intern_tags(tags):
+    """Теги хранятся кортежем интернированных строк; пустой кортеж общий для всех"""
+    if not tags:
+        return ()
+    return tuple(sys.intern(tag) for tag in tags)
+
+
 class Shortcut:
+    # Без __dict__: около 17% памяти ярлыка вместе с его строками и PIDL (666 байт вместо 801)
+    __slots__ = ('name', '_position', 'pidl', '_icon_type', '_tags', 'description',
+                 'custom_color', 'importance', '_created', '_modified', 'layout', 'id')
+
     def __init__(self, name, position, pidl, icon_type="неопознано", tags=None,
                  description="", custom_color=None, importance=1):
         self.name = name
         self.position = position
         self.pidl = pidl
         self.icon_type = icon_type
-        self.tags = tags or []
+        self.tags = tags
         self.description = description
         self.custom_color = custom_color
         self.importance = importance  # 1-5, где 5 - максимальная важность
-        self.created = datetime.now().isoformat()
-        self.modified = self.created
+        self._created = now_timestamp()
+        self._modified = self._created
+        self.layout = None  # DesktopLayout, которому принадлежит ярлык
+        self.id = None      # стабильный в пределах layout идентификатор, назначается при добавлении
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, value):
+        self._position = (value[0], value[1])
+
+    @property
+    def icon_type(self):
+        return self._icon_type
+
+    @icon_type.setter
+    def icon_type(self, value):
+        self._icon_type = sys.intern(value) if isinstance(value, str) else value
+
+    @property
+    def tags(self):
+        return self._tags
+
+    @tags.setter
+    def tags(self, value):
+        self._tags = intern_tags(value)
+
+    @property
+    def created(self):
+        return timestamp_to_iso(self._created)
+
+    @created.setter
+    def created(self, value):
+        self._created = timestamp_from_iso(value)
+
+    @property
+    def modified(self):
+        return timestamp_to_iso(self._modified)
+
+    @modified.setter
+    def modified(self, value):
+        self._modified = timestamp_from_iso(value)
 
     def to_dict(self):
         return {
             'name': self.name,
-            'position': self.position,
-            'pidl': self.pidl,
-            'icon_type': self.icon_type,
-            'tags': self.tags,
+            'position': self._position,
+            'pidl': encode_pidl(self.pidl),
+            'icon_type': self._icon_type,
+            'tags': list(self._tags),
             'description': self.description,
             'custom_color': self.custom_color,
             'importance': self.importance,
@@ -60,22 +310,39 @@ class Shortcut:
         shortcut = cls(
             data['name'],
             data['position'],
-            data['pidl'],
+            decode_pidl(data['pidl']),
             data.get('icon_type', 'неопознано'),
             data.get('tags', []),
             data.get('description', ''),
             data.get('custom_color'),
             data.get('importance', 1)
         )
-        shortcut.created = data.get('created', datetime.now().isoformat())
-        shortcut.modified = data.get('modified', shortcut.created)
+        created = data.get('created')
+        if created is not None:
+            shortcut.created = created
+        modified = data.get('modified')
+        shortcut._modified = shortcut._created if modified is None else timestamp_from_iso(modified)
         return shortcut
 
+    def copy(self, position=None):
+        """Копия ярлыка вне layout, при необходимости с другой позицией"""
+        other = Shortcut(self.name, self._position if position is None else position, self.pidl,
+                         self._icon_type, self._tags, self.description, self.custom_color, self.importance)
+        other._created = self._created
+        other._modified = self._modified
+        return other
+
     def update(self, **kwargs):
+        if self.layout is not None and 'pidl' in kwargs:
+            self.layout.unindex_pidl(self)
+        changed = []
         for key, value in kwargs.items():
             if hasattr(self, key):
                 setattr(self, key, value)
-        self.modified = datetime.now().isoformat()
+                changed.append(key)
+        self._modified = now_timestamp()
+        if self.layout is not None:
+            self.layout.shortcut_changed(self, changed)
 
 
 class DesktopLayout:
@@ -84,22 +351,268 @@ class DesktopLayout:
         self.description = description
         self.created = datetime.now().isoformat()
         self.modified = self.created
-        self.shortcuts = []
-        self.version = "1.0"
+        self.version = LAYOUT_VERSION
+        # Индексы: id -> ярлык (в порядке добавления) и PIDL -> ярлык;
+        # список ярлыков - только если PIDL у нескольких, что бывает редко
+        self.by_id = {}
+        self.by_pidl = {}
+        self.next_id = 1
+        self._shortcuts_list = []  # кэш списка для свойства shortcuts; None - устарел
+        # Состояние для инкрементального сохранения
+        self.source_path = None        # файл, с которым синхронизирован layout
+        self.structure_changed = True  # добавление/удаление требует полной перезаписи
+        self.dirty_shortcuts = {}      # id ярлыка -> (shortcut, измененные поля)
+
+    @property
+    def shortcuts(self):
+        if self._shortcuts_list is None:
+            self._shortcuts_list = list(self.by_id.values())
+        return self._shortcuts_list
 
     def add_shortcut(self, shortcut):
-        self.shortcuts.append(shortcut)
+        if shortcut.layout is not None and shortcut.layout is not self:
+            shortcut.layout.remove_shortcut_by_id(shortcut.id)
+        shortcut.layout = self
+        shortcut.id = self.next_id
+        self.next_id += 1
+        self.by_id[shortcut.id] = shortcut
+        self.index_pidl(shortcut)
+        if self._shortcuts_list is not None:
+            self._shortcuts_list.append(shortcut)
+        self.modified = datetime.now().isoformat()
+        self.structure_changed = True
+
+    def index_pidl(self, shortcut):
+        same_pidl = self.by_pidl.get(shortcut.pidl)
+        if same_pidl is None:
+            self.by_pidl[shortcut.pidl] = shortcut
+        elif isinstance(same_pidl, list):
+            same_pidl.append(shortcut)
+        else:
+            self.by_pidl[shortcut.pidl] = [same_pidl, shortcut]
+
+    def unindex_pidl(self, shortcut):
+        same_pidl = self.by_pidl.get(shortcut.pidl)
+        if same_pidl is shortcut:
+            del self.by_pidl[shortcut.pidl]
+        elif isinstance(same_pidl, list):
+            same_pidl.remove(shortcut)
+            if len(same_pidl) == 1:
+                self.by_pidl[shortcut.pidl] = same_pidl[0]
+
+    def shortcuts_with_pidl(self, pidl):
+        """Все ярлыки с этим PIDL в порядке добавления"""
+        same_pidl = self.by_pidl.get(pidl)
+        if same_pidl is None:
+            return []
+        return list(same_pidl) if isinstance(same_pidl, list) else [same_pidl]
+
+    def remove_shortcut_by_id(self, shortcut_id):
+        shortcut = self.by_id.pop(shortcut_id, None)
+        if shortcut is None:
+            return None
+        self.unindex_pidl(shortcut)
+        self.dirty_shortcuts.pop(shortcut_id, None)
+        shortcut.layout = None
+        self._shortcuts_list = None
         self.modified = datetime.now().isoformat()
+        self.structure_changed = True
+        return shortcut
 
     def remove_shortcut(self, pidl):
-        self.shortcuts = [s for s in self.shortcuts if s.pidl != pidl]
-        self.modified = datetime.now().isoformat()
+        for shortcut in self.shortcuts_with_pidl(pidl):
+            self.remove_shortcut_by_id(shortcut.id)
+
+    def shortcut_changed(self, shortcut, fields):
+        """Запомнить изменение ярлыка для записи в журнал"""
+        if 'pidl' in fields:
+            self.index_pidl(shortcut)
+        _, dirty_fields = self.dirty_shortcuts.setdefault(shortcut.id, (shortcut, set()))
+        dirty_fields.update(fields)
+        self.modified = shortcut.modified
+
+    def pop_journal_entries(self):
+        """Забрать накопленные изменения в виде записей журнала"""
+        if not self.dirty_shortcuts:
+            return []
+        positions = {shortcut_id: i for i, shortcut_id in enumerate(self.by_id)}
+        entries = []
+        for shortcut_id, (shortcut, fields) in self.dirty_shortcuts.items():
+            if shortcut_id not in positions:
+                continue
+            data = shortcut.to_dict()
+            entries.append({
+                'i': positions[shortcut_id],
+                'pidl': data['pidl'],
+                'set': {field: data[field] for field in sorted(fields) if field in data},
+                'modified': shortcut.modified
+            })
+        self.dirty_shortcuts = {}
+        return entries
+
+    def mark_saved(self, filepath, version=LAYOUT_VERSION):
+        """Отметить layout как записанный в filepath в формате version
+
+        Файл старого формата не дополняется журналом: первое сохранение
+        перепишет его целиком в текущем формате.
+        """
+        self.source_path = filepath
+        self.version = version
+        self.structure_changed = version_outdated(version)
+        self.dirty_shortcuts = {}
 
     def get_shortcut(self, pidl):
+        same_pidl = self.by_pidl.get(pidl)
+        return same_pidl[0] if isinstance(same_pidl, list) else same_pidl
+
+    def copy(self):
+        """Независимая копия с теми же id ярлыков - для задачи в другом потоке"""
+        layout = DesktopLayout(self.name, self.description)
+        layout.created = self.created
+        layout.version = self.version
         for shortcut in self.shortcuts:
-            if shortcut.pidl == pidl:
-                return shortcut
-        return None
+            other = shortcut.copy()
+            other.layout = layout
+            other.id = shortcut.id
+            layout.by_id[other.id] = other
+            layout.index_pidl(other)
+        layout.next_id = self.next_id
+        layout._shortcuts_list = None
+        layout.modified = self.modified
+        return layout
+
+    def get_shortcut_by_id(self, shortcut_id):
+        return self.by_id.get(shortcut_id)
+
+    def to_header(self):
+        """Поля layout без ярлыков, в порядке файла"""
+        return {
+            'name': self.name,
+            'description': self.description,
+            'created': self.created,
+            'modified': self.modified,
+            'version': LAYOUT_VERSION
+        }
+
+    def to_dict(self):
+        data = self.to_header()
+        data['shortcuts'] = [s.to_dict() for s in self.shortcuts]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls.from_records(data, data.get('shortcuts', []))
+
+    @classmethod
+    def from_records(cls, header, records):
+        """Layout из полей заголовка и словарей ярлыков; records может быть генератором"""
+        layout = cls(header['name'], header.get('description', ''))
+        layout.created = header.get('created', datetime.now().isoformat())
+        layout.version = header.get('version', '1.0')
+
+        for shortcut_data in records:
+            layout.add_shortcut(Shortcut.from_dict(shortcut_data))
+
+        # add_shortcut отмечает время изменения, поэтому modified из файла - после ярлыков
+        layout.modified = header.get('modified', layout.created)
+        return layout
+
+
+class ColumnarDesktopLayout:
+    """Колоночное хранение layout для архивов и очень больших снимков
+
+    Позиции, важность и отметки времени лежат в массивах array, строки
+    интернируются. Формат to_dict/from_dict тот же, что у DesktopLayout;
+    для редактирования layout переводится в обычный через to_layout().
+    """
+
+    def __init__(self, name, description=""):
+        self.name = name
+        self.description = description
+        self.created = datetime.now().isoformat()
+        self.modified = self.created
+        self.version = LAYOUT_VERSION
+        self.names = []
+        self.pidls = []
+        self.xs = array('i')
+        self.ys = array('i')
+        self.importance = array('h')
+        self.icon_types = []
+        self.tags = []
+        self.descriptions = []
+        self.custom_colors = []
+        self.created_at = array('q')
+        self.modified_at = array('q')
+        self.raw_times = {}  # (строка, поле) -> отметка времени, не распознанная как ISO
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        for i in range(len(self.names)):
+            yield self.shortcut_at(i)
+
+    @property
+    def shortcuts(self):
+        """Материализованный список Shortcut; правки в нем не попадают в колонки"""
+        return list(self)
+
+    def append_row(self, name, position, pidl, icon_type, tags, description,
+                   custom_color, importance, created, modified):
+        self.names.append(name)
+        self.pidls.append(pidl)
+        self.xs.append(position[0])
+        self.ys.append(position[1])
+        self.importance.append(importance)
+        self.icon_types.append(sys.intern(icon_type))
+        self.tags.append(intern_tags(tags))
+        self.descriptions.append(description)
+        self.custom_colors.append(custom_color)
+        self.append_time(self.created_at, 'created', created)
+        self.append_time(self.modified_at, 'modified', modified)
+
+    def append_time(self, column, field, value):
+        if not isinstance(value, int):
+            self.raw_times[(len(column), field)] = value
+            value = 0
+        column.append(value)
+
+    def time_at(self, column, field, i):
+        return self.raw_times.get((i, field), column[i])
+
+    def add_shortcut(self, shortcut):
+        self.append_row(shortcut.name, shortcut.position, shortcut.pidl, shortcut.icon_type,
+                        shortcut.tags, shortcut.description, shortcut.custom_color,
+                        shortcut.importance, shortcut._created, shortcut._modified)
+        self.modified = datetime.now().isoformat()
+
+    def shortcut_at(self, i):
+        shortcut = Shortcut(self.names[i], (self.xs[i], self.ys[i]), self.pidls[i],
+                            self.icon_types[i], self.tags[i], self.descriptions[i],
+                            self.custom_colors[i], self.importance[i])
+        shortcut._created = self.time_at(self.created_at, 'created', i)
+        shortcut._modified = self.time_at(self.modified_at, 'modified', i)
+        return shortcut
+
+    def get_shortcut(self, pidl):
+        try:
+            return self.shortcut_at(self.pidls.index(pidl))
+        except ValueError:
+            return None
+
+    def row_dict(self, i):
+        return {
+            'name': self.names[i],
+            'position': (self.xs[i], self.ys[i]),
+            'pidl': encode_pidl(self.pidls[i]),
+            'icon_type': self.icon_types[i],
+            'tags': list(self.tags[i]),
+            'description': self.descriptions[i],
+            'custom_color': self.custom_colors[i],
+            'importance': self.importance[i],
+            'created': timestamp_to_iso(self.time_at(self.created_at, 'created', i)),
+            'modified': timestamp_to_iso(self.time_at(self.modified_at, 'modified', i))
+        }
 
     def to_dict(self):
         return {
@@ -107,149 +620,2203 @@ class DesktopLayout:
             'description': self.description,
             'created': self.created,
             'modified': self.modified,
-            'version': self.version,
-            'shortcuts': [s.to_dict() for s in self.shortcuts]
+            'version': LAYOUT_VERSION,
+            'shortcuts': [self.row_dict(i) for i in range(len(self.names))]
         }
 
     @classmethod
     def from_dict(cls, data):
         layout = cls(data['name'], data.get('description', ''))
-        layout.created = data.get('created', datetime.now().isoformat())
+        layout.created = data.get('created', layout.created)
         layout.modified = data.get('modified', layout.created)
         layout.version = data.get('version', '1.0')
 
-        for shortcut_data in data.get('shortcuts', []):
-            layout.add_shortcut(Shortcut.from_dict(shortcut_data))
+        for row in data.get('shortcuts', []):
+            created = row.get('created')
+            created = now_timestamp() if created is None else timestamp_from_iso(created)
+            modified = row.get('modified')
+            layout.append_row(row['name'], row['position'], decode_pidl(row['pidl']),
+                              row.get('icon_type', 'неопознано'), row.get('tags', []),
+                              row.get('description', ''), row.get('custom_color'),
+                              row.get('importance', 1), created,
+                              created if modified is None else timestamp_from_iso(modified))
+        return layout
+
+    @classmethod
+    def from_layout(cls, source):
+        layout = cls(source.name, source.description)
+        layout.created = source.created
+        for shortcut in source.shortcuts:
+            layout.add_shortcut(shortcut)
+        layout.modified = source.modified
+        return layout
 
+    def to_layout(self):
+        """Обычный DesktopLayout для редактирования"""
+        layout = DesktopLayout(self.name, self.description)
+        layout.created = self.created
+        for shortcut in self:
+            layout.add_shortcut(shortcut)
+        layout.modified = self.modified
         return layout
 
 
-class DesktopIconManager:
+def pidl_key(pidl):
+    """Привести PIDL (bytes или список SHITEMID) к bytes для сравнения"""
+    if isinstance(pidl, bytes):
+        return pidl
+    if isinstance(pidl, (list, tuple)):
+        return b"".join(bytes(part) for part in pidl)
+    return bytes(pidl)
+
+
+def items_fingerprint(items):
+    """Отпечаток пар (pidl, позиция), не зависящий от их порядка"""
+    return sum(hash((pidl_key(pidl), position[0], position[1])) for pidl, position in items) & 0xFFFFFFFFFFFFFFFF
+
+
+class ShellBackend:
+    """Интерфейс доступа к рабочему столу для DesktopIconManager"""
+
+    def get_view_items(self, progress=None):
+        """Элементы IFolderView в порядке индексов: список (pidl, (x, y))
+
+        progress(done, total) вызывается после каждого элемента.
+        """
+        raise NotImplementedError
+
+    def get_item_count(self):
+        """Число элементов рабочего стола - самая дешевая проверка изменений"""
+        return len(self.get_view_items())
+
+    def get_fingerprint(self):
+        """Отпечаток PIDL и позиций без запроса имен"""
+        return items_fingerprint(self.get_view_items())
+
+    def get_names(self):
+        """Один снимок пространства имен рабочего стола: {pidl_key: имя}"""
+        raise NotImplementedError
+
+    def get_display_name(self, pidl):
+        """Имя одного элемента, если его нет в снимке"""
+        return None
+
+    def position_item(self, index, position):
+        """Переместить элемент с индексом index в position"""
+        raise NotImplementedError
+
+    def get_regions(self):
+        """Рабочие области мониторов в координатах иконок: [(x, y, ширина, высота)] или None"""
+        return None
+
+    def get_spacing(self):
+        """Шаг сетки иконок (ширина, высота)"""
+        return DEFAULT_ICON_SPACING
+
+
+class ComShellBackend(ShellBackend):
+    """Рабочий стол Windows через IFolderView и IShellFolder"""
+
     def __init__(self):
-        self.layouts_dir = "desktop_layouts"
-        self.current_layout = None
         self.shell_windows = None
         self.folder_view = None
-        self.initialize_com()
+        self.desktop_folder = None
+        self.initialize()
+
+    def initialize(self):
+        """Инициализация COM объектов
+
+        Апартамент COM потока уже открыт: рабочий поток - JobRunner.init_thread,
+        главный поток CLI - импортом pythoncom.
+        """
+        load_win32()
+        self.shell_windows = wcomcli.Dispatch(CLSID_ShellWindows)
+        hwnd = 0
+        dispatch = self.shell_windows.FindWindowSW(
+            wcomcli.VARIANT(pythoncom.VT_I4, shellcon.CSIDL_DESKTOP),
+            wcomcli.VARIANT(pythoncom.VT_EMPTY, None),
+            SWC_DESKTOP, hwnd, SWFO_NEEDDISPATCH,
+        )
+        service_provider = dispatch._oleobj_.QueryInterface(pythoncom.IID_IServiceProvider)
+        browser = service_provider.QueryService(shell.SID_STopLevelBrowser, shell.IID_IShellBrowser)
+        shell_view = browser.QueryActiveShellView()
+        self.folder_view = shell_view.QueryInterface(IID_IFolderView)
+        self.desktop_folder = shell.SHGetDesktopFolder()
+
+    def get_view_items(self, progress=None):
+        items = []
+        items_len = self.folder_view.ItemCount(shellcon.SVGIO_ALLVIEW)
+        for i in range(items_len):
+            pidl = self.folder_view.Item(i)
+            position = self.folder_view.GetItemPosition(pidl)
+            items.append((pidl, (position[0], position[1])))
+            if progress:
+                progress(i + 1, items_len)
+        metrics.count('com_calls', 1 + 2 * items_len)  # ItemCount, Item и GetItemPosition
+        return items
+
+    def get_item_count(self):
+        metrics.count('com_calls')
+        return self.folder_view.ItemCount(shellcon.SVGIO_ALLVIEW)
+
+    def get_names(self):
+        names = {}
+        flags = shellcon.SHCONTF_FOLDERS | shellcon.SHCONTF_NONFOLDERS | shellcon.SHCONTF_INCLUDEHIDDEN
+        for pidl in self.desktop_folder.EnumObjects(0, flags):
+            names[pidl_key(pidl)] = self.desktop_folder.GetDisplayNameOf(pidl, shellcon.SHGDN_NORMAL)
+        metrics.count('com_calls', 1 + len(names))  # EnumObjects и GetDisplayNameOf
+        return names
+
+    def get_display_name(self, pidl):
+        metrics.count('com_calls')
+        return self.desktop_folder.GetDisplayNameOf(pidl, shellcon.SHGDN_NORMAL)
+
+    def position_item(self, index, position):
+        metrics.count('com_calls')
+        self.folder_view.SelectAndPositionItem(index, position, shellcon.SVSI_POSITIONITEM)
+
+    def get_regions(self):
+        import win32api
+        monitors = [win32api.GetMonitorInfo(handle)['Work'] for handle, _, _ in win32api.EnumDisplayMonitors()]
+        if not monitors:
+            return None
+        # Координаты иконок отсчитываются от левого верхнего угла виртуального экрана
+        origin_x = min(monitor[0] for monitor in monitors)
+        origin_y = min(monitor[1] for monitor in monitors)
+        return [(left - origin_x, top - origin_y, right - left, bottom - top)
+                for left, top, right, bottom in sorted(monitors)]
+
+    def get_spacing(self):
+        metrics.count('com_calls')
+        try:
+            spacing = self.folder_view.GetSpacing(None)
+            return (spacing[0], spacing[1])
+        except Exception:
+            return DEFAULT_ICON_SPACING
+
+
+class InMemoryShellBackend(ShellBackend):
+    """Фейковый рабочий стол в памяти для бенчмарков без Windows
+
+    Счетчик com_calls ведется так же, как у ComShellBackend, чтобы
+    регрессии в числе обращений были видны и без Windows.
+    """
+
+    def __init__(self, items=None, regions=None, spacing=DEFAULT_ICON_SPACING):
+        # Каждый элемент: {'name': ..., 'position': (x, y), 'pidl': bytes}
+        self.items = [dict(item) for item in (items or [])]
+        self.regions = regions  # мониторы [(x, y, ширина, высота)]; None - неизвестны
+        self.spacing = spacing
+
+    @classmethod
+    def generate(cls, count, columns=20, spacing=100, name_collisions=0.0, pidl_size=None, seed=0):
+        """Синтетический рабочий стол из count иконок, разложенных по сетке
+
+        name_collisions - доля иконок с именем, которое уже есть у другой иконки;
+        pidl_size - размер PIDL в байтах. Одинаковые параметры дают одинаковый стол.
+        """
+        import random
+        rng = random.Random(seed)
+        items = []
+        for i in range(count):
+            name = f"Icon {i}"
+            if i and name_collisions and rng.random() < name_collisions:
+                name = items[rng.randrange(i)]['name']
+            items.append({
+                'name': name,
+                'position': ((i // columns) * spacing, (i % columns) * spacing),
+                'pidl': cls.make_pidl(i, pidl_size)
+            })
+        return cls(items)
+
+    @staticmethod
+    def make_pidl(i, size=None):
+        """Файловый PIDL: тип 0x32, размер, дата, атрибуты, короткое имя
+
+        Если задан size, PIDL дополняется нулями до него, как блоками расширений.
+        """
+        pidl = b"\x32\x00" + i.to_bytes(4, "little") + bytes(6) + f"ICON{i}.LNK".encode("ascii") + b"\x00"
+        return pidl + bytes(max(0, (size or 0) - len(pidl)))
+
+    def get_view_items(self, progress=None):
+        metrics.count('com_calls', 1 + 2 * len(self.items))
+        if not progress:
+            return [(item['pidl'], tuple(item['position'])) for item in self.items]
+        items = []
+        for i, item in enumerate(self.items):
+            items.append((item['pidl'], tuple(item['position'])))
+            progress(i + 1, len(self.items))
+        return items
+
+    def get_item_count(self):
+        metrics.count('com_calls')
+        return len(self.items)
+
+    def get_fingerprint(self):
+        metrics.count('com_calls', 1 + 2 * len(self.items))
+        return items_fingerprint((item['pidl'], item['position']) for item in self.items)
+
+    def get_names(self):
+        metrics.count('com_calls', 1 + len(self.items))
+        return {pidl_key(item['pidl']): item['name'] for item in self.items}
+
+    def position_item(self, index, position):
+        metrics.count('com_calls')
+        self.items[index]['position'] = (position[0], position[1])
+
+    def get_regions(self):
+        return self.regions
+
+    def get_spacing(self):
+        return self.spacing
+
+
+class SimulatedShellBackend(InMemoryShellBackend):
+    """Фейковый рабочий стол, который меняется по команде, со счетчиками обращений
+
+    Нужен, чтобы измерять стоимость опроса DesktopWatcher без Windows.
+    """
+
+    def __init__(self, items=None, regions=None, spacing=DEFAULT_ICON_SPACING, seed=0):
+        import random
+        super().__init__(items, regions, spacing)
+        self.random = random.Random(seed)
+        self.next_index = len(self.items)
+        self.calls = {'count': 0, 'fingerprint': 0, 'view_items': 0, 'names': 0}
+
+    def move_random(self, count=1):
+        """Сдвинуть count случайных иконок на одну клетку"""
+        for item in self.random.sample(self.items, min(count, len(self.items))):
+            x, y = item['position']
+            item['position'] = (x + self.spacing[0], y)
+
+    def add_item(self, name=None):
+        i = self.next_index
+        self.next_index += 1
+        self.items.append({
+            'name': name or f"Icon {i}",
+            'position': (0, 0),
+            'pidl': self.make_pidl(i)
+        })
+
+    def remove_random(self, count=1):
+        for item in self.random.sample(self.items, min(count, len(self.items))):
+            self.items.remove(item)
+
+    def get_item_count(self):
+        self.calls['count'] += 1
+        return super().get_item_count()
+
+    def get_fingerprint(self):
+        self.calls['fingerprint'] += 1
+        return super().get_fingerprint()
+
+    def get_view_items(self, progress=None):
+        self.calls['view_items'] += 1
+        return super().get_view_items(progress)
+
+    def get_names(self):
+        self.calls['names'] += 1
+        return super().get_names()
+
+
+class RestorePlan:
+    """План восстановления: сопоставление сохраненных ярлыков с иконками на столе"""
+
+    def __init__(self, tolerance=None):
+        self.tolerance = tolerance  # None - перемещать все найденные иконки
+        self.moves = []       # (shortcut, current_item), которые нужно переместить
+        self.in_place = []    # (shortcut, current_item), которые уже на своем месте
+        self.unmatched = []   # ярлыки, которых нет на рабочем столе
+        self.ambiguous = []   # ярлыки, имя которых совпадает с несколькими иконками
+        self.moves_issued = 0
+        self.failures = []    # (shortcut, текст ошибки) перемещений, которые не удались
+
+    @property
+    def matched(self):
+        return [shortcut for shortcut, _ in self.moves + self.in_place]
+
+    @property
+    def moves_skipped(self):
+        return len(self.in_place)
+
+    @property
+    def moves_failed(self):
+        return len(self.failures)
+
+    def stats(self):
+        """Статистика восстановления"""
+        return {
+            'matched': len(self.moves) + len(self.in_place),
+            'unmatched': len(self.unmatched),
+            'ambiguous': len(self.ambiguous),
+            'moves_issued': self.moves_issued,
+            'moves_skipped': self.moves_skipped,
+            'moves_failed': self.moves_failed
+        }
+
+    def add_match(self, shortcut, item):
+        """Добавить сопоставление, пропуская иконки в пределах допуска"""
+        if self.tolerance is not None:
+            live_x, live_y = item['position']
+            saved_x, saved_y = shortcut.position
+            if abs(live_x - saved_x) <= self.tolerance and abs(live_y - saved_y) <= self.tolerance:
+                self.in_place.append((shortcut, item))
+                return
+        self.moves.append((shortcut, item))
+
+    @classmethod
+    def build(cls, layout, current_items, tolerance=None):
+        """Сопоставить за линейное время: сначала по PIDL, затем по уникальному имени"""
+        plan = cls(tolerance)
+        by_pidl = {}
+        for item in current_items:
+            by_pidl.setdefault(item['pidl'], item)
+
+        used = set()
+        pending = []
+        for shortcut in layout.shortcuts:
+            item = by_pidl.get(shortcut.pidl)
+            if item is not None and item['index'] not in used:
+                used.add(item['index'])
+                plan.add_match(shortcut, item)
+            else:
+                pending.append(shortcut)
+
+        if not pending:
+            return plan
+
+        by_name = {}
+        for item in current_items:
+            if item['index'] not in used:
+                by_name.setdefault(item['name'], []).append(item)
+
+        for shortcut in pending:
+            candidates = by_name.get(shortcut.name)
+            if not candidates:
+                plan.unmatched.append(shortcut)
+            elif len(candidates) > 1:
+                plan.ambiguous.append(shortcut)
+            else:
+                plan.add_match(shortcut, candidates.pop())
+
+        return plan
+
+    def diff_entries(self, current_items):
+        """Что сделает восстановление по плану, в виде DiffEntry для предпросмотра
+
+        Иконки стола с именем неоднозначного ярлыка не считаются лишними:
+        они есть в layout, но восстановление их не тронет.
+        """
+        for shortcut, item in self.moves:
+            live = Shortcut(item['name'], item['position'], item['pidl'])
+            distance = math.hypot(shortcut.position[0] - live.position[0], shortcut.position[1] - live.position[1])
+            yield DiffEntry(DiffEntry.MOVED, live, shortcut, distance)
+        for shortcut in self.unmatched:
+            yield DiffEntry(DiffEntry.ADDED, new=shortcut)
+        for shortcut in self.ambiguous:
+            yield DiffEntry(DiffEntry.AMBIGUOUS, new=shortcut)
+        matched = {item['index'] for _, item in self.moves + self.in_place}
+        ambiguous_names = {shortcut.name for shortcut in self.ambiguous}
+        for item in current_items:
+            if item['index'] not in matched and item['name'] not in ambiguous_names:
+                yield DiffEntry(DiffEntry.REMOVED, old=Shortcut(item['name'], item['position'], item['pidl']))
+
+
+# Поля ярлыка, изменения которых диф считает изменением метаданных
+METADATA_FIELDS = ('name', 'icon_type', 'tags', 'description', 'custom_color', 'importance')
+
+
+class DiffEntry:
+    """Одно различие между двумя наборами ярлыков"""
+
+    ADDED = "added"
+    REMOVED = "removed"
+    MOVED = "moved"
+    CHANGED = "changed"
+    AMBIGUOUS = "ambiguous"  # имя ярлыка у нескольких иконок стола - восстановление его пропустит
+
+    __slots__ = ('kind', 'old', 'new', 'distance', 'fields')
+
+    def __init__(self, kind, old=None, new=None, distance=0.0, fields=()):
+        self.kind = kind
+        self.old = old
+        self.new = new
+        self.distance = distance
+        self.fields = fields  # изменившиеся поля метаданных
+
+    @property
+    def name(self):
+        return (self.new or self.old).name
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'from': list(self.old.position) if self.old else None,
+            'to': list(self.new.position) if self.new else None,
+            'distance': round(self.distance, 1),
+            'fields': list(self.fields)
+        }
+
+
+def compare_shortcuts(old, new, tolerance=0, fields=METADATA_FIELDS):
+    """DiffEntry для сопоставленной пары или None, если ничего не изменилось"""
+    dx = new.position[0] - old.position[0]
+    dy = new.position[1] - old.position[1]
+    changed = tuple(field for field in fields if getattr(old, field) != getattr(new, field))
+    if abs(dx) > tolerance or abs(dy) > tolerance:
+        return DiffEntry(DiffEntry.MOVED, old, new, math.hypot(dx, dy), changed)
+    if changed:
+        return DiffEntry(DiffEntry.CHANGED, old, new, 0.0, changed)
+    return None
+
+
+def diff_shortcuts(old_shortcuts, new_shortcuts, tolerance=0, fields=METADATA_FIELDS):
+    """Потоковый диф за линейное время: сопоставление по PIDL, затем по имени
+
+    Индексируется только старая сторона; new_shortcuts может быть генератором,
+    тогда в памяти держатся лишь ярлыки, не найденные по PIDL.
+    """
+    old_list = list(old_shortcuts)
+    by_pidl = {}
+    by_name = {}
+    for shortcut in old_list:
+        by_pidl.setdefault(shortcut.pidl, shortcut)
+        by_name.setdefault(shortcut.name, deque()).append(shortcut)
+
+    matched = set()
+    pending = []
+    for new in new_shortcuts:
+        old = by_pidl.get(new.pidl)
+        if old is None or id(old) in matched:
+            pending.append(new)
+            continue
+        matched.add(id(old))
+        entry = compare_shortcuts(old, new, tolerance, fields)
+        if entry:
+            yield entry
+
+    for new in pending:
+        candidates = by_name.get(new.name)
+        old = None
+        while candidates:
+            candidate = candidates.popleft()
+            if id(candidate) not in matched:
+                old = candidate
+                break
+        if old is None:
+            yield DiffEntry(DiffEntry.ADDED, new=new)
+            continue
+        matched.add(id(old))
+        entry = compare_shortcuts(old, new, tolerance, fields)
+        if entry:
+            yield entry
+
+    for old in old_list:
+        if id(old) not in matched:
+            yield DiffEntry(DiffEntry.REMOVED, old=old)
+
+
+def summarize_diff(entries):
+    """Сводка по дифу: количество записей каждого вида"""
+    summary = {DiffEntry.ADDED: 0, DiffEntry.REMOVED: 0, DiffEntry.MOVED: 0, DiffEntry.CHANGED: 0,
+               DiffEntry.AMBIGUOUS: 0}
+    for entry in entries:
+        summary[entry.kind] += 1
+        if entry.kind == DiffEntry.MOVED and entry.fields:
+            summary[DiffEntry.CHANGED] += 1
+    return summary
+
+
+# Правила классификации по порядку приоритета. Строка для сопоставления:
+# "цель ярлыка \t имя \t короткое имя из PIDL \t вид"; побеждает самое левое
+# совпадение, так что цель .lnk важнее имени, а имя важнее расширения.
+# Каждое правило должно начинаться на границе слова или с "\." расширения
+UNKNOWN_ICON_TYPE = "неопознано"
+CLASSIFIER_RULES = [
+    ("система", r"\\windows\\system32\\|<virtual>"),
+    ("система", r"\b(?:этот компьютер|корзина|панель управления|this pc|recycle bin|control panel|"
+                r"библиотеки|kaspersky|касперск|eset|avast|ccleaner|ultraiso|диспетчер)\b"),
+    ("игра", r"steamapps|\\games?\\|\b(?:steam|epic games|riot|valorant|battle\.net|blizzard|ubisoft|"
+             r"gog galaxy|ea app|origin|rockstar|tlauncher|minecraft|counter-strike|dota|genshin|"
+             r"thunderstore|roblox|games?|игр[аы])\b"),
+    ("интернет", r"\b(?:chrome|firefox|opera|microsoft edge|yandex|яндекс|tor browser|brave|vivaldi|"
+                 r"браузер|telegram|discord|whatsapp|skype|zoom|utorrent|qbittorrent|torrent|vpn)\b"),
+    ("работа", r"\b(?:word|excel|powerpoint|outlook|onenote|microsoft office|teams|slack|visual studio|"
+               r"pycharm|intellij|idea(?:ic|iu|64)?|jetbrains|git bash|github|figma|notepad\+\+|sublime|"
+               r"1[cс]|enterprise architect|ssms|sql server|postman|docker)\b"),
+    ("мультимедиа", r"\b(?:vlc|spotify|aimp|winamp|foobar2000|obs studio|audacity|photoshop|adobe|gimp|"
+                    r"media player|itunes|potplayer|kmplayer)\b"),
+    ("интернет", r"\.(?:url|website)(?=\t)"),
+    ("система", r"\.(?:bat|cmd|ps1|cpl|msc)(?=\t)"),
+    ("документ", r"\.(?:pdf|docx?|xlsx?|pptx?|odt|ods|rtf|txt|csv|md|djvu|epub|eap)(?=\t)"),
+    ("мультимедиа", r"\.(?:mp3|mp4|avi|mkv|mov|wav|flac|ogg|jpe?g|png|gif|bmp|webp)(?=\t)"),
+    ("папка", r"<folder>"),
+]
+
+
+def describe_pidl(pidl):
+    """Вид элемента и короткое имя файла из PIDL рабочего стола"""
+    if not pidl:
+        return "", ""
+    item_type = pidl[0]
+    if item_type & 0x70 != 0x30:
+        return "<virtual>", ""
+    end = pidl.find(b"\x00", 12)
+    short_name = pidl[12:end if end >= 0 else None].decode('latin-1')
+    return ("<folder>" if item_type & 0x01 else "<file>"), short_name
+
+
+def read_lnk_target(path):
+    """Путь цели ярлыка .lnk (LinkInfo.LocalBasePath) или None"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != b"\x4c\x00\x00\x00":
+        return None
+    u16 = lambda pos: int.from_bytes(data[pos:pos + 2], 'little')
+    u32 = lambda pos: int.from_bytes(data[pos:pos + 4], 'little')
+    flags = u32(20)
+    pos = 0x4C
+    if flags & 0x01:  # HasLinkTargetIDList
+        pos += 2 + u16(pos)
+    if not flags & 0x02:  # HasLinkInfo
+        return None
+    header_size = u32(pos + 4)
+    if not u32(pos + 8) & 0x01:  # VolumeIDAndLocalBasePath
+        return None
+    if header_size >= 0x24:
+        start = pos + u32(pos + 28)
+        end = start
+        while data[end:end + 2] not in (b"\x00\x00", b""):
+            end += 2
+        return data[start:end].decode('utf-16-le', 'replace')
+    start = pos + u32(pos + 16)
+    return data[start:data.index(b"\x00", start)].decode('mbcs' if os.name == 'nt' else 'latin-1', 'replace')
+
+
+class LinkTargetResolver:
+    """Цель ярлыка по имени: ищет <имя>.lnk в папках рабочего стола"""
+
+    def __init__(self, desktop_dirs=None):
+        if desktop_dirs is None:
+            desktop_dirs = [os.path.join(os.path.expanduser("~"), "Desktop")]
+            if os.environ.get("PUBLIC"):
+                desktop_dirs.append(os.path.join(os.environ["PUBLIC"], "Desktop"))
+        self.desktop_dirs = desktop_dirs
+
+    def __call__(self, shortcut):
+        for directory in self.desktop_dirs:
+            path = os.path.join(directory, f"{shortcut.name}.lnk")
+            if os.path.exists(path):
+                try:
+                    return read_lnk_target(path) or ""
+                except (OSError, ValueError):
+                    return ""
+        return ""
+
+
+class IconClassifier:
+    """Правиловый классификатор icon_type с кэшем результатов по PIDL
+
+    Все правила собраны в одно регулярное выражение; строки всех ярлыков
+    склеиваются в один текст и размечаются одним проходом finditer.
+    """
+
+    def __init__(self, rules=CLASSIFIER_RULES, resolve_target=None):
+        self.types = [icon_type for icon_type, _ in rules]
+        alternatives = "|".join(f"(?P<r{i}>{pattern})" for i, (_, pattern) in enumerate(rules))
+        # Правила начинаются на границе слова или с точки расширения - остальные позиции пропускаются
+        self.matcher = re.compile(rf"^[^\n]*?(?:(?<!\w)|(?=\.))(?:{alternatives})", re.MULTILINE)
+        self.resolve_target = resolve_target
+        self.cache = {}  # PIDL -> тип
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def subject(self, shortcut):
+        kind, short_name = describe_pidl(shortcut.pidl)
+        target = ""
+        if self.resolve_target and short_name.lower().endswith(".lnk"):
+            target = self.resolve_target(shortcut)
+        line = f"{target}\t{shortcut.name}\t{short_name}\t{kind}"
+        return line.replace("\n", " ").lower()
+
+    def classify_many(self, shortcuts):
+        """Типы для списка ярлыков; уже встречавшиеся PIDL берутся из кэша
+
+        Кэш общий для рабочего потока (сканирование) и потока интерфейса,
+        поэтому классификация идет под блокировкой.
+        """
+        with self.lock:
+            return self.classify_locked(shortcuts)
+
+    def classify_locked(self, shortcuts):
+        results = [self.cache.get(shortcut.pidl) for shortcut in shortcuts]
+        pending = [i for i, result in enumerate(results) if result is None]
+        self.hits += len(shortcuts) - len(pending)
+        self.misses += len(pending)
+        if not pending:
+            return results
+
+        line_starts = {}
+        lines = []
+        offset = 0
+        for i in pending:
+            line = self.subject(shortcuts[i])
+            line_starts[offset] = i
+            lines.append(line)
+            offset += len(line) + 1
+
+        for match in self.matcher.finditer("\n".join(lines)):
+            results[line_starts[match.start()]] = self.types[int(match.lastgroup[1:])]
+
+        for i in pending:
+            if results[i] is None:
+                results[i] = UNKNOWN_ICON_TYPE
+            if shortcuts[i].pidl is not None:
+                self.cache[shortcuts[i].pidl] = results[i]
+        return results
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+class SpatialGrid:
+    """Хэш-сетка занятых позиций иконок
+
+    Ячейка равна размеру иконки, поэтому с позицией могут пересечься только
+    иконки из соседних ячеек 3x3: проверка за O(1) вместо перебора всех пар.
+    """
+
+    def __init__(self, cell_size=DEFAULT_ICON_SPACING):
+        self.cell_width, self.cell_height = cell_size
+        self.cells = {}  # (колонка, строка) -> [(позиция, элемент)]
+
+    def cell(self, position):
+        return (position[0] // self.cell_width, position[1] // self.cell_height)
+
+    def insert(self, position, item=None):
+        self.cells.setdefault(self.cell(position), []).append((position, item))
+
+    def collisions(self, position):
+        """Элементы, иконки которых пересекаются с иконкой в position"""
+        x, y = position
+        column, row = self.cell(position)
+        found = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for other, item in self.cells.get((column + dx, row + dy), ()):
+                    if abs(other[0] - x) < self.cell_width and abs(other[1] - y) < self.cell_height:
+                        found.append(item)
+        return found
+
+    def is_free(self, position):
+        return not self.collisions(position)
+
+
+def layout_region(shortcuts, spacing=DEFAULT_ICON_SPACING):
+    """Прямоугольник (x, y, ширина, высота), который занимают иконки"""
+    positions = [shortcut.position for shortcut in shortcuts]
+    if not positions:
+        return (0, 0, spacing[0], spacing[1])
+    left = min(x for x, _ in positions)
+    top = min(y for _, y in positions)
+    right = max(x for x, _ in positions) + spacing[0]
+    bottom = max(y for _, y in positions) + spacing[1]
+    return (left, top, right - left, bottom - top)
+
+
+class LayoutArranger:
+    """Автоматическая раскладка: группы по типам иконок, в группе - сначала важные
+
+    Иконки заполняют колонки сетки сверху вниз, каждая группа начинается с
+    новой колонки; заполнив регион (монитор), раскладка переходит к
+    следующему. Ярлыки из keep остаются на месте, занятые ими ячейки
+    пропускаются. Время линейно по числу иконок и ячеек сетки.
+    """
+
+    def __init__(self, regions, spacing=DEFAULT_ICON_SPACING, margin=0, type_order=None, overflow=False):
+        self.regions = list(regions)
+        self.spacing = spacing
+        self.margin = margin
+        if type_order is None:
+            # Неопознанные - в конце, после всех известных типов
+            type_order = [icon_type for icon_type in ICON_TYPES if icon_type != UNKNOWN_ICON_TYPE]
+            type_order.append(UNKNOWN_ICON_TYPE)
+        self.type_order = list(type_order)
+        self.overflow = overflow  # продолжать колонки правее последнего региона вместо ошибки
+
+    def groups(self, shortcuts):
+        """Ярлыки по группам в порядке type_order, в группе - по убыванию важности
+
+        Сортировка корзинами: ключей (тип, важность) единицы, ярлыков - тысячи.
+        """
+        ranks = {icon_type: rank for rank, icon_type in enumerate(self.type_order)}
+        buckets = {}
+        for shortcut in shortcuts:
+            rank = ranks.setdefault(shortcut.icon_type, len(ranks))
+            buckets.setdefault((rank, -(shortcut.importance or 0)), []).append(shortcut)
+        groups = []
+        last_rank = None
+        for rank, importance in sorted(buckets):
+            if rank != last_rank:
+                groups.append([])
+                last_rank = rank
+            groups[-1].extend(buckets[(rank, importance)])
+        return groups
+
+    def columns(self):
+        """Колонки сетки по всем регионам слева направо; колонка - позиции сверху вниз"""
+        width, height = self.spacing
+        x = y = 0
+        rows = 1
+        for left, top, region_width, region_height in self.regions:
+            rows = max(1, (region_height - 2 * self.margin) // height)
+            columns = max(1, (region_width - 2 * self.margin) // width)
+            x, y = left + self.margin, top + self.margin
+            for column in range(columns):
+                yield [(x + column * width, y + row * height) for row in range(rows)]
+            x += columns * width
+        while self.overflow:
+            yield [(x, y + row * height) for row in range(rows)]
+            x += width
+
+    def arrange(self, layout, name=None, keep=(), progress=None):
+        """Новый DesktopLayout с рассчитанными позициями; keep - id ярлыков, которые не двигаются"""
+        keep = set(keep)
+        grid = SpatialGrid(self.spacing)
+        positions = {}
+        movable = []
+        for shortcut in layout.shortcuts:
+            if shortcut.id in keep:
+                grid.insert(shortcut.position, shortcut)
+                positions[shortcut.id] = shortcut.position
+            else:
+                movable.append(shortcut)
+
+        columns = self.columns()
+        done = 0
+        for group in self.groups(movable):
+            slots = iter(())  # группа начинается с новой колонки
+            for shortcut in group:
+                position = next(slots, None)
+                while position is None or not grid.is_free(position):
+                    if position is None:
+                        column = next(columns, None)
+                        if column is None:
+                            raise ValueError(f"Не хватает места: размещено {done} из {len(movable)} иконок")
+                        slots = iter(column)
+                    position = next(slots, None)
+                grid.insert(position, shortcut)
+                positions[shortcut.id] = position
+            done += len(group)
+            if progress:
+                progress(done, len(movable))
+
+        arranged = DesktopLayout(name or layout.name, layout.description)
+        for shortcut in layout.shortcuts:
+            arranged.add_shortcut(shortcut.copy(positions[shortcut.id]))
+        return arranged
+
+
+def write_temp(filepath, write, suffix=".tmp"):
+    """Записать и fsync временный файл filepath + suffix; возвращает его путь
+
+    write(f) получает открытый на запись временный файл; при ошибке он удаляется.
+    """
+    tmp_path = filepath + suffix
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+            if metrics.enabled:
+                metrics.count('bytes_written', os.fstat(f.fileno()).st_size)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def fsync_directory(filepath):
+    """Закрепить на диске переименование в директории файла"""
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(os.path.dirname(filepath) or ".", os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def atomic_write(filepath, write):
+    """Записать текстовый файл через временный файл, fsync и rename - без полузаписанных файлов
+
+    write(f) получает открытый на запись временный файл.
+    """
+    tmp_path = write_temp(filepath, write)
+    try:
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    fsync_directory(filepath)
+
+
+def atomic_write_json(filepath, data, indent=2):
+    """Записать JSON атомарно"""
+    atomic_write(filepath, lambda f: json.dump(data, f, indent=indent, ensure_ascii=False))
+
+
+class LayoutSerializer:
+    """Потоковые запись и чтение файла layout по одному ярлыку
+
+    Запись байт в байт совпадает с json.dump(layout.to_dict(), indent=2,
+    ensure_ascii=False), но не строит дерево всего layout; если установлен
+    orjson, ярлыки кодируются им. Чтение разбирает файл блоками и отдает
+    словари ярлыков по одному, так что пиковая память не зависит от размера файла.
+    """
+
+    BATCH_SIZE = 512                # ярлыков на одну запись в файл
+    READ_CHUNK_SIZE = 256 * 1024    # символов на одно чтение из файла
+
+    def __init__(self, fast=True):
+        self.encoder = json.JSONEncoder(indent=2, ensure_ascii=False)
+        self.orjson = None
+        if fast:
+            try:
+                import orjson
+                self.orjson = orjson
+            except ImportError:
+                pass
+
+    def encode_record(self, record):
+        """JSON ярлыка с отступами элемента массива shortcuts"""
+        if self.orjson is not None:
+            try:
+                text = self.orjson.dumps(record, option=self.orjson.OPT_INDENT_2).decode('utf-8')
+            except (TypeError, ValueError):
+                # Суррогаты в строках, большие числа - их кодирует только json
+                text = self.encoder.encode(record)
+        else:
+            text = self.encoder.encode(record)
+        return "    " + text.replace("\n", "\n    ")
+
+    def write_records(self, f, header, records):
+        """Записать заголовок и словари ярлыков (можно генератор) в текстовый файл f"""
+        f.write("{")
+        separator = "\n"
+        for key, value in header.items():
+            f.write(f"{separator}  {json.dumps(key, ensure_ascii=False)}: "
+                    + self.encoder.encode(value).replace("\n", "\n  "))
+            separator = ",\n"
+        f.write(f'{separator}  "shortcuts": [')
+        batch = []
+        written = 0
+        for record in records:
+            batch.append(self.encode_record(record))
+            if len(batch) >= self.BATCH_SIZE:
+                f.write(("\n" if not written else ",\n") + ",\n".join(batch))
+                written += len(batch)
+                batch = []
+        if batch:
+            f.write(("\n" if not written else ",\n") + ",\n".join(batch))
+            written += len(batch)
+        f.write("\n  ]\n}" if written else "]\n}")
+
+    def write(self, f, layout):
+        self.write_records(f, layout.to_header(), (shortcut.to_dict() for shortcut in layout.shortcuts))
+
+    def read_records(self, f):
+        """(заголовок, генератор словарей ярлыков) из текстового файла f
+
+        Поля после массива shortcuts, если они есть, попадают в заголовок,
+        когда генератор исчерпан.
+        """
+        reader = JsonStreamReader(f, self.READ_CHUNK_SIZE)
+        header = {}
+        reader.expect("{")
+        while reader.peek() != "}":
+            key = reader.value()
+            reader.expect(":")
+            if key == 'shortcuts':
+                reader.expect("[")
+                return header, self.iter_records(reader, header)
+            header[key] = reader.value()
+            if reader.expect(",}") == "}":
+                return header, iter(())
+        return header, iter(())
+
+    @staticmethod
+    def iter_records(reader, header):
+        if reader.peek() == "]":
+            reader.expect("]")
+        else:
+            while True:
+                yield reader.value()
+                if reader.expect(",]") == "]":
+                    break
+        while reader.expect(",}") == ",":
+            key = reader.value()
+            reader.expect(":")
+            header[key] = reader.value()
+
+    def read(self, f, entries=()):
+        """DesktopLayout из файла f с записями журнала, примененными на лету"""
+        header, records = self.read_records(f)
+        if entries:
+            header['modified'] = entries[-1]['modified']
+            records = LayoutJournal.apply_stream(records, entries)
+        return DesktopLayout.from_records(header, records)
+
+
+class JsonStreamReader:
+    """Чтение значений JSON подряд из текстового файла с буфером фиксированного размера"""
+
+    WHITESPACE = re.compile(r"[ \t\r\n]*")
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        """Дочитать блок, отбросив разобранную часть буфера; False в конце файла"""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = self.WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("Неожиданный конец файла layout")
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"Ожидался один из символов {chars!r}, найден {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Значение обрезано границей блока
+                if not self.fill():
+                    raise
+                continue
+            # Число в самом конце буфера могло продолжаться в следующем блоке
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+class JournalMismatch(Exception):
+    """Запись журнала не совпала с ярлыком по индексу - нужен полный разбор"""
+
+
+class LayoutJournal:
+    """Журнал изменений ярлыков (JSON Lines) рядом с файлом layout"""
+
+    COMPACT_THRESHOLD = 64 * 1024  # байт журнала до фонового сжатия
+
+    def __init__(self, filepath, lock):
+        self.filepath = filepath
+        self.path = f"{filepath}.journal"
+        self.lock = lock
+
+    def append(self, entries):
+        """Дописать записи в журнал, возвращает число записанных байт"""
+        payload = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode('utf-8')
+        with self.lock:
+            with open(self.path, 'ab') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+        metrics.count('bytes_written', len(payload))
+        return len(payload)
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def read_entries(self):
+        """Прочитать записи; оборванная последняя строка после сбоя пропускается"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        metrics.count('bytes_read', len(data))
+        return self.parse_entries(data)
+
+    @staticmethod
+    def parse_entries(data):
+        """Записи из байт журнала до первой неразобранной строки"""
+        entries = []
+        for line in data.splitlines():
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+        return entries
+
+    @staticmethod
+    def apply(data, entries):
+        """Применить записи журнала к словарю layout"""
+        shortcuts = data.get('shortcuts', [])
+        for entry in entries:
+            index = entry['i']
+            if 'pidl' not in entry['set']:
+                if index >= len(shortcuts) or decode_pidl(shortcuts[index]['pidl']) != decode_pidl(entry['pidl']):
+                    pidl = decode_pidl(entry['pidl'])
+                    index = next((i for i, s in enumerate(shortcuts) if decode_pidl(s['pidl']) == pidl), None)
+                    if index is None:
+                        continue
+            shortcuts[index].update(entry['set'])
+            shortcuts[index]['modified'] = entry['modified']
+            data['modified'] = entry['modified']
+        return data
+
+    @staticmethod
+    def apply_stream(records, entries):
+        """Применять записи журнала к словарям ярлыков по мере чтения
+
+        Записи ищутся только по индексу; если PIDL по индексу не совпал,
+        бросается JournalMismatch, и вызывающий повторяет разбор через apply().
+        """
+        by_index = {}
+        for entry in entries:
+            by_index.setdefault(entry['i'], []).append(entry)
+        for index, record in enumerate(records):
+            for entry in by_index.pop(index, ()):
+                if 'pidl' not in entry['set'] and decode_pidl(record['pidl']) != decode_pidl(entry['pidl']):
+                    raise JournalMismatch(f"ярлык {index}")
+                record.update(entry['set'])
+                record['modified'] = entry['modified']
+            yield record
+        if by_index:
+            raise JournalMismatch(f"ярлыков {len(by_index)} нет в файле")
+
+    @staticmethod
+    def upgrade_record(record):
+        """PIDL старого формата str(bytes) перекодируется в base64"""
+        record['pidl'] = encode_pidl(decode_pidl(record['pidl']))
+        return record
+
+    def discard(self):
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def compact(self):
+        """Слить журнал в основной файл атомарной перезаписью
+
+        Блокировка держится только на чтение файлов и на замену: слитый файл
+        пишется во временный без нее, и load_layout в это время не ждет.
+        Файл читается в память целиком, а не потоково: на Windows открытый
+        файл не заменить, и save_layout не должен ждать конца слияния.
+        Если за время слияния файл переписан целиком, результат отбрасывается;
+        записи, дописанные в журнал за это время, остаются в журнале.
+        """
+        with self.lock:
+            try:
+                with open(self.path, 'rb') as f:
+                    journal = f.read()
+            except FileNotFoundError:
+                return
+            entries = self.parse_entries(journal)
+            if not entries:
+                return
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                text = f.read()
+                base_stat = os.fstat(f.fileno())
+
+        serializer = LayoutSerializer()
+
+        def write_merged(out):
+            header, records = serializer.read_records(io.StringIO(text))
+            header['modified'] = entries[-1]['modified']
+            header['version'] = LAYOUT_VERSION
+            records = map(self.upgrade_record, self.apply_stream(records, entries))
+            serializer.write_records(out, header, records)
+
+        def write_fallback(out):
+            data = self.apply(json.loads(text), entries)
+            data['version'] = LAYOUT_VERSION
+            data['shortcuts'] = [self.upgrade_record(record) for record in data.get('shortcuts', [])]
+            json.dump(data, out, indent=2, ensure_ascii=False)
+
+        # Свое имя временного файла: без блокировки рядом может идти save_layout или другое сжатие
+        suffix = f".{threading.get_ident()}.compact.tmp"
+        try:
+            tmp_path = write_temp(self.filepath, write_merged, suffix)
+        except JournalMismatch:
+            tmp_path = write_temp(self.filepath, write_fallback, suffix)
+
+        with self.lock:
+            try:
+                stat = os.stat(self.filepath)
+                with open(self.path, 'rb') as f:
+                    current = f.read()
+            except FileNotFoundError:
+                current = None
+            if (current is None or not current.startswith(journal)
+                    or (stat.st_mtime_ns, stat.st_size) != (base_stat.st_mtime_ns, base_stat.st_size)):
+                # Файл переписан или удален, журнал уже относится к новой версии
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, self.filepath)
+            tail = current[len(journal):]
+            if tail:
+                # Записи по индексам остаются верными и для слитого файла
+                with open(f"{self.path}.tmp", 'wb') as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(f"{self.path}.tmp", self.path)
+            else:
+                os.remove(self.path)
+        fsync_directory(self.filepath)
+
+    def compact_in_background(self, on_error=None):
+        """Сжать журнал в фоновом потоке; ошибка передается в on_error(exception)"""
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+                else:
+                    print(f"Не удалось сжать журнал {self.path}: {e}", file=sys.stderr)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+class LayoutCatalog:
+    """Индекс метаданных сохраненных layouts без полного разбора файлов"""
+
+    INDEX_FILENAME = ".catalog"
+    RECHECK_INTERVAL = 2.0  # секунд между проверками mtime самих файлов
+
+    def __init__(self, layouts_dir):
+        self.layouts_dir = layouts_dir
+        self.index_path = os.path.join(layouts_dir, self.INDEX_FILENAME)
+        self.entries = {}      # имя файла -> метаданные
+        self.dir_mtime = None  # st_mtime_ns директории на момент последней проверки
+        self.checked_at = None  # time.monotonic() последней проверки файлов
+        self.loaded = False
+
+    def load_index(self):
+        self.loaded = True
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.entries = data.get('entries', {})
+            self.dir_mtime = data.get('dir_mtime')
+        except (OSError, ValueError):
+            # Индекс - всего лишь кэш: при повреждении строится заново
+            self.entries = {}
+            self.dir_mtime = None
+
+    def save_index(self):
+        # Перезапись на месте не меняет mtime директории, поэтому индекс остается валидным
+        data = {'dir_mtime': self.dir_mtime, 'entries': self.entries}
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @staticmethod
+    def read_entry(filepath, stat):
+        """Прочитать метаданные одного файла layout"""
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data, records = LayoutSerializer(fast=False).read_records(f)
+            shortcut_count = sum(1 for _ in records)
+        return {
+            'name': data.get('name', ''),
+            'description': data.get('description', ''),
+            'shortcut_count': shortcut_count,
+            'modified': data.get('modified', ''),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns
+        }
+
+    def refresh(self):
+        """Пересканировать директорию: сразу при смене ее mtime, иначе не чаще RECHECK_INTERVAL
+
+        Правка файла на месте не меняет mtime директории, поэтому файлы
+        периодически проверяются по своим mtime и размеру; перечитываются только изменившиеся.
+        """
+        if not self.loaded:
+            self.load_index()
+        dir_mtime = os.stat(self.layouts_dir).st_mtime_ns
+        if (dir_mtime == self.dir_mtime and self.checked_at is not None
+                and time.monotonic() - self.checked_at < self.RECHECK_INTERVAL):
+            return
+
+        entries = {}
+        for filename in os.listdir(self.layouts_dir):
+            if not filename.endswith('.json'):
+                continue
+            filepath = os.path.join(self.layouts_dir, filename)
+            try:
+                stat = os.stat(filepath)
+                entry = self.entries.get(filename)
+                if not entry or entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+                    entry = self.read_entry(filepath, stat)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Не удалось прочитать {filename}: {e}", file=sys.stderr)
+                continue
+            entries[filename] = entry
+
+        self.checked_at = time.monotonic()
+        if entries == self.entries and dir_mtime == self.dir_mtime:
+            return
+        self.entries = entries
+        self.dir_mtime = dir_mtime
+        self.save_index()
+        # Первое создание файла индекса само меняет mtime директории
+        dir_mtime = os.stat(self.layouts_dir).st_mtime_ns
+        if dir_mtime != self.dir_mtime:
+            self.dir_mtime = dir_mtime
+            self.save_index()
+
+    def list_layouts(self):
+        self.refresh()
+        return sorted(self.entries)
+
+    def get(self, filename):
+        self.refresh()
+        return self.entries.get(filename)
+
+    def record(self, filename, layout):
+        """Обновить запись после сохранения layout без повторного чтения файла"""
+        if not self.loaded:
+            self.load_index()
+        filepath = os.path.join(self.layouts_dir, filename)
+        stat = os.stat(filepath)
+        self.entries[filename] = {
+            'name': layout.name,
+            'description': layout.description,
+            'shortcut_count': len(layout.shortcuts),
+            'modified': layout.modified,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns
+        }
+        self.save_index()
+
+    def forget(self, filename):
+        if not self.loaded:
+            self.load_index()
+        if self.entries.pop(filename, None) is not None:
+            self.save_index()
+
+
+class LayoutCache:
+    """LRU-кэш разобранных DesktopLayout, ограниченный суммарным числом ярлыков"""
+
+    def __init__(self, max_shortcuts=200000):
+        self.max_shortcuts = max_shortcuts
+        self.entries = OrderedDict()  # путь -> (ключ версии файла, layout, вес)
+        self.total_shortcuts = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def file_key(filepath, journal_path):
+        """Версия файла: mtime и размер самого layout и его журнала"""
+        stat = os.stat(filepath)
+        try:
+            journal_stat = os.stat(journal_path)
+            journal_key = (journal_stat.st_mtime_ns, journal_stat.st_size)
+        except OSError:
+            journal_key = None
+        return stat.st_mtime_ns, stat.st_size, journal_key
+
+    def get(self, filepath, key):
+        entry = self.entries.get(filepath)
+        if entry is not None and entry[0] == key:
+            self.entries.move_to_end(filepath)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, filepath, key, layout):
+        self.invalidate(filepath)
+        weight = len(layout.shortcuts) + 1
+        self.entries[filepath] = (key, layout, weight)
+        self.total_shortcuts += weight
+        # Последний добавленный layout остается в кэше, даже если он больше лимита
+        while self.total_shortcuts > self.max_shortcuts and len(self.entries) > 1:
+            _, (_, _, evicted_weight) = self.entries.popitem(last=False)
+            self.total_shortcuts -= evicted_weight
+
+    def invalidate(self, filepath):
+        entry = self.entries.pop(filepath, None)
+        if entry is not None:
+            self.total_shortcuts -= entry[2]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'layouts': len(self.entries),
+            'shortcuts': self.total_shortcuts,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+class SearchQuery:
+    """Разобранный запрос поиска по ярлыкам
+
+    Слова ищутся по началу слов имени, описания, тегов и типа; фильтры:
+    type:ТИП, tag:ТЕГ, layout:ИМЯ, importance>=N (также >, <=, <, =, :).
+    Минус перед условием исключает совпадения: -tag:old. Все условия через И.
+    """
+
+    TERM_PATTERN = re.compile(r'^(-?)(?:(type|tag|layout):(.+)|importance(>=|<=|>|<|=|:)(\d+)|(.+))$')
+    COMPARISONS = {
+        '>=': lambda value, n: value >= n, '<=': lambda value, n: value <= n,
+        '>': lambda value, n: value > n, '<': lambda value, n: value < n,
+        '=': lambda value, n: value == n, ':': lambda value, n: value == n
+    }
+
+    def __init__(self, text):
+        self.text = text
+        self.terms = []  # (исключать ли, вид, значение)
+        for token in text.split():
+            match = self.TERM_PATTERN.match(token.lower())
+            negate, field, value, op, number, word = match.groups()
+            if field:
+                self.terms.append((bool(negate), field, value))
+            elif op:
+                self.terms.append((bool(negate), 'importance', (op, int(number))))
+            else:
+                for part in ShortcutSearchIndex.tokenize(word):
+                    self.terms.append((bool(negate), 'word', part))
+
+
+class ShortcutSearchIndex:
+    """Инвертированный индекс ярлыков всех сохраненных layouts
+
+    Хранится в JSON Lines рядом с layouts: строка на файл layout с его
+    версией (LayoutCache.file_key) и документами ярлыков, последняя строка
+    для файла побеждает. Сохранение через журнал дописывает только
+    измененные документы по индексам ('patch') вместе с версией файла, к
+    которой они применяются. Файлы, измененные в обход менеджера,
+    переиндексируются по mtime при поиске. Постинги держатся в памяти
+    множествами номеров документов.
+    """
+
+    INDEX_FILENAME = ".search"
+    FIELDS = ('name', 'icon_type', 'tags', 'description', 'importance')  # поля документа
+    RECHECK_INTERVAL = 2.0  # секунд между полными проверками mtime файлов
+    WORD_PATTERN = re.compile(r'\w+')
+
+    def __init__(self, layouts_dir, journal_lock):
+        self.layouts_dir = layouts_dir
+        self.index_path = os.path.join(layouts_dir, self.INDEX_FILENAME)
+        self.journal_lock = journal_lock
+        self.lock = threading.RLock()
+        self.files = {}      # имя файла -> (ключ версии, номера документов)
+        self.docs = {}       # номер -> (файл, индекс ярлыка, name, icon_type, tags, description, importance)
+        # вид условия -> значение -> номера документов; 'word' - слова для полнотекстового поиска
+        self.facets = {'word': {}, 'type': {}, 'tag': {}, 'layout': {}, 'importance': {}}
+        self.sorted_words = None  # отсортированные слова для поиска по префиксу
+        self.next_doc = 0
+        self.line_sizes = {}  # имя файла -> размер его полной строки, для решения о сжатии
+        self.dir_mtime = None
+        self.checked_at = None
+        self.loaded = False
+
+    @classmethod
+    def tokenize(cls, text):
+        return cls.WORD_PATTERN.findall(text.lower()) if text else []
+
+    @staticmethod
+    def json_key(key):
+        mtime, size, journal_key = key
+        return [mtime, size, list(journal_key) if journal_key else None]
+
+    @staticmethod
+    def layout_documents(records):
+        return [[r.get('name', ''), r.get('icon_type', 'неопознано'), list(r.get('tags', [])),
+                 r.get('description', ''), r.get('importance', 1)] for r in records]
+
+    @staticmethod
+    def shortcut_document(shortcut):
+        return [shortcut.name, shortcut.icon_type, list(shortcut.tags), shortcut.description, shortcut.importance]
+
+    def load_index(self):
+        self.loaded = True
+        state = {}  # имя файла -> [ключ версии, документы, размер полной строки]
+        damaged = False
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                if metrics.enabled:
+                    metrics.count('bytes_read', os.fstat(f.fileno()).st_size)
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        filename = entry['file']
+                        if 'patch' in entry:
+                            self.apply_patch(state, entry)
+                        elif entry.get('docs') is None:
+                            state.pop(filename, None)
+                        else:
+                            state[filename] = [entry['key'], entry['docs'], len(line.encode('utf-8'))]
+                    except (ValueError, KeyError):
+                        damaged = True  # оборванная после сбоя запись
+        except OSError:
+            pass
+        for filename, (key, documents, size) in state.items():
+            self.add_file(filename, key, documents)
+            self.line_sizes[filename] = size
+        if damaged:
+            # Иначе следующая дописанная строка склеится с оборванной
+            self.compact()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=65536)
+    def document_keys(name, icon_type, tags, description, importance):
+        """Ключи постингов документа; одинаковые ярлыки в разных layouts разбираются один раз"""
+        words = set(ShortcutSearchIndex.tokenize(name))
+        words.update(ShortcutSearchIndex.tokenize(description))
+        words.update(ShortcutSearchIndex.tokenize(icon_type))
+        for tag in tags:
+            words.update(ShortcutSearchIndex.tokenize(tag))
+        keys = [('word', word) for word in words]
+        keys.append(('type', icon_type.lower()))
+        keys.extend(('tag', tag.lower()) for tag in tags)
+        keys.append(('importance', importance))
+        return tuple(keys)
+
+    @staticmethod
+    def apply_patch(state, entry):
+        """Применить строку 'patch' к документам файла при загрузке индекса
+
+        Если документы файла не той версии, к которой относится patch, файл
+        забывается целиком - refresh перечитает его по несовпавшей версии.
+        """
+        current = state.get(entry['file'])
+        if current is None:
+            return
+        documents = current[1]
+        if current[0] != entry['base'] or any(int(index) >= len(documents) for index in entry['patch']):
+            del state[entry['file']]
+            return
+        for index, document in entry['patch'].items():
+            documents[int(index)] = document
+        current[0] = entry['key']
+
+    def index_document(self, doc_id, doc):
+        self.docs[doc_id] = doc
+        for field, value in self.document_keys(*doc[2:]):
+            self.facets[field].setdefault(value, set()).add(doc_id)
+        self.sorted_words = None
+
+    def unindex_document(self, doc_id):
+        for field, value in self.document_keys(*self.docs.pop(doc_id)[2:]):
+            ids = self.facets[field].get(value)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self.facets[field][value]
+
+    def add_file(self, filename, key, documents):
+        self.remove_file(filename)
+        doc_ids = range(self.next_doc, self.next_doc + len(documents))
+        self.next_doc += len(documents)
+        # Постинги файла сначала собираются списками и добавляются в множества разом
+        file_postings = {}
+        for doc_id, (index, (name, icon_type, tags, description, importance)) in zip(
+                doc_ids, enumerate(documents)):
+            doc = (filename, index, name, icon_type, tuple(tags), description, importance)
+            self.docs[doc_id] = doc
+            for posting_key in self.document_keys(*doc[2:]):
+                file_postings.setdefault(posting_key, []).append(doc_id)
+        for (field, value), ids in file_postings.items():
+            self.facets[field].setdefault(value, set()).update(ids)
+        self.facets['layout'][filename[:-len('.json')].lower()] = set(doc_ids)
+        self.files[filename] = (key, doc_ids)
+        self.sorted_words = None
+
+    def remove_file(self, filename):
+        entry = self.files.pop(filename, None)
+        if entry is None:
+            return
+        for doc_id in entry[1]:
+            self.unindex_document(doc_id)
+        self.facets['layout'].pop(filename[:-len('.json')].lower(), None)
+        self.sorted_words = None
+
+    def write_line(self, entry):
+        payload = (json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8')
+        with open(self.index_path, 'ab') as f:
+            f.write(payload)
+        metrics.count('bytes_written', len(payload))
+        return len(payload)
+
+    def append(self, filename, key, documents):
+        """Дописать строку индекса; при разросшемся мусоре - перезаписать индекс"""
+        size = self.write_line({'file': filename, 'key': key, 'docs': documents})
+        if not self.loaded:
+            return
+        if documents is not None:
+            self.line_sizes[filename] = size
+        else:
+            self.line_sizes.pop(filename, None)
+        self.compact_if_needed()
+
+    def compact_if_needed(self):
+        # Строки 'patch' считаются мусором: при сжатии они сливаются в полные строки
+        live_bytes = sum(self.line_sizes.values())
+        if os.path.getsize(self.index_path) > 2 * live_bytes + LayoutJournal.COMPACT_THRESHOLD:
+            self.compact()
+
+    def compact(self):
+        """Оставить в файле индекса только актуальные строки"""
+        def write(f):
+            for filename, (key, doc_ids) in self.files.items():
+                documents = [[name, icon_type, list(tags), description, importance]
+                             for _, _, name, icon_type, tags, description, importance
+                             in (self.docs[doc_id] for doc_id in doc_ids)]
+                line = json.dumps({'file': filename, 'key': key, 'docs': documents}, ensure_ascii=False) + "\n"
+                self.line_sizes[filename] = len(line.encode('utf-8'))
+                f.write(line)
+        atomic_write(self.index_path, write)
+
+    def read_documents(self, filepath):
+        """Документы ярлыков файла layout с примененным журналом и его версия"""
+        journal = LayoutJournal(filepath, self.journal_lock)
+        with self.journal_lock:
+            key = self.json_key(LayoutCache.file_key(filepath, journal.path))
+            entries = journal.read_entries()
+            with open(filepath, 'r', encoding='utf-8') as f:
+                if metrics.enabled:
+                    metrics.count('bytes_read', os.fstat(f.fileno()).st_size)
+                try:
+                    _, records = LayoutSerializer(fast=False).read_records(f)
+                    documents = self.layout_documents(LayoutJournal.apply_stream(records, entries))
+                except JournalMismatch:
+                    f.seek(0)
+                    data = LayoutJournal.apply(json.load(f), entries)
+                    documents = self.layout_documents(data.get('shortcuts', []))
+        return key, documents
+
+    def refresh(self, progress=None):
+        """Переиндексировать новые и измененные файлы, забыть удаленные"""
+        with self.lock:
+            if not self.loaded:
+                self.load_index()
+            dir_mtime = os.stat(self.layouts_dir).st_mtime_ns
+            # Дописывание журнала не меняет mtime директории - поэтому еще и проверка по времени
+            if (dir_mtime == self.dir_mtime and self.checked_at is not None
+                    and time.monotonic() - self.checked_at < self.RECHECK_INTERVAL):
+                return
+            filenames = [name for name in os.listdir(self.layouts_dir) if name.endswith('.json')]
+            for i, filename in enumerate(filenames):
+                if progress:
+                    progress(i, len(filenames))
+                filepath = os.path.join(self.layouts_dir, filename)
+                try:
+                    key = self.json_key(LayoutCache.file_key(filepath, f"{filepath}.journal"))
+                    if filename in self.files and self.files[filename][0] == key:
+                        continue
+                    key, documents = self.read_documents(filepath)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Не удалось проиндексировать {filename}: {e}", file=sys.stderr)
+                    continue
+                self.add_file(filename, key, documents)
+                self.append(filename, key, documents)
+            for filename in set(self.files) - set(filenames):
+                self.forget(filename)
+            self.dir_mtime = os.stat(self.layouts_dir).st_mtime_ns
+            self.checked_at = time.monotonic()
+
+    def record(self, filename, layout, key):
+        """Обновить документы layout после сохранения без повторного чтения файла
+
+        Пока индекс не загружен (консольные команды без поиска), строка только
+        дописывается в файл - без разбора всего индекса.
+        """
+        with self.lock:
+            documents = [self.shortcut_document(s) for s in layout.shortcuts]
+            key = self.json_key(key)
+            if self.loaded:
+                self.add_file(filename, key, documents)
+            self.append(filename, key, documents)
+
+    def record_changes(self, filename, layout, base_key, key, entries):
+        """Обновить документы после сохранения правок через журнал
+
+        base_key - версия файла до дописывания журнала, key - после. В индекс
+        попадают только ярлыки с измененными полями документа; перемещения
+        иконок меняют лишь версию файла.
+        """
+        indices = sorted({entry['i'] for entry in entries if not set(self.FIELDS).isdisjoint(entry['set'])})
+        patch = {index: self.shortcut_document(layout.shortcuts[index]) for index in indices}
+        base_key, key = self.json_key(base_key), self.json_key(key)
+        with self.lock:
+            if self.loaded:
+                current = self.files.get(filename)
+                if current is None or current[0] != base_key:
+                    # Документы устарели раньше этого сохранения - refresh перечитает файл
+                    self.remove_file(filename)
+                    self.checked_at = None
+                else:
+                    doc_ids = current[1]
+                    for index, (name, icon_type, tags, description, importance) in patch.items():
+                        self.unindex_document(doc_ids[index])
+                        self.index_document(doc_ids[index], (filename, index, name, icon_type, tuple(tags),
+                                                             description, importance))
+                    self.files[filename] = (key, doc_ids)
+            self.write_line({'file': filename, 'base': base_key, 'key': key,
+                             'patch': {str(index): document for index, document in patch.items()}})
+            if self.loaded:
+                self.compact_if_needed()
+
+    def forget(self, filename):
+        with self.lock:
+            if self.loaded:
+                if filename not in self.files:
+                    return
+                self.remove_file(filename)
+            self.append(filename, None, None)
+
+    def word_postings(self, prefix):
+        """Документы со словами, начинающимися с prefix"""
+        if self.sorted_words is None:
+            self.sorted_words = sorted(self.facets['word'])
+        start = bisect.bisect_left(self.sorted_words, prefix)
+        result = set()
+        for word in itertools.islice(self.sorted_words, start, None):
+            if not word.startswith(prefix):
+                break
+            result |= self.facets['word'][word]
+        return result
+
+    def postings(self, field, value):
+        if field == 'word':
+            return self.word_postings(value)
+        if field == 'importance':
+            op, number = value
+            compare = SearchQuery.COMPARISONS[op]
+            result = set()
+            for importance, ids in self.facets['importance'].items():
+                if isinstance(importance, int) and compare(importance, number):
+                    result |= ids
+            return result
+        return self.facets[field].get(value, set())
+
+    def search(self, query, limit=None):
+        """Ярлыки, подходящие под запрос: важные первыми, затем по файлу и порядку"""
+        if not isinstance(query, SearchQuery):
+            query = SearchQuery(query)
+        with self.lock:
+            include = [self.postings(field, value) for negate, field, value in query.terms if not negate]
+            exclude = [self.postings(field, value) for negate, field, value in query.terms if negate]
+            if include:
+                include.sort(key=len)
+                matches = include[0]
+                for ids in include[1:]:
+                    matches = matches & ids
+                    if not matches:
+                        break
+            else:
+                matches = set(self.docs)
+            for ids in exclude:
+                matches = matches - ids
+            hits = [self.docs[doc_id] for doc_id in matches]
+        order = lambda doc: (-(doc[6] if isinstance(doc[6], int) else 0), doc[0], doc[1])
+        if limit is not None:
+            hits = heapq.nsmallest(limit, hits, key=order)
+        else:
+            hits.sort(key=order)
+        return [{'file': filename, 'index': index, 'name': name, 'icon_type': icon_type,
+                 'tags': list(tags), 'description': description, 'importance': importance}
+                for filename, index, name, icon_type, tags, description, importance in hits]
+
+    def stats(self):
+        return {'layouts': len(self.files), 'shortcuts': len(self.docs), 'words': len(self.facets['word'])}
+
+
+class LayoutHistory:
+    """История снимков layouts с дедупликацией записей ярлыков
+
+    Каждая запись ярлыка (без отметок времени) хранится один раз в
+    objects.pack под своим SHA-1, objects.idx хранит смещения. Снимок -
+    маленький манифест со списком хэшей блоков по CHUNK_SIZE строк
+    [хэш записи, created, modified]; блоки тоже лежат в pack. Неизменные
+    ярлыки наследуют отметки времени родительского снимка, поэтому
+    неизменные блоки совпадают, и история растет пропорционально изменениям.
+    """
+
+    CHUNK_SIZE = 256
+
+    def __init__(self, root):
+        self.root = root
+        self.pack_path = os.path.join(root, "objects.pack")
+        self.index_path = os.path.join(root, "objects.idx")
+        self.snapshots_dir = os.path.join(root, "snapshots")
+        self.index = None  # хэш -> (смещение, длина) в objects.pack
+        self.lock = threading.Lock()
+
+    def load_index(self):
+        self.index = {}
+        try:
+            with open(self.index_path, 'r', encoding='ascii') as f:
+                for line in f:
+                    parts = line.split()
+                    # Оборванная строка после сбоя просто пропускается
+                    if len(parts) == 3:
+                        self.index[parts[0]] = (int(parts[1]), int(parts[2]))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def encode_object(value):
+        encoded = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        return hashlib.sha1(encoded).hexdigest(), encoded
+
+    @classmethod
+    def record_of(cls, shortcut):
+        """Запись ярлыка без отметок времени и ее хэш"""
+        record = shortcut.to_dict()
+        del record['created'], record['modified']
+        return cls.encode_object(record)
+
+    def put_objects(self, objects):
+        """Дописать в pack отсутствующие объекты: список (хэш, байты)"""
+        os.makedirs(self.root, exist_ok=True)
+        new_objects = {}
+        for digest, encoded in objects:
+            if digest not in self.index and digest not in new_objects:
+                new_objects[digest] = encoded
+        if not new_objects:
+            return 0
+
+        index_lines = []
+        with open(self.pack_path, 'ab') as pack:
+            offset = pack.seek(0, os.SEEK_END)
+            for digest, encoded in new_objects.items():
+                pack.write(encoded + b"\n")
+                index_lines.append(f"{digest} {offset} {len(encoded)}\n")
+                self.index[digest] = (offset, len(encoded))
+                offset += len(encoded) + 1
+            pack.flush()
+            os.fsync(pack.fileno())
+        metrics.count('bytes_written', sum(len(encoded) + 1 for encoded in new_objects.values()))
+        # Индекс пишется после данных: при сбое в pack остаются лишь недостижимые байты
+        with open(self.index_path, 'a', encoding='ascii') as f:
+            f.writelines(index_lines)
+            f.flush()
+            os.fsync(f.fileno())
+        return len(new_objects)
+
+    def read_object(self, pack, digest):
+        offset, length = self.index[digest]
+        metrics.count('bytes_read', length)
+        pack.seek(offset)
+        return json.loads(pack.read(length))
+
+    def layout_dir(self, layout_key):
+        return os.path.join(self.snapshots_dir, layout_key)
+
+    def list_snapshots(self, layout_key):
+        try:
+            return sorted(name[:-5] for name in os.listdir(self.layout_dir(layout_key)) if name.endswith('.json'))
+        except FileNotFoundError:
+            return []
+
+    def read_manifest(self, layout_key, snapshot_id):
+        with open(os.path.join(self.layout_dir(layout_key), f"{snapshot_id}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def read_rows(self, manifest):
+        """Строки [хэш, created, modified] снимка"""
+        rows = []
+        if manifest['chunks']:
+            with open(self.pack_path, 'rb') as pack:
+                for digest in manifest['chunks']:
+                    rows.extend(self.read_object(pack, digest))
+        return rows
+
+    def commit(self, layout_key, layout):
+        """Записать снимок layout; возвращает id снимка (прежний, если ничего не изменилось)"""
+        with self.lock:
+            if self.index is None:
+                self.load_index()
+            snapshots = self.list_snapshots(layout_key)
+            parent = snapshots[-1] if snapshots else None
+            previous = self.read_manifest(layout_key, parent) if parent else None
+            parent_times = {}
+            if previous:
+                for digest, created, modified in self.read_rows(previous):
+                    parent_times.setdefault(digest, (created, modified))
+
+            objects = []
+            rows = []
+            for shortcut in layout.shortcuts:
+                digest, encoded = self.record_of(shortcut)
+                objects.append((digest, encoded))
+                created, modified = parent_times.get(digest, (shortcut._created, shortcut._modified))
+                rows.append([digest, created, modified])
+
+            chunks = []
+            for start in range(0, len(rows), self.CHUNK_SIZE):
+                digest, encoded = self.encode_object(rows[start:start + self.CHUNK_SIZE])
+                objects.append((digest, encoded))
+                chunks.append(digest)
+
+            if (previous and previous['chunks'] == chunks and previous['name'] == layout.name
+                    and previous['description'] == layout.description):
+                return parent
+
+            self.put_objects(objects)
+            snapshot_id = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+            os.makedirs(self.layout_dir(layout_key), exist_ok=True)
+            manifest = {
+                'name': layout.name,
+                'description': layout.description,
+                'created': layout.created,
+                'modified': layout.modified,
+                'version': LAYOUT_VERSION,
+                'parent': parent,
+                'count': len(rows),
+                'chunks': chunks
+            }
+            atomic_write_json(os.path.join(self.layout_dir(layout_key), f"{snapshot_id}.json"),
+                              manifest, indent=None)
+            return snapshot_id
+
+    def load(self, layout_key, snapshot_id):
+        """Собрать DesktopLayout из снимка"""
+        with self.lock:
+            if self.index is None:
+                self.load_index()
+            manifest = self.read_manifest(layout_key, snapshot_id)
+            layout = DesktopLayout(manifest['name'], manifest.get('description', ''))
+            layout.created = manifest.get('created', layout.created)
+            records = {}
+            with open(self.pack_path, 'rb') as pack:
+                for digest in manifest['chunks']:
+                    for record_digest, created, modified in self.read_object(pack, digest):
+                        record = records.get(record_digest)
+                        if record is None:
+                            record = records[record_digest] = self.read_object(pack, record_digest)
+                        shortcut = Shortcut.from_dict(record)
+                        shortcut._created = created
+                        shortcut._modified = modified
+                        layout.add_shortcut(shortcut)
+            layout.modified = manifest.get('modified', layout.created)
+            return layout
+
+
+class DesktopIconManager:
+    def __init__(self, backend=None, layouts_dir="desktop_layouts"):
+        self.layouts_dir = layouts_dir
+        self.current_layout = None
+        self.last_restore_plan = None
+        self.restore_tolerance = 0  # пикселей; None - всегда перемещать все иконки
+        self.journal_lock = threading.Lock()
+        # COM-backend создается при первом обращении - в том потоке, который с ним работает
+        self.backend = backend
+        self.error_handler = show_error_dialog
         self.ensure_directories()
+        self.catalog = LayoutCatalog(self.layouts_dir)
+        self.search_index = ShortcutSearchIndex(self.layouts_dir, self.journal_lock)
+        self.layout_cache = LayoutCache()
+        self.history = LayoutHistory(os.path.join(self.layouts_dir, ".history"))
+        self.classifier = None
+        self.classifier_lock = threading.Lock()  # классификатор создается в любом из потоков
+        self.serializer = None  # LayoutSerializer создается при первом сохранении или загрузке
+        self.auto_classify = True  # определять icon_type новых ярлыков при сканировании
 
     def ensure_directories(self):
         """Создает необходимые директории"""
         if not os.path.exists(self.layouts_dir):
             os.makedirs(self.layouts_dir)
 
+    def show_error(self, title, message):
+        metrics.count('errors')
+        self.error_handler(title, message)
+
     def initialize_com(self):
         """Инициализация COM объектов"""
         try:
-            pythoncom.CoInitialize()
-            self.shell_windows = wcomcli.Dispatch(CLSID_ShellWindows)
-            hwnd = 0
-            dispatch = self.shell_windows.FindWindowSW(
-                wcomcli.VARIANT(pythoncom.VT_I4, shellcon.CSIDL_DESKTOP),
-                wcomcli.VARIANT(pythoncom.VT_EMPTY, None),
-                SWC_DESKTOP, hwnd, SWFO_NEEDDISPATCH,
-            )
-            service_provider = dispatch._oleobj_.QueryInterface(pythoncom.IID_IServiceProvider)
-            browser = service_provider.QueryService(shell.SID_STopLevelBrowser, shell.IID_IShellBrowser)
-            shell_view = browser.QueryActiveShellView()
-            self.folder_view = shell_view.QueryInterface(IID_IFolderView)
+            self.backend = ComShellBackend()
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось инициализировать COM: {e}")
+            self.show_error("Ошибка", f"Не удалось инициализировать COM: {e}")
 
-    def get_desktop_items(self):
-        """Получить все элементы рабочего стола"""
-        if not self.folder_view:
+    @measured("get_desktop_items")
+    def get_desktop_items(self, progress=None):
+        """Получить все элементы рабочего стола за один проход"""
+        if not self.backend:
             self.initialize_com()
+            if not self.backend:
+                return []
 
         items_data = []
         try:
-            items_len = self.folder_view.ItemCount(shellcon.SVGIO_ALLVIEW)
-            for i in range(items_len):
-                item = self.folder_view.Item(i)
-                name = self.get_item_name(item, i)  # передаем индекс
-                position = self.folder_view.GetItemPosition(item)
+            # Один снимок имен на весь захват, сопоставление по PIDL, а не по индексу
+            with metrics.phase("get_names"):
+                names = self.backend.get_names()
+            with metrics.phase("get_view_items"):
+                view_items = self.backend.get_view_items(progress)
+            for i, (pidl, position) in enumerate(view_items):
+                name = names.get(pidl_key(pidl))
+                if name is None:
+                    metrics.count('name_fallbacks')
+                    name = self.get_item_name(pidl, i)
                 items_data.append({
                     'index': i,
                     'name': name,
                     'position': (position[0], position[1]),
-                    'pidl': str(item)
+                    'pidl': pidl_key(pidl)
                 })
+        except JobCancelled:
+            raise
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось получить элементы: {e}")
+            self.show_error("Ошибка", f"Не удалось получить элементы: {e}")
 
         return items_data
 
     def get_item_name(self, item, index=None):
         """Получить имя элемента"""
         try:
-            shell_app = wcomcli.Dispatch("Shell.Application")
-            desktop = shell_app.NameSpace(0)  # Desktop
-
-            if index is not None and index < len(list(desktop.Items())):
-                return list(desktop.Items())[index].Name
-            else:
-                # Перебор всех элементов
-                for i, shell_item in enumerate(desktop.Items()):
-                    if i == index:
-                        return shell_item.Name
+            name = self.backend.get_display_name(item)
+            if name:
+                return name
         except Exception as e:
-            print(f"Error getting name for index {index}: {e}")
+            metrics.count('errors')
+            # stderr, а не stdout: вывод CLI с --json должен оставаться JSON
+            print(f"Не удалось получить имя элемента {index}: {e}", file=sys.stderr)
 
         return f"Item_{index if index is not None else hash(item)}"
 
-    def create_layout(self, name, description=""):
-        """Создать новый layout"""
-        layout = DesktopLayout(name, description)
-        items = self.get_desktop_items()
+    def metrics_report(self):
+        """Метрики операций и попадания кэшей - содержимое дампа --profile"""
+        return {
+            'operations': metrics.snapshot(),
+            'caches': {
+                'layouts': self.layout_cache.stats(),
+                'classifier': self.classifier.stats() if self.classifier else None,
+                'search': self.search_index.stats() if self.search_index.loaded else None
+            }
+        }
 
-        for item in items:
-            shortcut = Shortcut(
-                name=item['name'],
-                position=item['position'],
-                pidl=item['pidl']
-            )
+    def get_serializer(self):
+        if self.serializer is None:
+            self.serializer = LayoutSerializer()
+        return self.serializer
+
+    def get_classifier(self):
+        with self.classifier_lock:
+            if self.classifier is None:
+                resolver = LinkTargetResolver() if os.name == 'nt' else None
+                self.classifier = IconClassifier(resolve_target=resolver)
+            return self.classifier
+
+    @measured("classify_layout")
+    def classify_layout(self, layout, only_unknown=True):
+        """Заполнить icon_type ярлыков по правилам; возвращает число измененных"""
+        shortcuts = [s for s in layout.shortcuts if not only_unknown or s.icon_type == UNKNOWN_ICON_TYPE]
+        changed = 0
+        for shortcut, icon_type in zip(shortcuts, self.get_classifier().classify_many(shortcuts)):
+            if icon_type != shortcut.icon_type and icon_type != UNKNOWN_ICON_TYPE:
+                shortcut.update(icon_type=icon_type)
+                changed += 1
+        return changed
+
+    def make_shortcuts(self, items):
+        """Новые ярлыки для элементов рабочего стола, с типами при auto_classify"""
+        shortcuts = [Shortcut(name=item['name'], position=item['position'], pidl=item['pidl'])
+                     for item in items]
+        if self.auto_classify and shortcuts:
+            with metrics.phase("classify"):
+                types = self.get_classifier().classify_many(shortcuts)
+            for shortcut, icon_type in zip(shortcuts, types):
+                shortcut.icon_type = icon_type
+        return shortcuts
+
+    @measured("create_layout")
+    def create_layout(self, name, description="", progress=None):
+        """Создать новый layout из текущего рабочего стола
+
+        Вызывается в рабочем потоке, поэтому только возвращает layout,
+        не меняя current_layout.
+        """
+        layout = DesktopLayout(name, description)
+        for shortcut in self.make_shortcuts(self.get_desktop_items(progress)):
             layout.add_shortcut(shortcut)
-
-        self.current_layout = layout
         return layout
 
+    @staticmethod
+    def layout_filename(name):
+        """Имя файла layout: как при сохранении, либо уже готовое имя .json"""
+        if name.endswith('.json'):
+            return name
+        return f"{name.replace(' ', '_')}.json"
+
+    def get_journal(self, filepath):
+        return LayoutJournal(filepath, self.journal_lock)
+
+    @measured("save_layout")
     def save_layout(self, layout):
-        """Сохранить layout в файл"""
-        try:
-            filename = f"{layout.name.replace(' ', '_')}.json"
-            filepath = os.path.join(self.layouts_dir, filename)
+        """Сохранить layout в файл
 
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(layout.to_dict(), f, indent=2, ensure_ascii=False)
+        Загруженный layout пишется в тот же файл, даже если имя внутри файла
+        с ним не совпадает; новый - в файл по своему имени.
+        Правки ярлыков уже сохраненного layout дописываются в журнал,
+        полная атомарная перезапись - только для новых layouts и при смене состава.
+        """
+        try:
+            filepath = layout.source_path
+            if not filepath or os.path.dirname(filepath) != self.layouts_dir:
+                filepath = os.path.join(self.layouts_dir, self.layout_filename(layout.name))
+            filename = os.path.basename(filepath)
+            journal = self.get_journal(filepath)
+
+            if (layout.source_path == filepath and not layout.structure_changed
+                    and os.path.exists(filepath)):
+                entries = layout.pop_journal_entries()
+                if entries:
+                    base_key = LayoutCache.file_key(filepath, journal.path)
+                    journal.append(entries)
+                    key = LayoutCache.file_key(filepath, journal.path)
+                    if journal.size() > LayoutJournal.COMPACT_THRESHOLD:
+                        journal.compact_in_background(lambda e: self.show_error(
+                            "Ошибка", f"Не удалось сжать журнал {journal.path}: {e}"))
+                        self.layout_cache.invalidate(filepath)
+                    else:
+                        self.layout_cache.put(filepath, key, layout)
+                    self.catalog.record(filename, layout)
+                    # После фонового сжатия версия файла сменится, и поиск перечитает его сам
+                    self.search_index.record_changes(filename, layout, base_key, key, entries)
+                return True
 
+            with self.journal_lock:
+                atomic_write(filepath, lambda f: self.get_serializer().write(f, layout))
+                if os.path.exists(journal.path):
+                    os.remove(journal.path)
+            layout.mark_saved(filepath)
+            key = LayoutCache.file_key(filepath, journal.path)
+            self.layout_cache.put(filepath, key, layout)
+            self.catalog.record(filename, layout)
+            self.search_index.record(filename, layout, key)
             return True
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось сохранить layout: {e}")
+            self.show_error("Ошибка", f"Не удалось сохранить layout: {e}")
             return False
 
-    def load_layout(self, filename):
-        """Загрузить layout из файлa"""
+    def layout_key(self, name):
+        """Ключ истории layout - имя его файла без расширения"""
+        return self.layout_filename(name)[:-len('.json')]
+
+    @measured("snapshot_layout")
+    def snapshot_layout(self, layout):
+        """Добавить layout в историю снимков"""
         try:
-            filepath = os.path.join(self.layouts_dir, filename)
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            return self.history.commit(self.layout_key(layout.name), layout)
+        except Exception as e:
+            self.show_error("Ошибка", f"Не удалось сохранить снимок: {e}")
+            return None
 
-            self.current_layout = DesktopLayout.from_dict(data)
+    def list_snapshots(self, name):
+        return self.history.list_snapshots(self.layout_key(name))
+
+    @measured("load_layout")
+    def load_layout(self, filename, snapshot=None):
+        """Загрузить layout из файлa или, если указан snapshot, из истории"""
+        if snapshot is not None:
+            try:
+                self.current_layout = self.history.load(self.layout_key(filename), snapshot)
+                return self.current_layout
+            except Exception as e:
+                self.show_error("Ошибка", f"Не удалось загрузить снимок {snapshot}: {e}")
+                return None
+        try:
+            filepath = os.path.join(self.layouts_dir, filename)
+            journal = self.get_journal(filepath)
+            with self.journal_lock:
+                key = LayoutCache.file_key(filepath, journal.path)
+                layout = self.layout_cache.get(filepath, key)
+                # Несохраненные правки в кэшированном объекте не должны выдаваться за файл
+                if layout is not None and (layout.dirty_shortcuts or layout.structure_changed):
+                    layout = None
+                if layout is None:
+                    # Файл разбирается потоково, под блокировкой: сжатие журнала не подменит его посреди чтения
+                    entries = journal.read_entries()
+                    with open(filepath, 'r', encoding='utf-8') as f:
+                        if metrics.enabled:
+                            metrics.count('bytes_read', os.fstat(f.fileno()).st_size)
+                        try:
+                            layout = self.get_serializer().read(f, entries)
+                        except JournalMismatch:
+                            f.seek(0)
+                            layout = DesktopLayout.from_dict(LayoutJournal.apply(json.load(f), entries))
+                    layout.mark_saved(filepath, layout.version)
+                    self.layout_cache.put(filepath, key, layout)
+            self.current_layout = layout
             return self.current_layout
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить layout: {e}")
+            self.show_error("Ошибка", f"Не удалось загрузить layout: {e}")
             return None
 
     def get_saved_layouts(self):
         """Получить список сохраненных layouts"""
-        layouts = []
         try:
-            for filename in os.listdir(self.layouts_dir):
-                if filename.endswith('.json'):
-                    layouts.append(filename)
-        except:
-            pass
-        return layouts
+            return self.catalog.list_layouts()
+        except OSError:
+            return []
+
+    def get_layout_info(self, filename):
+        """Метаданные layout из каталога без разбора ярлыков"""
+        try:
+            return self.catalog.get(filename)
+        except OSError:
+            return None
+
+    @measured("search_shortcuts")
+    def search_shortcuts(self, query, limit=None, progress=None):
+        """Найти ярлыки во всех сохраненных layouts, см. SearchQuery"""
+        try:
+            self.search_index.refresh(progress)
+            return self.search_index.search(query, limit)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            self.show_error("Ошибка", f"Не удалось выполнить поиск: {e}")
+            return []
 
     def delete_layout(self, filename):
         """Удалить layout"""
@@ -257,280 +2824,782 @@ class DesktopIconManager:
             filepath = os.path.join(self.layouts_dir, filename)
             if os.path.exists(filepath):
                 os.remove(filepath)
+                self.get_journal(filepath).discard()
+                self.layout_cache.invalidate(filepath)
+                self.catalog.forget(filename)
+                self.search_index.forget(filename)
                 return True
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось удалить layout: {e}")
+            self.show_error("Ошибка", f"Не удалось удалить layout: {e}")
         return False
 
-    def restore_layout(self, layout):
-        """Восстановить layout на рабочем столе"""
+    @measured("plan_restore")
+    def plan_restore(self, layout, current_items=None, tolerance=None, progress=None):
+        """Построить план восстановления по индексам PIDL и имен"""
+        if current_items is None:
+            current_items = self.get_desktop_items(progress)
+        return RestorePlan.build(layout, current_items, tolerance)
+
+    def stream_shortcuts(self, filename):
+        """Ярлыки файла layout по одному, с примененным журналом, без DesktopLayout и кэша
+
+        Файл и журнал открываются сразу, ошибка открытия показывается и
+        дает None; дальше файл разбирается по мере чтения генератора.
+        """
+        filepath = os.path.join(self.layouts_dir, filename)
+        try:
+            with self.journal_lock:
+                entries = self.get_journal(filepath).read_entries()
+                f = open(filepath, 'r', encoding='utf-8')
+        except OSError as e:
+            self.show_error("Ошибка", f"Не удалось открыть layout: {e}")
+            return None
+        return self.iter_file_shortcuts(f, entries)
+
+    def iter_file_shortcuts(self, f, entries):
+        with f:
+            _, records = self.get_serializer().read_records(f)
+            if entries:
+                records = LayoutJournal.apply_stream(records, entries)
+            count = 0
+            try:
+                for record in records:
+                    yield Shortcut.from_dict(record)
+                    count += 1
+            except JournalMismatch:
+                # Журнал не сходится с файлом по индексам: остаток - из полного разбора
+                f.seek(0)
+                data = LayoutJournal.apply(json.load(f), entries)
+                for record in data.get('shortcuts', [])[count:]:
+                    yield Shortcut.from_dict(record)
+
+    def diff_layouts(self, old_layout, new_filename, tolerance=0):
+        """Потоковый диф layout с файлом new_filename
+
+        Индексируется только old_layout; вторая сторона читается по одному
+        ярлыку и не попадает в кэш layouts. None, если файл не открылся.
+        """
+        new_shortcuts = self.stream_shortcuts(new_filename)
+        if new_shortcuts is None:
+            return None
+        return diff_shortcuts(old_layout.shortcuts, new_shortcuts, tolerance)
+
+    @measured("preview_restore")
+    def preview_restore(self, layout, tolerance=None, progress=None):
+        """Что изменит restore_layout: генератор DiffEntry по плану восстановления
+
+        moved - иконки, которые будут перемещены, added - ярлыки layout,
+        которых нет на столе, ambiguous - ярлыки, имя которых носят несколько
+        иконок (их восстановление пропустит), removed - иконки стола, которых нет в layout.
+        Рабочий стол перечисляется и план строится при вызове, записи - по мере чтения.
+        """
+        items = self.get_desktop_items(progress)
+        if tolerance is None:
+            tolerance = self.restore_tolerance or 0
+        return RestorePlan.build(layout, items, tolerance).diff_entries(items)
+
+    @measured("arrange_layout")
+    def arrange_layout(self, layout, name=None, regions=None, keep=(), progress=None):
+        """Новый layout, в котором иконки layout разложены по типам и важности
+
+        Регионы - мониторы подключенного рабочего стола; без него раскладка идет
+        в пределах высоты, занятой иконками сейчас, и продолжается вправо.
+        Результат применяется обычным restore_layout.
+        """
+        try:
+            spacing = self.backend.get_spacing() if self.backend else DEFAULT_ICON_SPACING
+            if regions is None and self.backend:
+                regions = self.backend.get_regions()
+            overflow = not regions
+            if not regions:
+                regions = [layout_region(layout.shortcuts, spacing)]
+            arranger = LayoutArranger(regions, spacing, overflow=overflow)
+            return arranger.arrange(layout, name or f"{layout.name} упорядочено", keep, progress)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            self.show_error("Ошибка", f"Не удалось упорядочить иконки: {e}")
+            return None
+
+    @measured("restore_layout")
+    def restore_layout(self, layout, delta=True, progress=None):
+        """Восстановить layout на рабочем столе
+
+        В режиме delta перемещаются только иконки, сдвинутые дальше restore_tolerance.
+        Возвращает количество иконок, стоящих на своих местах после восстановления.
+        """
         if not layout:
             return 0
 
-        restored_count = 0
-        current_items = self.get_desktop_items()
+        # Перечисление стола - большая часть восстановления: прогресс и отмена работают и в нем
+        plan = self.plan_restore(layout, tolerance=self.restore_tolerance if delta else None, progress=progress)
+        self.last_restore_plan = plan
+
+        total = len(plan.moves)
+        with metrics.phase("move_items"):
+            for done, (shortcut, current_item) in enumerate(plan.moves, 1):
+                try:
+                    self.backend.position_item(current_item['index'], shortcut.position)
+                    plan.moves_issued += 1
+                except Exception as e:
+                    plan.failures.append((shortcut, str(e)))
+                if progress:
+                    progress(done, total)
+
+        if plan.failures:
+            # Одно сообщение на восстановление, а не на каждую иконку
+            failed = ", ".join(f"{shortcut.name} ({error})" for shortcut, error in plan.failures[:5])
+            more = f" и еще {len(plan.failures) - 5}" if len(plan.failures) > 5 else ""
+            self.show_error("Ошибка", f"Не удалось переместить {len(plan.failures)} иконок: {failed}{more}")
+        return plan.moves_issued + plan.moves_skipped
+
+
+class DesktopWatcher:
+    """Режим наблюдения: дешевый опрос рабочего стола и отложенное обновление layout
+
+    Каждый опрос сравнивает число элементов - один вызов ItemCount. Отпечаток
+    PIDL и позиций стоит столько же, сколько перечисление без имен (1 + 2N
+    вызовов COM: Item и GetItemPosition на иконку), поэтому в простое он
+    снимается только каждые fingerprint_every опросов; перемещение без
+    смены числа иконок замечается с задержкой до interval * fingerprint_every.
+    Пока изменение не устоялось, отпечаток проверяется на каждом опросе.
+    Имена и полное перечисление запрашиваются только после изменения. Серия
+    перемещений откладывается, пока стол не простоит debounce секунд, и
+    переносится в layout одним обновлением: правки позиций уходят в журнал,
+    добавления и удаления - полной записью.
+    """
+
+    def __init__(self, manager, layout, interval=2.0, debounce=1.0, save=True, fingerprint_every=5,
+                 clock=time.monotonic):
+        self.manager = manager
+        self.layout = layout
+        self.interval = interval
+        self.debounce = debounce
+        self.save = save
+        self.fingerprint_every = max(1, fingerprint_every)
+        self.clock = clock
+        # Последнее известное состояние стола - исходно то, что записано в layout
+        self.count = len(layout.shortcuts)
+        self.fingerprint = items_fingerprint((s.pidl, s.position) for s in layout.shortcuts)
+        self.changed_at = None  # время последнего замеченного изменения, None - изменений нет
+        self.polls = 0
+        self.syncs = 0
+
+    @measured("watch_poll")
+    def poll(self, progress=None):
+        """Один опрос; возвращает элементы рабочего стола, когда пора обновить layout"""
+        backend = self.manager.backend
+        if not backend:
+            self.manager.initialize_com()
+            backend = self.manager.backend
+            if not backend:
+                return None
+        self.polls += 1
+        now = self.clock()
+        count = backend.get_item_count()
+        if count != self.count:
+            # Отпечаток не нужен: изменение уже видно, его снимет полное перечисление
+            self.count, self.fingerprint = count, None
+            self.changed_at = now
+        elif (self.changed_at is not None or self.fingerprint is None
+              or self.polls % self.fingerprint_every == 0):
+            fingerprint = backend.get_fingerprint()
+            if fingerprint != self.fingerprint:
+                if self.fingerprint is not None:
+                    self.changed_at = now
+                self.fingerprint = fingerprint
+        if self.changed_at is None or now - self.changed_at < self.debounce:
+            return None
 
-        for shortcut in layout.shortcuts:
-            for current_item in current_items:
-                if (shortcut.name == current_item['name'] or
-                        shortcut.pidl == current_item['pidl']):
-                    try:
-                        self.folder_view.SelectAndPositionItem(
-                            current_item['index'],
-                            shortcut.position,
-                            shellcon.SVSI_POSITIONITEM
-                        )
-                        restored_count += 1
-                        break
-                    except Exception as e:
-                        print(f"Ошибка при восстановлении {shortcut.name}: {e}")
+        self.changed_at = None
+        items = self.manager.get_desktop_items(progress)
+        self.count = len(items)
+        self.fingerprint = items_fingerprint((item['pidl'], item['position']) for item in items)
+        return items
+
+    @measured("watch_apply")
+    def apply(self, items):
+        """Перенести состояние рабочего стола в layout; возвращает число изменений"""
+        layout = self.layout
+        remaining = {pidl: layout.shortcuts_with_pidl(pidl) for pidl in layout.by_pidl}
+        new_items = []
+        changes = 0
+        for item in items:
+            same_pidl = remaining.get(item['pidl'])
+            if not same_pidl:
+                new_items.append(item)
+                continue
+            shortcut = same_pidl.pop(0)
+            fields = {}
+            if shortcut.position != item['position']:
+                fields['position'] = item['position']
+            if shortcut.name != item['name']:
+                fields['name'] = item['name']
+            if fields:
+                shortcut.update(**fields)
+                changes += 1
+
+        for same_pidl in remaining.values():
+            for shortcut in same_pidl:
+                layout.remove_shortcut_by_id(shortcut.id)
+                changes += 1
+        for shortcut in self.manager.make_shortcuts(new_items):
+            layout.add_shortcut(shortcut)
+            changes += 1
 
-        return restored_count
+        if changes:
+            self.syncs += 1
+            if self.save:
+                self.manager.save_layout(layout)
+        return changes
 
+    def step(self):
+        """Опрос и, если пора, обновление layout в одном потоке"""
+        items = self.poll()
+        return self.apply(items) if items is not None else 0
 
-class IconEditorDialog(simpledialog.Dialog):
-    def __init__(self, parent, shortcut, title="Редактирование ярлыка"):
-        self.shortcut = shortcut
-        super().__init__(parent, title)
+    def run(self, stop_event, on_update=None):
+        """Наблюдать до stop_event; on_update(число изменений) после каждого обновления"""
+        while not stop_event.is_set():
+            changes = self.step()
+            if changes and on_update:
+                on_update(changes)
+            stop_event.wait(self.interval)
 
-    def body(self, frame):
-        ttk.Label(frame, text="Название:").grid(row=0, column=0, sticky="w", padx=5, pady=5)
-        self.name_var = tk.StringVar(value=self.shortcut.name)
-        ttk.Entry(frame, textvariable=self.name_var, width=30).grid(row=0, column=1, padx=5, pady=5)
 
-        ttk.Label(frame, text="Тип:").grid(row=1, column=0, sticky="w", padx=5, pady=5)
-        self.type_var = tk.StringVar(value=self.shortcut.icon_type)
-        type_combo = ttk.Combobox(frame, textvariable=self.type_var, values=list(ICON_TYPES.keys()))
-        type_combo.grid(row=1, column=1, padx=5, pady=5)
+class JobCancelled(Exception):
+    """Задача отменена пользователем"""
 
-        ttk.Label(frame, text="Важность (1-5):").grid(row=2, column=0, sticky="w", padx=5, pady=5)
-        self.importance_var = tk.IntVar(value=self.shortcut.importance)
-        ttk.Spinbox(frame, from_=1, to=5, textvariable=self.importance_var, width=5).grid(row=2, column=1, padx=5,
-                                                                                          pady=5)
 
-        ttk.Label(frame, text="Описание:").grid(row=3, column=0, sticky="w", padx=5, pady=5)
-        self.desc_var = tk.StringVar(value=self.shortcut.description)
-        ttk.Entry(frame, textvariable=self.desc_var, width=30).grid(row=3, column=1, padx=5, pady=5)
+class CallbackQueue:
+    """Очередь колбэков из рабочего потока; pump() выполняет их в потоке-владельце"""
 
-        ttk.Label(frame, text="Теги (через запятую):").grid(row=4, column=0, sticky="w", padx=5, pady=5)
-        self.tags_var = tk.StringVar(value=", ".join(self.shortcut.tags))
-        ttk.Entry(frame, textvariable=self.tags_var, width=30).grid(row=4, column=1, padx=5, pady=5)
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
 
-        return frame
+    def __call__(self, func, *args):
+        self.queue.put((func, args))
 
-    def apply(self):
-        self.shortcut.update(
-            name=self.name_var.get(),
-            icon_type=self.type_var.get(),
-            importance=self.importance_var.get(),
-            description=self.desc_var.get(),
-            tags=[tag.strip() for tag in self.tags_var.get().split(',') if tag.strip()]
-        )
+    def pump(self):
+        while True:
+            try:
+                func, args = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            func(*args)
 
 
-class DesktopIconApp:
+class TkCallbackQueue(CallbackQueue):
+    """CallbackQueue, которую главный цикл Tk разбирает через root.after"""
+
+    POLL_INTERVAL = 50  # мс
+
     def __init__(self, root):
+        super().__init__()
         self.root = root
-        self.root.title("Продвинутый менеджер рабочего стола")
-        self.root.geometry("800x600")
+        self.root.after(self.POLL_INTERVAL, self.poll)
 
-        self.manager = DesktopIconManager()
-        self.current_layout = None
+    def poll(self):
+        self.pump()
+        self.root.after(self.POLL_INTERVAL, self.poll)
 
-        self.setup_ui()
-        self.refresh_layouts_list()
-
-    def setup_ui(self):
-        """Настройка пользовательского интерфейса"""
-        # Основные фреймы
-        main_frame = ttk.Frame(self.root, padding=10)
-        main_frame.pack(fill=tk.BOTH, expand=True)
-
-        # Левая панель - управление layouts
-        left_frame = ttk.LabelFrame(main_frame, text="Управление сохранениями", padding=10)
-        left_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 10))
-
-        # Правая панель - редактирование
-        right_frame = ttk.LabelFrame(main_frame, text="Редактирование ярлыков", padding=10)
-        right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
-
-        # Левая панель - элементы
-        ttk.Button(left_frame, text="Создать новое сохранение",
-                   command=self.create_new_layout).pack(pady=5, fill=tk.X)
-
-        ttk.Label(left_frame, text="Сохраненные layouts:").pack(pady=(10, 5), anchor="w")
-
-        self.layouts_listbox = tk.Listbox(left_frame, height=10)
-        self.layouts_listbox.pack(fill=tk.BOTH, expand=True, pady=5)
-        self.layouts_listbox.bind('<<ListboxSelect>>', self.on_layout_select)
-
-        button_frame = ttk.Frame(left_frame)
-        button_frame.pack(fill=tk.X, pady=5)
-
-        ttk.Button(button_frame, text="Загрузить",
-                   command=self.load_selected_layout).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
-        ttk.Button(button_frame, text="Удалить",
-                   command=self.delete_selected_layout).pack(side=tk.RIGHT, fill=tk.X, expand=True, padx=2)
-
-        ttk.Button(left_frame, text="Восстановить на рабочий стол",
-                   command=self.restore_current_layout).pack(pady=5, fill=tk.X)
-
-        # Правая панель - Treeview для ярлыков
-        self.setup_shortcuts_tree(right_frame)
-
-        # Статусная строка
-        self.status_var = tk.StringVar(value="Готов к работе")
-        status_label = ttk.Label(main_frame, textvariable=self.status_var,
-                                 foreground="green", font=('Arial', 9))
-        status_label.pack(side=tk.BOTTOM, fill=tk.X, pady=5)
-
-    def setup_shortcuts_tree(self, parent):
-        """Настройка TreeView для ярлыков"""
-        # Создаем фрейм для TreeView и скроллбара
-        tree_frame = ttk.Frame(parent)
-        tree_frame.pack(fill=tk.BOTH, expand=True, pady=5)
-
-        # Создаем TreeView с правильными колонками
-        self.shortcuts_tree = ttk.Treeview(tree_frame, columns=('name', 'type', 'importance', 'description'),
-                                           show='headings', height=15)
-
-        # Настраиваем заголовки колонок
-        self.shortcuts_tree.heading('name', text='Название')
-        self.shortcuts_tree.heading('type', text='Тип')
-        self.shortcuts_tree.heading('importance', text='Важность')
-        self.shortcuts_tree.heading('description', text='Описание')
-
-        # Настраиваем ширину колонок
-        self.shortcuts_tree.column('name', width=150)
-        self.shortcuts_tree.column('type', width=100)
-        self.shortcuts_tree.column('importance', width=80)
-        self.shortcuts_tree.column('description', width=200)
-
-        # Добавляем скроллбар
-        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.shortcuts_tree.yview)
-        self.shortcuts_tree.configure(yscrollcommand=scrollbar.set)
-
-        # Размещаем TreeView и скроллбар
-        self.shortcuts_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        # Биндим события
-        self.shortcuts_tree.bind('<Double-1>', self.on_shortcut_double_click)
-
-        # Кнопки редактирования
-        edit_frame = ttk.Frame(parent)
-        edit_frame.pack(fill=tk.X, pady=5)
-
-        ttk.Button(edit_frame, text="Редактировать",
-                   command=self.edit_selected_shortcut).pack(side=tk.LEFT, padx=2)
-        ttk.Button(edit_frame, text="Сохранить изменения",
-                   command=self.save_current_layout).pack(side=tk.RIGHT, padx=2)
-
-    def refresh_layouts_list(self):
-        """Обновить список layouts"""
-        self.layouts_listbox.delete(0, tk.END)
-        for layout_file in self.manager.get_saved_layouts():
-            self.layouts_listbox.insert(tk.END, layout_file)
-
-    def create_new_layout(self):
-        """Создать новое сохранение"""
-        name = simpledialog.askstring("Новое сохранение", "Введите название сохранения:")
-        if name:
-            description = simpledialog.askstring("Описание", "Введите описание (необязательно):")
-            layout = self.manager.create_layout(name, description or "")
-            if self.manager.save_layout(layout):
-                self.current_layout = layout
-                self.refresh_layouts_list()
-                self.update_shortcuts_tree()
-                self.status_var.set(f"Создано сохранение: {name}")
-
-    def load_selected_layout(self):
-        """Загрузить выбранное сохранение"""
-        selection = self.layouts_listbox.curselection()
-        if selection:
-            filename = self.layouts_listbox.get(selection[0])
-            layout = self.manager.load_layout(filename)
-            if layout:
-                self.current_layout = layout
-                self.update_shortcuts_tree()
-                self.status_var.set(f"Загружено: {layout.name}")
-
-    def delete_selected_layout(self):
-        """Удалить выбранное сохранение"""
-        selection = self.layouts_listbox.curselection()
-        if selection:
-            filename = self.layouts_listbox.get(selection[0])
-            if messagebox.askyesno("Подтверждение", f"Удалить сохранение {filename}?"):
-                if self.manager.delete_layout(filename):
-                    self.refresh_layouts_list()
-                    self.status_var.set(f"Удалено: {filename}")
-
-    def restore_current_layout(self):
-        """Восстановить текущий layout на рабочий стол"""
-        if self.current_layout:
-            count = self.manager.restore_layout(self.current_layout)
-            self.status_var.set(f"Восстановлено {count} иконок")
-        else:
-            messagebox.showwarning("Внимание", "Сначала загрузите сохранение!")
-
-    def update_shortcuts_tree(self):
-        """Обновить дерево ярлыков"""
-        self.shortcuts_tree.delete(*self.shortcuts_tree.get_children())
-        if self.current_layout:
-            for shortcut in self.current_layout.shortcuts:
-                self.shortcuts_tree.insert('', 'end', values=(
-                    shortcut.name,
-                    shortcut.icon_type,
-                    shortcut.importance,
-                    shortcut.description
-                ))
-
-    def on_shortcut_double_click(self, event):
-        """Обработчик двойного клика по ярлыку"""
-        self.edit_selected_shortcut()
-
-    def edit_selected_shortcut(self):
-        """Редактировать выбранный ярлык"""
-        selection = self.shortcuts_tree.selection()
-        if selection and self.current_layout:
-            item = self.shortcuts_tree.item(selection[0])
-            shortcut_name = item['values'][0]
-
-            # Найти shortcut по имени
-            for shortcut in self.current_layout.shortcuts:
-                if shortcut.name == shortcut_name:
-                    dialog = IconEditorDialog(self.root, shortcut)
-                    if dialog.result:
-                        self.update_shortcuts_tree()
-                        self.status_var.set(f"Обновлен: {shortcut.name}")
-                    break
 
-    def save_current_layout(self):
-        """Сохранить текущий layout"""
-        if self.current_layout:
-            if self.manager.save_layout(self.current_layout):
-                self.status_var.set(f"Сохранено: {self.current_layout.name}")
-            else:
-                self.status_var.set("Ошибка сохранения")
-        else:
-            messagebox.showwarning("Внимание", "Нет активного сохранения!")
+class Job:
+    """Задача рабочего потока с отменой и прогрессом"""
 
-    def on_layout_select(self, event):
-        """Обработчик выбора layout"""
-        self.load_selected_layout()
+    PROGRESS_INTERVAL = 0.05  # секунд между обновлениями прогресса в UI
 
+    def __init__(self, dispatch, on_done=None, on_error=None, on_progress=None):
+        self.dispatch = dispatch
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.cancel_event = threading.Event()
+        self.last_progress = 0.0
+        self.future = None
 
-def main():
-    """Основная функция"""
-    pythoncom.CoInitialize()
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def report_progress(self, done, total):
+        """Колбэк прогресса для операций менеджера; в нем же проверяется отмена"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+        if self.on_progress:
+            now = time.monotonic()
+            if done == total or now - self.last_progress >= self.PROGRESS_INTERVAL:
+                self.last_progress = now
+                self.dispatch(self.on_progress, done, total)
+
+    def run(self, func, args):
+        try:
+            result = func(*args, progress=self.report_progress)
+        except Exception as e:
+            if self.on_error:
+                self.dispatch(self.on_error, e)
+            return None
+        if self.on_done:
+            self.dispatch(self.on_done, result)
+        return result
 
+
+class JobRunner:
+    """Выделенный рабочий поток со своим COM-апартаментом для захвата и восстановления"""
+
+    def __init__(self, dispatch=None):
+        from concurrent.futures import ThreadPoolExecutor
+        self.dispatch = dispatch or CallbackQueue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="desktop-com",
+                                           initializer=self.init_thread)
+        self.jobs = []  # незавершенные задачи - для отмены при shutdown
+
+    @staticmethod
+    def init_thread():
+        try:
+            load_win32()
+        except ImportError:
+            return
+        pythoncom.CoInitialize()
+
+    def submit(self, func, *args, on_done=None, on_error=None, on_progress=None):
+        """Запустить func(*args, progress=...) в рабочем потоке"""
+        job = Job(self.dispatch, on_done, on_error, on_progress)
+        job.future = self.executor.submit(job.run, func, args)
+        self.jobs = [other for other in self.jobs if not other.done()]
+        self.jobs.append(job)
+        return job
+
+    def shutdown(self):
+        """Отменить задачи и освободить COM в рабочем потоке после текущей задачи"""
+        for job in self.jobs:
+            job.cancel()
+            job.future.cancel()
+        # Без cancel_futures: иначе CoUninitialize отменится вместе с задачами, пока одна из них выполняется
+        if pythoncom:
+            self.executor.submit(pythoncom.CoUninitialize)
+        self.executor.shutdown(wait=False)
+
+
+class PagedShortcutsTree:
+    """Синхронизация Treeview с layout: правки по строкам, постраничный вывод
+
+    В виджете существуют только строки текущей страницы; при обновлении
+    строки сравниваются с уже показанными, и Tk получает только разницу.
+    """
+
+    PAGE_SIZE = 500
+
+    def __init__(self, tree, page_size=PAGE_SIZE):
+        self.tree = tree
+        self.page_size = page_size  # None - без постраничного вывода
+        self.rows = OrderedDict()   # iid -> значения строк, которые сейчас в виджете
+        self.layout = None
+        self.page = 0
+
+    @staticmethod
+    def row_values(shortcut):
+        return (shortcut.name, shortcut.icon_type, shortcut.importance, shortcut.description)
+
+    def page_count(self):
+        if not self.layout or not self.page_size:
+            return 1
+        return max(1, -(-len(self.layout.shortcuts) // self.page_size))
+
+    def page_label(self):
+        total = len(self.layout.shortcuts) if self.layout else 0
+        if not total:
+            return ""
+        if not self.page_size:
+            return f"{total} ярлыков"
+        first = self.page * self.page_size
+        last = min(total, first + self.page_size)
+        return f"{first + 1}-{last} из {total}"
+
+    def visible_shortcuts(self):
+        if not self.layout:
+            return []
+        if not self.page_size:
+            return self.layout.shortcuts
+        first = self.page * self.page_size
+        return self.layout.shortcuts[first:first + self.page_size]
+
+    def show(self, layout):
+        """Показать layout; для другого layout начать с первой страницы"""
+        if layout is not self.layout:
+            self.layout = layout
+            self.page = 0
+        self.refresh()
+
+    def set_page(self, page):
+        page = min(max(page, 0), self.page_count() - 1)
+        if page != self.page:
+            self.page = page
+            self.refresh()
+
+    def refresh(self):
+        """Привести строки виджета к текущей странице, трогая только изменившиеся"""
+        self.page = min(self.page, self.page_count() - 1)
+        target = OrderedDict((str(s.id), self.row_values(s)) for s in self.visible_shortcuts())
+
+        removed = [iid for iid in self.rows if iid not in target]
+        if removed:
+            self.tree.delete(*removed)
+            for iid in removed:
+                del self.rows[iid]
+
+        # id ярлыков возрастают в порядке layout, поэтому оставшиеся строки уже упорядочены
+        for index, (iid, values) in enumerate(target.items()):
+            current = self.rows.get(iid)
+            if current is None:
+                self.tree.insert('', index, iid=iid, values=values)
+            elif current != values:
+                self.tree.item(iid, values=values)
+        self.rows = target
+
+    def update_row(self, shortcut):
+        """Обновить одну строку после редактирования ярлыка"""
+        iid = str(shortcut.id)
+        values = self.row_values(shortcut)
+        if iid in self.rows and self.rows[iid] != values:
+            self.tree.item(iid, values=values)
+            self.rows[iid] = values
+
+
+def print_result(result, as_json):
+    if as_json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    for key, value in result.items():
+        if isinstance(value, list):
+            print(f"{key}:")
+            for entry in value:
+                print(f"  {entry}")
+        else:
+            print(f"{key}: {value}")
+
+
+def cli_error(title, message):
+    print(f"{title}: {message}", file=sys.stderr)
+
+
+def cli_connect_desktop(manager):
+    """Подключиться к рабочему столу до операции, которой он нужен"""
+    if not manager.backend:
+        manager.initialize_com()
+    return manager.backend is not None
+
+
+def cli_list(manager, args):
+    layouts = []
+    for filename in manager.get_saved_layouts():
+        info = manager.get_layout_info(filename) or {}
+        layouts.append({
+            'file': filename,
+            'name': info.get('name', ''),
+            'shortcuts': info.get('shortcut_count', 0),
+            'modified': info.get('modified', '')
+        })
+    if args.json:
+        print(json.dumps(layouts, ensure_ascii=False, indent=2))
+    else:
+        for layout in layouts:
+            print(f"{layout['file']}\t{layout['shortcuts']}\t{layout['modified'][:16]}\t{layout['name']}")
+    return 0
+
+
+def cli_capture(manager, args):
+    if not cli_connect_desktop(manager):
+        return 1
+    layout = manager.create_layout(args.name, args.description)
+    if not manager.save_layout(layout):
+        return 1
+    print_result({
+        'file': manager.layout_filename(layout.name),
+        'shortcuts': len(layout.shortcuts)
+    }, args.json)
+    return 0
+
+
+def cli_snapshot(manager, args):
+    if not cli_connect_desktop(manager):
+        return 1
+    layout = manager.create_layout(args.name, args.description)
+    snapshot_id = manager.snapshot_layout(layout)
+    if not snapshot_id:
+        return 1
+    print_result({'layout': manager.layout_key(args.name), 'snapshot': snapshot_id,
+                  'shortcuts': len(layout.shortcuts)}, args.json)
+    return 0
+
+
+def cli_classify(manager, args):
+    layout = manager.load_layout(manager.layout_filename(args.layout))
+    if not layout:
+        return 1
+    changed = manager.classify_layout(layout, only_unknown=not args.all)
+    if changed and not manager.save_layout(layout):
+        return 1
+    counts = {}
+    for shortcut in layout.shortcuts:
+        counts[shortcut.icon_type] = counts.get(shortcut.icon_type, 0) + 1
+    print_result({'changed': changed, 'types': counts}, args.json)
+    return 0
+
+
+def parse_region(value):
+    """Регион монитора из строки ШИРИНАxВЫСОТА[+X+Y]"""
+    match = re.fullmatch(r"(\d+)x(\d+)(?:\+(-?\d+)\+(-?\d+))?", value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"ожидается ШИРИНАxВЫСОТА[+X+Y], получено {value!r}")
+    width, height, x, y = match.groups()
+    return (int(x or 0), int(y or 0), int(width), int(height))
+
+
+def cli_arrange(manager, args):
+    if args.apply and not cli_connect_desktop(manager):
+        return 1
+    layout = manager.load_layout(manager.layout_filename(args.layout))
+    if not layout:
+        return 1
+    keep = [shortcut.id for shortcut in layout.shortcuts if shortcut.icon_type in args.keep_type]
+    arranged = manager.arrange_layout(layout, args.name, args.region or None, keep)
+    if not arranged or not manager.save_layout(arranged):
+        return 1
+    result = {'file': manager.layout_filename(arranged.name), 'shortcuts': len(arranged.shortcuts)}
+    if args.apply:
+        result['restored'] = manager.restore_layout(arranged)
+        result.update(manager.last_restore_plan.stats())
+    print_result(result, args.json)
+    return 0
+
+
+def cli_watch(manager, args):
+    if not cli_connect_desktop(manager):
+        return 1
+    filename = manager.layout_filename(args.name)
+    if os.path.exists(os.path.join(manager.layouts_dir, filename)):
+        layout = manager.load_layout(filename)
+    else:
+        layout = manager.create_layout(args.name)
+        if not manager.save_layout(layout):
+            return 1
+    if not layout:
+        return 1
+
+    watcher = DesktopWatcher(manager, layout, args.interval, args.debounce,
+                             fingerprint_every=args.fingerprint_every)
+
+    def on_update(changes):
+        result = {'time': datetime.now().isoformat(timespec='seconds'), 'changes': changes,
+                  'shortcuts': len(layout.shortcuts)}
+        # Одна строка JSON на обновление - вывод можно читать построчно
+        print(json.dumps(result, ensure_ascii=False) if args.json else
+              f"{result['time']}\tизменений: {changes}\tярлыков: {result['shortcuts']}", flush=True)
+
+    print(f"Наблюдение за рабочим столом, layout {filename}. Ctrl+C - остановить", file=sys.stderr)
+    try:
+        watcher.run(threading.Event(), on_update)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cli_history(manager, args):
+    snapshots = manager.list_snapshots(args.layout)
+    if args.json:
+        print(json.dumps(snapshots, ensure_ascii=False, indent=2))
+    else:
+        for snapshot_id in snapshots:
+            print(snapshot_id)
+    return 0
+
+
+def cli_search(manager, args):
+    hits = manager.search_shortcuts(" ".join(args.query), args.limit)
+    if args.json:
+        print(json.dumps(hits, ensure_ascii=False, indent=2))
+    else:
+        for hit in hits:
+            tags = ",".join(hit['tags'])
+            print(f"{hit['file']}\t{hit['index']}\t{hit['icon_type']}\t{hit['importance']}\t{tags}\t{hit['name']}")
+    return 0
+
+
+def cli_restore(manager, args):
+    if not cli_connect_desktop(manager):
+        return 1
+    if args.tolerance is not None:
+        manager.restore_tolerance = args.tolerance
+    layout = manager.load_layout(manager.layout_filename(args.layout), snapshot=args.snapshot)
+    if not layout:
+        return 1
+    count = manager.restore_layout(layout, delta=not args.full)
+    result = {'restored': count}
+    result.update(manager.last_restore_plan.stats())
+    print_result(result, args.json)
+    return 0
+
+
+def cli_diff(manager, args):
+    layout = manager.load_layout(manager.layout_filename(args.layout))
+    if not layout:
+        return 1
+    if args.against:
+        # Второй layout не собирается целиком: его ярлыки читаются из файла по одному
+        entries = manager.diff_layouts(layout, manager.layout_filename(args.against), args.tolerance)
+        if entries is None:
+            return 1
+    else:
+        # Без второго layout - сравнение с текущим рабочим столом
+        if not cli_connect_desktop(manager):
+            return 1
+        # То же сопоставление, что и при восстановлении: неоднозначные имена не перемещаются
+        entries = manager.preview_restore(layout, args.tolerance)
+
+    # Записи выводятся по мере появления, список записей не собирается
+    summary = {DiffEntry.ADDED: 0, DiffEntry.REMOVED: 0, DiffEntry.MOVED: 0, DiffEntry.CHANGED: 0,
+               DiffEntry.AMBIGUOUS: 0}
+    if args.json:
+        print("[")
+    try:
+        for count, entry in enumerate(entries):
+            summary[entry.kind] += 1
+            if args.json:
+                print(("," if count else "") + json.dumps(entry.to_dict(), ensure_ascii=False))
+            else:
+                line = f"{entry.kind}\t{entry.name}"
+                if entry.kind == DiffEntry.MOVED:
+                    line += f"\t{tuple(entry.old.position)} -> {tuple(entry.new.position)} ({entry.distance:.0f} px)"
+                if entry.fields:
+                    line += f"\t{', '.join(entry.fields)}"
+                print(line)
+    except (OSError, ValueError, KeyError) as e:
+        manager.show_error("Ошибка", f"Не удалось построить диф: {e}")
+        return 1
+    if args.json:
+        print("]")
+    else:
+        print(", ".join(f"{kind}: {count}" for kind, count in summary.items()))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Менеджер раскладки иконок рабочего стола. "
+                                                 "Без команды запускается графический интерфейс.")
+    parser.add_argument('--layouts-dir', default="desktop_layouts", help="каталог сохранений")
+    parser.add_argument('--profile', action='store_true', help="собрать метрики и вывести их в JSON в stderr")
+    parser.add_argument('--metrics-file', metavar='FILE', help="записать JSON метрик в FILE (включает --profile)")
+    subparsers = parser.add_subparsers(dest='command')
+
+    list_parser = subparsers.add_parser('list', help="список сохраненных layouts")
+    list_parser.set_defaults(handler=cli_list)
+
+    capture_parser = subparsers.add_parser('capture', help="сохранить текущий рабочий стол")
+    capture_parser.add_argument('name')
+    capture_parser.add_argument('--description', default="")
+    capture_parser.set_defaults(handler=cli_capture)
+
+    restore_parser = subparsers.add_parser('restore', help="восстановить layout")
+    restore_parser.add_argument('layout', help="имя layout или файла .json")
+    restore_parser.add_argument('--full', action='store_true', help="перемещать все иконки, а не только сдвинутые")
+    restore_parser.add_argument('--tolerance', type=int, help="допуск в пикселях")
+    restore_parser.add_argument('--snapshot', help="id снимка из истории вместо файла layout")
+    restore_parser.set_defaults(handler=cli_restore)
+
+    snapshot_parser = subparsers.add_parser('snapshot', help="добавить текущий рабочий стол в историю layout")
+    snapshot_parser.add_argument('name')
+    snapshot_parser.add_argument('--description', default="")
+    snapshot_parser.set_defaults(handler=cli_snapshot)
+
+    classify_parser = subparsers.add_parser('classify', help="определить типы ярлыков layout по правилам")
+    classify_parser.add_argument('layout')
+    classify_parser.add_argument('--all', action='store_true', help="переопределить и уже заданные типы")
+    classify_parser.set_defaults(handler=cli_classify)
+
+    arrange_parser = subparsers.add_parser('arrange', help="разложить иконки layout по типам и важности "
+                                                           "в новый layout")
+    arrange_parser.add_argument('layout')
+    arrange_parser.add_argument('--name', help="имя нового layout")
+    arrange_parser.add_argument('--region', type=parse_region, action='append',
+                                help="монитор ШИРИНАxВЫСОТА[+X+Y]; можно указать несколько раз")
+    arrange_parser.add_argument('--keep-type', action='append', default=[],
+                                help="тип иконок, которые остаются на месте")
+    arrange_parser.add_argument('--apply', action='store_true', help="сразу восстановить на рабочем столе")
+    arrange_parser.set_defaults(handler=cli_arrange)
+
+    watch_parser = subparsers.add_parser('watch', help="следить за рабочим столом и дописывать "
+                                                       "изменения в layout")
+    watch_parser.add_argument('name', help="layout; создается из текущего стола, если его нет")
+    watch_parser.add_argument('--interval', type=float, default=2.0, help="секунд между опросами")
+    watch_parser.add_argument('--debounce', type=float, default=1.0,
+                              help="секунд без изменений перед обновлением layout")
+    watch_parser.add_argument('--fingerprint-every', type=int, default=5,
+                              help="в простое проверять позиции иконок раз в N опросов, "
+                                   "в остальных - только их число")
+    watch_parser.set_defaults(handler=cli_watch)
+
+    search_parser = subparsers.add_parser('search', help="найти ярлыки во всех сохраненных layouts")
+    search_parser.add_argument('query', nargs='+', help="слова и фильтры type:ТИП tag:ТЕГ layout:ИМЯ "
+                                                       "importance>=N; минус исключает: -tag:ТЕГ")
+    search_parser.add_argument('--limit', type=int, help="не больше N результатов")
+    search_parser.set_defaults(handler=cli_search)
+
+    history_parser = subparsers.add_parser('history', help="снимки layout в истории")
+    history_parser.add_argument('layout')
+    history_parser.set_defaults(handler=cli_history)
+
+    diff_parser = subparsers.add_parser('diff', help="что изменит восстановление layout "
+                                                     "или чем отличаются два layouts")
+    diff_parser.add_argument('layout', help="имя layout или файла .json")
+    diff_parser.add_argument('against', nargs='?', help="второй layout; без него - текущий рабочий стол")
+    diff_parser.add_argument('--tolerance', type=int, default=0, help="допуск в пикселях")
+    diff_parser.set_defaults(handler=cli_diff)
+
+    for subparser in (list_parser, capture_parser, restore_parser, diff_parser,
+                      snapshot_parser, history_parser, classify_parser, arrange_parser,
+                      watch_parser, search_parser):
+        subparser.add_argument('--json', action='store_true', help="вывод в JSON")
+    return parser
+
+
+def dump_metrics(report, metrics_file=None):
+    """Записать отчет метрик в файл или, если файл не указан, в stderr"""
+    if metrics_file:
+        atomic_write_json(metrics_file, report)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2), file=sys.stderr)
+
+
+def main(argv=None):
+    """Основная функция"""
+    args = build_parser().parse_args(argv)
+    profile = args.profile or bool(args.metrics_file)
+    if profile:
+        metrics.enable()
+    if not args.command:
+        import gui
+        app = gui.run()
+        if profile:
+            dump_metrics(app.manager.metrics_report(), args.metrics_file)
+        return 0
+
+    manager = DesktopIconManager(layouts_dir=args.layouts_dir)
+    manager.error_handler = cli_error
     try:
-        root = tk.Tk()
-        app = DesktopIconApp(root)
-        root.mainloop()
+        return args.handler(manager, args)
     finally:
-        pythoncom.CoUninitialize()
+        if profile:
+            dump_metrics(manager.metrics_report(), args.metrics_file)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # gui импортирует этот файл как модуль main - без повторного выполнения
+    sys.modules.setdefault("main", sys.modules[__name__])
+    sys.exit(main())
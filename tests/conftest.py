@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def raise_error(title, message):
+    raise AssertionError(f"{title}: {message}")
+
+
+@pytest.fixture
+def backend():
+    return main.InMemoryShellBackend.generate(30, name_collisions=0.2, seed=1)
+
+
+@pytest.fixture
+def manager(tmp_path, backend):
+    manager = main.DesktopIconManager(backend=backend, layouts_dir=str(tmp_path))
+    manager.error_handler = raise_error
+    return manager
+
+
+@pytest.fixture
+def layout(manager):
+    layout = manager.create_layout("test layout", "описание")
+    layout.shortcuts[0].update(tags=["steam", "избранное"], importance=5, description="Кавычки \" и \\ и ☃")
+    return layout
+
+
+@pytest.fixture
+def metrics_enabled():
+    main.metrics.reset()
+    main.metrics.enable()
+    yield main.metrics
+    main.metrics.enable(False)
+    main.metrics.reset()
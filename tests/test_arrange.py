@@ -0,0 +1,84 @@
+import pytest
+
+import main
+
+SPACING = (100, 100)
+
+
+def make_layout(types):
+    layout = main.DesktopLayout("arrange")
+    for i, (icon_type, importance) in enumerate(types):
+        layout.add_shortcut(main.Shortcut(f"s{i}", (i * 7, i * 3), bytes([i]), icon_type, importance=importance))
+    return layout
+
+
+def overlapping(shortcuts):
+    grid = main.SpatialGrid(SPACING)
+    found = []
+    for shortcut in shortcuts:
+        found.extend((shortcut.name, other.name) for other in grid.collisions(shortcut.position))
+        grid.insert(shortcut.position, shortcut)
+    return found
+
+
+def test_spatial_grid_collisions():
+    grid = main.SpatialGrid(SPACING)
+    grid.insert((100, 100), "a")
+    grid.insert((300, 100), "b")
+    assert grid.collisions((150, 199)) == ["a"]
+    assert grid.collisions((200, 100)) == []
+    assert grid.collisions((250, 50)) == ["b"]
+    assert grid.is_free((0, 0)) and not grid.is_free((101, 101))
+
+
+def test_groups_by_type_then_importance():
+    layout = make_layout([("игра", 1), ("работа", 5), ("игра", 5), ("неопознано", 5), ("работа", 2)])
+    arranger = main.LayoutArranger([(0, 0, 1000, 1000)], SPACING, type_order=["работа", "игра", "неопознано"])
+    groups = arranger.groups(layout.shortcuts)
+    assert [[s.name for s in group] for group in groups] == [["s1", "s4"], ["s2", "s0"], ["s3"]]
+
+
+def test_arrange_fills_columns_within_regions():
+    layout = make_layout([("работа", 1)] * 3 + [("игра", 1)] * 2)
+    regions = [(0, 0, 200, 200), (200, 0, 300, 100)]
+    arranger = main.LayoutArranger(regions, SPACING, type_order=["работа", "игра"])
+    arranged = arranger.arrange(layout, "новый")
+
+    assert arranged.name == "новый" and layout.shortcuts[0].position == (0, 0)
+    # Каждая группа начинается с новой колонки
+    assert [s.position for s in arranged.shortcuts] == [(0, 0), (0, 100), (100, 0), (200, 0), (300, 0)]
+    assert not overlapping(arranged.shortcuts)
+    for shortcut in arranged.shortcuts:
+        x, y = shortcut.position
+        assert any(left <= x and x + 100 <= left + width and top <= y and y + 100 <= top + height
+                   for left, top, width, height in regions)
+
+
+def test_kept_icons_block_their_cells():
+    layout = make_layout([("работа", 1)] * 4)
+    kept = layout.shortcuts[3]
+    kept.position = (40, 150)
+    arranger = main.LayoutArranger([(0, 0, 300, 300)], SPACING)
+    arranged = arranger.arrange(layout, keep=[kept.id])
+
+    assert arranged.shortcuts[3].position == (40, 150)
+    # (40, 150) перекрывает ячейки (0|100, 100|200) - в первых двух колонках свободна только верхняя
+    assert [s.position for s in arranged.shortcuts[:3]] == [(0, 0), (100, 0), (200, 0)]
+    assert not overlapping(arranged.shortcuts)
+
+
+def test_not_enough_room():
+    arranger = main.LayoutArranger([(0, 0, 100, 200)], SPACING)
+    with pytest.raises(ValueError):
+        arranger.arrange(make_layout([("игра", 1)] * 3))
+    arranger.overflow = True
+    assert [s.position for s in arranger.arrange(make_layout([("игра", 1)] * 3)).shortcuts] == \
+        [(0, 0), (0, 100), (100, 0)]
+
+
+def test_arrange_layout_without_desktop_regions(manager):
+    manager.backend = None
+    layout = make_layout([("игра", 1)] * 30)
+    arranged = manager.arrange_layout(layout)
+    assert arranged.name == "arrange упорядочено"
+    assert len(arranged.shortcuts) == 30 and not overlapping(arranged.shortcuts)
@@ -0,0 +1,74 @@
+import json
+import os
+
+import main
+
+
+def small_layout(name, count):
+    layout = main.DesktopLayout(name)
+    for i in range(count):
+        layout.add_shortcut(main.Shortcut(f"s{i}", (i, 0), bytes([i])))
+    return layout
+
+
+def test_eviction_by_shortcut_count():
+    cache = main.LayoutCache(max_shortcuts=25)
+    for name in "abc":
+        cache.put(name, 1, small_layout(name, 9))
+    # Вес layout - число ярлыков плюс один: третий вытесняет самый старый
+    assert list(cache.entries) == ["b", "c"]
+    assert cache.total_shortcuts == 20
+
+    assert cache.get("b", 1) is not None
+    cache.put("d", 1, small_layout("d", 9))
+    assert list(cache.entries) == ["b", "d"]
+
+
+def test_oversized_layout_stays_cached():
+    cache = main.LayoutCache(max_shortcuts=5)
+    cache.put("a", 1, small_layout("a", 2))
+    cache.put("big", 1, small_layout("big", 10))
+    assert list(cache.entries) == ["big"]
+
+
+def test_hits_misses_and_stale_key():
+    cache = main.LayoutCache()
+    layout = small_layout("a", 3)
+    assert cache.get("a", 1) is None
+    cache.put("a", 1, layout)
+    assert cache.get("a", 1) is layout
+    assert cache.get("a", 2) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 2, 1 / 3)
+
+
+def test_load_layout_reuses_parsed_layout(manager, layout):
+    manager.save_layout(layout)
+    # save_layout кладет в кэш сам сохраненный объект
+    assert manager.load_layout("test_layout.json") is layout
+    assert manager.load_layout("test_layout.json") is layout
+    assert manager.layout_cache.stats()['hits'] == 2
+
+
+def test_changed_file_is_reparsed(manager, layout):
+    manager.save_layout(layout)
+    first = manager.load_layout("test_layout.json")
+
+    filepath = os.path.join(manager.layouts_dir, "test_layout.json")
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    data['shortcuts'][0]['name'] = "Правка снаружи"
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+
+    second = manager.load_layout("test_layout.json")
+    assert second is not first
+    assert second.shortcuts[0].name == "Правка снаружи"
+
+
+def test_unsaved_edits_are_not_served(manager, layout):
+    manager.save_layout(layout)
+    layout.shortcuts[1].update(name="Не сохранено")
+    loaded = manager.load_layout("test_layout.json")
+    assert loaded is not layout
+    assert loaded.shortcuts[1].name != "Не сохранено"
@@ -0,0 +1,45 @@
+import main
+
+
+class PartialNamesBackend(main.InMemoryShellBackend):
+    """Снимок имен без последнего элемента; отдельное имя выдается по запросу"""
+
+    def __init__(self, items, display_name=None):
+        super().__init__(items)
+        self.display_name = display_name
+        self.display_name_calls = 0
+
+    def get_names(self):
+        names = super().get_names()
+        del names[main.pidl_key(self.items[-1]['pidl'])]
+        return names
+
+    def get_display_name(self, pidl):
+        self.display_name_calls += 1
+        return self.display_name
+
+
+def test_names_are_joined_by_pidl(manager, backend):
+    items = manager.get_desktop_items()
+    assert [item['index'] for item in items] == list(range(len(backend.items)))
+    assert [(item['name'], item['pidl'], item['position']) for item in items] == \
+        [(item['name'], item['pidl'], item['position']) for item in backend.items]
+
+
+def test_capture_makes_one_pass(manager, backend, metrics_enabled):
+    manager.get_desktop_items()
+    counters = metrics_enabled.snapshot()['get_desktop_items']['counters']
+    # EnumObjects + имя на элемент, ItemCount + Item и позиция на элемент
+    assert counters == {'com_calls': 3 * len(backend.items) + 2}
+
+
+def test_missing_name_falls_back_to_display_name(manager):
+    manager.backend = PartialNamesBackend(main.InMemoryShellBackend.generate(3).items, "Отдельно")
+    items = manager.get_desktop_items()
+    assert [item['name'] for item in items] == ["Icon 0", "Icon 1", "Отдельно"]
+    assert manager.backend.display_name_calls == 1
+
+
+def test_unnamed_item_gets_placeholder(manager):
+    manager.backend = PartialNamesBackend(main.InMemoryShellBackend.generate(3).items)
+    assert manager.get_desktop_items()[-1]['name'] == "Item_2"
@@ -0,0 +1,52 @@
+import json
+import os
+
+import main
+
+
+def fail_read_entry(*args):
+    raise AssertionError("файл layout разобран заново")
+
+
+def test_info_without_parsing(manager, layout, monkeypatch):
+    manager.save_layout(layout)
+    monkeypatch.setattr(main.LayoutCatalog, 'read_entry', staticmethod(fail_read_entry))
+    assert manager.get_saved_layouts() == ["test_layout.json"]
+    info = manager.get_layout_info("test_layout.json")
+    assert info['name'] == "test layout"
+    assert info['description'] == "описание"
+    assert info['shortcut_count'] == len(layout.shortcuts)
+
+
+def test_catalog_persists_across_managers(manager, layout, backend, monkeypatch):
+    manager.save_layout(layout)
+    monkeypatch.setattr(main.LayoutCatalog, 'read_entry', staticmethod(fail_read_entry))
+    other = main.DesktopIconManager(backend=backend, layouts_dir=manager.layouts_dir)
+    assert other.get_layout_info("test_layout.json")['shortcut_count'] == len(layout.shortcuts)
+
+
+def test_in_place_edit_is_picked_up(manager, layout):
+    manager.save_layout(layout)
+    assert manager.get_saved_layouts() == ["test_layout.json"]
+
+    filepath = os.path.join(manager.layouts_dir, "test_layout.json")
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    data['description'] = "правка снаружи"
+    del data['shortcuts'][1:]
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+    # Сразу после проверки каталог доверяет себе, после RECHECK_INTERVAL сверяет файлы
+    manager.catalog.checked_at -= main.LayoutCatalog.RECHECK_INTERVAL
+    info = manager.get_layout_info("test_layout.json")
+    assert info['description'] == "правка снаружи"
+    assert info['shortcut_count'] == 1
+
+
+def test_new_and_deleted_files(manager, layout):
+    manager.save_layout(layout)
+    manager.save_layout(manager.create_layout("второй"))
+    assert manager.get_saved_layouts() == ["test_layout.json", "второй.json"]
+    assert manager.delete_layout("test_layout.json")
+    assert manager.get_saved_layouts() == ["второй.json"]
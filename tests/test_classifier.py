@@ -0,0 +1,80 @@
+import json
+import os
+
+import pytest
+
+import main
+
+
+def shortcut(name, i=0):
+    return main.Shortcut(name, (0, 0), main.InMemoryShellBackend.make_pidl(i))
+
+
+@pytest.mark.parametrize("name, icon_type", [
+    ("Steam", "игра"),
+    ("Epic Games Launcher", "игра"),
+    ("Google Chrome", "интернет"),
+    ("Telegram", "интернет"),
+    ("Microsoft Word", "работа"),
+    ("Teams", "работа"),
+    ("VLC media player", "мультимедиа"),
+    ("Корзина", "система"),
+    ("Отчет.pdf", "документ"),
+    # Ключевые слова - только целыми словами
+    ("Wordle", main.UNKNOWN_ICON_TYPE),
+    ("Teamspeak 3", main.UNKNOWN_ICON_TYPE),
+    ("Заметки", main.UNKNOWN_ICON_TYPE),
+])
+def test_rules(name, icon_type):
+    assert main.IconClassifier().classify_many([shortcut(name)]) == [icon_type]
+
+
+def test_pidl_kinds():
+    classifier = main.IconClassifier()
+    folder = main.Shortcut("Проекты", (0, 0), b"\x31" + main.InMemoryShellBackend.make_pidl(0)[1:])
+    virtual = main.Shortcut("Что-то", (0, 0), b"\x1f\x00")
+    assert classifier.classify_many([folder, virtual]) == ["папка", "система"]
+
+
+def test_cache_by_pidl():
+    classifier = main.IconClassifier()
+    assert classifier.classify_many([shortcut("Steam", 1), shortcut("Chrome", 2)]) == ["игра", "интернет"]
+    # Тот же PIDL под другим именем берется из кэша без разбора
+    assert classifier.classify_many([shortcut("Переименован", 1)]) == ["игра"]
+    stats = classifier.stats()
+    assert (stats['entries'], stats['hits'], stats['misses']) == (2, 1, 2)
+
+
+def test_classify_layout_only_unknown(manager):
+    manager.auto_classify = False
+    manager.backend = main.InMemoryShellBackend(
+        [{'name': name, 'position': (0, i * 100), 'pidl': main.InMemoryShellBackend.make_pidl(i)}
+         for i, name in enumerate(["Steam", "Chrome", "Заметки"])])
+    layout = manager.create_layout("типы")
+    layout.shortcuts[1].icon_type = "избранное"
+
+    assert manager.classify_layout(layout) == 1
+    assert [s.icon_type for s in layout.shortcuts] == ["игра", "избранное", main.UNKNOWN_ICON_TYPE]
+    assert set(layout.dirty_shortcuts) == {layout.shortcuts[0].id}
+    assert manager.classify_layout(layout, only_unknown=False) == 1
+    assert layout.shortcuts[1].icon_type == "интернет"
+
+
+def test_auto_classify_on_capture(manager):
+    manager.backend = main.InMemoryShellBackend([{'name': "Discord", 'position': (0, 0), 'pidl': b"\x32" + bytes(13)}])
+    assert manager.create_layout("авто").shortcuts[0].icon_type == "интернет"
+
+
+def test_cli_classify_writes_loaded_file(manager, layout, capsys):
+    data = layout.to_dict()
+    data['name'] = "Имя не из файла"
+    for shortcut in data['shortcuts']:
+        shortcut['icon_type'] = main.UNKNOWN_ICON_TYPE
+    data['shortcuts'][0]['name'] = "Steam"
+    main.atomic_write_json(os.path.join(manager.layouts_dir, "other.json"), data)
+
+    assert main.main(['--layouts-dir', manager.layouts_dir, 'classify', 'other.json', '--json']) == 0
+    assert json.loads(capsys.readouterr().out)['changed'] == 1
+    assert sorted(name for name in os.listdir(manager.layouts_dir) if name.endswith('.json')) == ["other.json"]
+    saved = manager.load_layout("other.json")
+    assert saved.name == "Имя не из файла" and saved.shortcuts[0].icon_type == "игра"
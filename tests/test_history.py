@@ -0,0 +1,47 @@
+import os
+
+import main
+
+
+def history_size(manager):
+    root = manager.history.root
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for directory, _, names in os.walk(root) for name in names)
+
+
+def test_snapshot_round_trip(manager, layout):
+    snapshot = manager.snapshot_layout(layout)
+    assert manager.list_snapshots(layout.name) == [snapshot]
+    restored = manager.history.load(manager.layout_key(layout.name), snapshot)
+    assert restored.to_dict() == layout.to_dict()
+
+
+def test_unchanged_layout_reuses_snapshot(manager, layout):
+    snapshot = manager.snapshot_layout(layout)
+    size = history_size(manager)
+    assert manager.snapshot_layout(layout) == snapshot
+    assert history_size(manager) == size
+
+
+def test_small_change_adds_little(manager):
+    manager.backend = main.InMemoryShellBackend.generate(2000)
+    layout = manager.create_layout("большой")
+    manager.snapshot_layout(layout)
+    first_size = history_size(manager)
+
+    layout.shortcuts[10].update(position=(5000, 5000))
+    second = manager.snapshot_layout(layout)
+    # Новая запись ярлыка, один блок строк и манифест - а не вторая копия layout
+    assert history_size(manager) - first_size < first_size / 10
+    assert manager.history.load(manager.layout_key(layout.name), second).to_dict() == layout.to_dict()
+
+
+def test_load_layout_from_snapshot(manager, layout):
+    first = manager.snapshot_layout(layout)
+    layout.shortcuts[1].update(name="Переименован")
+    manager.snapshot_layout(layout)
+
+    old = manager.load_layout(layout.name, snapshot=first)
+    assert old.shortcuts[1].name != "Переименован"
+    assert manager.current_layout is old
+    assert [s.pidl for s in old.shortcuts] == [s.pidl for s in layout.shortcuts]
@@ -0,0 +1,9 @@
+import benchmarks
+
+HEAVY_MODULES = ('tkinter', '_tkinter', 'win32com', 'pythoncom')
+
+
+def test_console_import_skips_gui_and_com():
+    times = benchmarks.import_times("main")
+    assert 'main' in times
+    assert [name for name in times if name.split('.')[0] in HEAVY_MODULES] == []
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def runner():
+    runner = main.JobRunner(main.CallbackQueue())
+    yield runner
+    runner.shutdown()
+
+
+def test_callbacks_run_on_pump(runner):
+    results = []
+    progress = []
+    caller = threading.current_thread()
+
+    def work(count, progress):
+        for i in range(count):
+            progress(i + 1, count)
+        return threading.current_thread()
+
+    def on_done(thread):
+        results.append((thread, threading.current_thread()))
+
+    job = runner.submit(work, 3, on_done=on_done, on_progress=lambda done, total: progress.append((done, total)))
+    job.future.result(timeout=5)
+    assert not results
+
+    runner.dispatch.pump()
+    [(worker, delivered)] = results
+    assert worker is not caller and delivered is caller
+    # Частые обновления прореживаются, последнее доходит всегда
+    assert progress[-1] == (3, 3)
+
+
+def test_error_goes_to_on_error(runner):
+    errors = []
+
+    def work(progress):
+        raise ValueError("сбой")
+
+    runner.submit(work, on_done=lambda result: pytest.fail("on_done после ошибки"),
+                  on_error=errors.append).future.result(timeout=5)
+    runner.dispatch.pump()
+    assert [str(e) for e in errors] == ["сбой"]
+
+
+def test_cancel_raises_from_report_progress(runner):
+    started = threading.Event()
+    proceed = threading.Event()
+    errors = []
+
+    def work(progress):
+        started.set()
+        proceed.wait(5)
+        progress(1, 2)
+        return "не должно дойти"
+
+    job = runner.submit(work, on_done=lambda result: pytest.fail("on_done после отмены"),
+                        on_error=errors.append)
+    started.wait(5)
+    job.cancel()
+    proceed.set()
+    job.future.result(timeout=5)
+    runner.dispatch.pump()
+    assert job.cancelled
+    assert [type(e) for e in errors] == [main.JobCancelled]
+
+
+def test_cancel_stops_desktop_capture(manager, runner):
+    errors = []
+    job = main.Job(runner.dispatch, on_error=errors.append)
+    job.cancel()
+    job.run(manager.create_layout, ("отмена",))
+    runner.dispatch.pump()
+    assert [type(e) for e in errors] == [main.JobCancelled]
+    assert manager.current_layout is None
+
+
+def test_shutdown_cancels_pending_jobs():
+    runner = main.JobRunner(main.CallbackQueue())
+    started = threading.Event()
+    proceed = threading.Event()
+
+    def work(progress):
+        started.set()
+        proceed.wait(5)
+
+    first = runner.submit(work)
+    second = runner.submit(lambda progress: pytest.fail("задача после shutdown"))
+    started.wait(5)
+    runner.shutdown()
+    proceed.set()
+    first.future.result(timeout=5)
+    assert first.cancelled and second.future.cancelled()
+
+
+def test_layout_copy_is_independent(layout):
+    copy = layout.copy()
+    assert copy.to_dict() == layout.to_dict()
+    assert [s.id for s in copy.shortcuts] == [s.id for s in layout.shortcuts]
+    assert all(s.layout is copy for s in copy.shortcuts)
+
+    original = layout.shortcuts[2]
+    original.update(position=(999, 999), name="Правка в интерфейсе")
+    copied = copy.get_shortcut(original.pidl)
+    assert copied is not original and copied.position != (999, 999)
+    assert copy.get_shortcut_by_id(original.id) is copied
+    assert not copy.dirty_shortcuts
+
+    copy.add_shortcut(main.Shortcut("новый", (0, 0), b"\x99"))
+    assert copy.shortcuts[-1].id == layout.next_id
+    assert layout.get_shortcut(b"\x99") is None
+
+
+def test_create_layout_leaves_manager_state(manager, runner):
+    done = []
+    runner.submit(manager.create_layout, "в потоке", on_done=done.append).future.result(timeout=5)
+    runner.dispatch.pump()
+    assert len(done[0].shortcuts) == len(manager.backend.items)
+    assert manager.current_layout is None
@@ -0,0 +1,172 @@
+import json
+import os
+import shutil
+
+import main
+
+
+def reload(manager, layout):
+    manager.layout_cache = main.LayoutCache()
+    return manager.load_layout(manager.layout_filename(layout.name))
+
+
+def test_edits_go_to_journal_and_replay(manager, layout):
+    manager.save_layout(layout)
+    filepath = os.path.join(manager.layouts_dir, manager.layout_filename(layout.name))
+    with open(filepath, 'rb') as f:
+        saved = f.read()
+
+    layout.shortcuts[3].update(name="Переименован", importance=4)
+    layout.shortcuts[5].update(position=(900, 900))
+    assert manager.save_layout(layout)
+
+    with open(filepath, 'rb') as f:
+        assert f.read() == saved
+    assert os.path.getsize(filepath + ".journal") < 1000
+    assert reload(manager, layout).to_dict() == layout.to_dict()
+
+
+def test_compaction_merges_journal(manager, layout):
+    manager.save_layout(layout)
+    layout.shortcuts[2].update(tags=["a"])
+    manager.save_layout(layout)
+    filepath = os.path.join(manager.layouts_dir, manager.layout_filename(layout.name))
+    manager.get_journal(filepath).compact()
+    assert not os.path.exists(filepath + ".journal")
+    with open(filepath, encoding='utf-8') as f:
+        assert json.load(f) == json.loads(json.dumps(layout.to_dict()))
+
+
+def test_mismatch_falls_back_to_pidl_lookup(manager, layout):
+    manager.save_layout(layout)
+    layout.shortcuts[4].update(name="Сдвинут")
+    manager.save_layout(layout)
+    filepath = os.path.join(manager.layouts_dir, manager.layout_filename(layout.name))
+    # Файл переписан в обход журнала: ярлыки переставлены, индексы записей журнала не совпадают
+    with open(filepath, encoding='utf-8') as f:
+        data = json.load(f)
+    data['shortcuts'].reverse()
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+    loaded = reload(manager, layout)
+    renamed = loaded.get_shortcut(layout.shortcuts[4].pidl)
+    assert renamed.name == "Сдвинут"
+    assert len(loaded.shortcuts) == len(layout.shortcuts)
+
+
+def test_truncated_journal_line_is_ignored(manager, layout):
+    manager.save_layout(layout)
+    layout.shortcuts[1].update(name="Первая правка")
+    manager.save_layout(layout)
+    filepath = os.path.join(manager.layouts_dir, manager.layout_filename(layout.name))
+    with open(filepath + ".journal", 'a', encoding='utf-8') as f:
+        f.write('{"i": 2, "set": {"na')
+    assert reload(manager, layout).shortcuts[1].name == "Первая правка"
+
+
+def test_legacy_file_is_rewritten_on_first_save(manager, layout):
+    data = layout.to_dict()
+    data['version'] = "1.0"
+    for record in data['shortcuts']:
+        record['pidl'] = str(main.decode_pidl(record['pidl']))
+    filepath = os.path.join(manager.layouts_dir, "legacy.json")
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+    loaded = manager.load_layout("legacy.json")
+    loaded.name = "legacy"
+    loaded.shortcuts[0].update(name="Правка")
+    assert manager.save_layout(loaded)
+    assert not os.path.exists(filepath + ".journal")
+    with open(filepath, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved['version'] == main.LAYOUT_VERSION
+    assert not any(record['pidl'].startswith("b'") for record in saved['shortcuts'])
+
+
+def test_compaction_upgrades_legacy_pidls(tmp_path, layout):
+    data = layout.to_dict()
+    data['version'] = "1.0"
+    for record in data['shortcuts']:
+        record['pidl'] = str(main.decode_pidl(record['pidl']))
+    filepath = str(tmp_path / "old.json")
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    journal = main.LayoutJournal(filepath, main.threading.Lock())
+    journal.append([{'i': 0, 'pidl': data['shortcuts'][0]['pidl'], 'set': {'name': "W"},
+                     'modified': "2026-01-01T00:00:00"}])
+    journal.compact()
+
+    with open(filepath, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved['version'] == main.LAYOUT_VERSION
+    assert saved['shortcuts'][0]['name'] == "W"
+    assert [main.decode_pidl(r['pidl']) for r in saved['shortcuts']] == [s.pidl for s in layout.shortcuts]
+    assert not any(record['pidl'].startswith("b'") for record in saved['shortcuts'])
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def compact_with(manager, layout, monkeypatch, during):
+    """Сжать журнал layout, вызвав during() после записи слитого файла, до его замены"""
+    filepath = os.path.join(manager.layouts_dir, manager.layout_filename(layout.name))
+    write_temp = main.write_temp
+    calls = []
+
+    def patched(path, write, suffix=".tmp"):
+        tmp_path = write_temp(path, write, suffix)
+        if not calls:
+            calls.append(path)
+            during()
+        return tmp_path
+
+    monkeypatch.setattr(main, 'write_temp', patched)
+    manager.get_journal(filepath).compact()
+    monkeypatch.undo()
+    assert calls == [filepath]
+    return filepath
+
+
+def test_compaction_does_not_hold_lock_while_writing(manager, layout, monkeypatch):
+    manager.save_layout(layout)
+    layout.shortcuts[2].update(tags=["a"])
+    manager.save_layout(layout)
+
+    def during():
+        assert manager.journal_lock.acquire(blocking=False)
+        manager.journal_lock.release()
+
+    filepath = compact_with(manager, layout, monkeypatch, during)
+    assert not os.path.exists(filepath + ".journal")
+    assert reload(manager, layout).to_dict() == layout.to_dict()
+
+
+def test_entries_appended_during_compaction_are_kept(manager, layout, monkeypatch):
+    manager.save_layout(layout)
+    layout.shortcuts[2].update(tags=["a"])
+    manager.save_layout(layout)
+
+    def during():
+        layout.shortcuts[4].update(position=(700, 700))
+        manager.save_layout(layout)
+
+    filepath = compact_with(manager, layout, monkeypatch, during)
+    with open(filepath + ".journal", encoding='utf-8') as f:
+        assert [entry['i'] for entry in map(json.loads, f)] == [4]
+    with open(filepath, encoding='utf-8') as f:
+        assert json.load(f)['shortcuts'][2]['tags'] == ["a"]
+    assert reload(manager, layout).to_dict() == layout.to_dict()
+
+
+def test_compaction_yields_to_full_rewrite(manager, layout, monkeypatch):
+    manager.save_layout(layout)
+    layout.shortcuts[2].update(tags=["a"])
+    manager.save_layout(layout)
+
+    def during():
+        layout.remove_shortcut_by_id(layout.shortcuts[0].id)
+        manager.save_layout(layout)
+
+    filepath = compact_with(manager, layout, monkeypatch, during)
+    assert not [name for name in os.listdir(manager.layouts_dir) if name.endswith('.tmp')]
+    assert reload(manager, layout).to_dict() == layout.to_dict()
@@ -0,0 +1,55 @@
+import main
+
+
+def make_layout(count):
+    layout = main.DesktopLayout("index")
+    for i in range(count):
+        layout.add_shortcut(main.Shortcut(f"s{i}", (i, 0), bytes([i])))
+    return layout
+
+
+def test_lookup_by_pidl_and_id():
+    layout = make_layout(5)
+    assert [s.id for s in layout.shortcuts] == [1, 2, 3, 4, 5]
+    assert layout.get_shortcut(bytes([3])).name == "s3"
+    assert layout.get_shortcut_by_id(4) is layout.shortcuts[3]
+    assert layout.get_shortcut(b"\xff") is None and layout.get_shortcut_by_id(99) is None
+
+
+def test_remove_keeps_ids_and_order():
+    layout = make_layout(5)
+    removed = layout.remove_shortcut_by_id(2)
+    assert removed.layout is None and removed.name == "s1"
+    layout.remove_shortcut(bytes([3]))
+    assert [(s.id, s.name) for s in layout.shortcuts] == [(1, "s0"), (3, "s2"), (5, "s4")]
+    assert layout.get_shortcut(bytes([1])) is None
+    assert layout.remove_shortcut_by_id(2) is None
+
+    layout.add_shortcut(main.Shortcut("new", (0, 0), b"\x10"))
+    assert layout.shortcuts[-1].id == 6
+
+
+def test_pidl_change_reindexes():
+    layout = make_layout(3)
+    shortcut = layout.shortcuts[1]
+    shortcut.update(pidl=b"\x20")
+    assert layout.get_shortcut(b"\x20") is shortcut
+    assert layout.get_shortcut(bytes([1])) is None
+    assert layout.dirty_shortcuts[shortcut.id][1] == {'pidl'}
+
+
+def test_duplicate_names_are_separate_shortcuts():
+    layout = make_layout(2)
+    for shortcut in layout.shortcuts:
+        shortcut.update(name="Одинаковое")
+    assert [layout.get_shortcut(bytes([i])).id for i in range(2)] == [1, 2]
+
+
+def test_moving_shortcut_between_layouts():
+    source = make_layout(2)
+    target = main.DesktopLayout("target")
+    shortcut = source.shortcuts[0]
+    target.add_shortcut(shortcut)
+    assert source.get_shortcut(bytes([0])) is None
+    assert [s.name for s in source.shortcuts] == ["s1"]
+    assert target.get_shortcut(bytes([0])) is shortcut and shortcut.layout is target
@@ -0,0 +1,57 @@
+import json
+
+import main
+
+
+def test_disabled_metrics_record_nothing(manager, layout):
+    assert not main.metrics.enabled
+    assert main.metrics.phase("x") is main.NULL_PHASE
+    manager.save_layout(layout)
+    manager.load_layout("test_layout.json")
+    assert main.metrics.snapshot() == {}
+
+
+def test_phases_and_counters(manager, layout, metrics_enabled):
+    manager.restore_layout(layout)
+    operations = metrics_enabled.snapshot()
+    assert operations['restore_layout']['calls'] == 1
+    # Вложенные фазы получают путь внешней, счетчики относятся к внешней операции
+    assert operations['restore_layout/plan_restore/get_desktop_items/get_names']['calls'] == 1
+    assert operations['restore_layout/move_items']['calls'] == 1
+    assert operations['restore_layout']['counters']['com_calls'] == 3 * len(layout.shortcuts) + 2
+
+
+def test_counters_without_phase(metrics_enabled):
+    metrics_enabled.count('bytes_read', 10)
+    metrics_enabled.count('bytes_read', 5)
+    assert metrics_enabled.snapshot() == {'-': {'counters': {'bytes_read': 15}}}
+
+
+def test_measured_decorator(metrics_enabled):
+    @main.measured("work")
+    def work(value):
+        with metrics_enabled.phase("inner"):
+            metrics_enabled.count('items', value)
+        return value * 2
+
+    assert work(3) == 6
+    assert work.__name__ == "work"
+    operations = metrics_enabled.snapshot()
+    assert operations['work']['calls'] == 1 and operations['work']['counters'] == {'items': 3}
+    assert operations['work/inner']['calls'] == 1
+
+    metrics_enabled.enable(False)
+    assert work(1) == 2
+    assert metrics_enabled.snapshot()['work']['calls'] == 1
+
+
+def test_metrics_file(tmp_path):
+    metrics_file = tmp_path / "metrics.json"
+    try:
+        assert main.main(['--layouts-dir', str(tmp_path), '--metrics-file', str(metrics_file), 'list']) == 0
+    finally:
+        main.metrics.enable(False)
+        main.metrics.reset()
+    report = json.loads(metrics_file.read_text(encoding='utf-8'))
+    assert set(report) == {'operations', 'caches'}
+    assert report['caches']['layouts']['layouts'] == 0
@@ -0,0 +1,139 @@
+import json
+
+import main
+
+
+def items_of(backend):
+    return [{'index': i, 'name': item['name'], 'position': tuple(item['position']), 'pidl': item['pidl']}
+            for i, item in enumerate(backend.items)]
+
+
+def shortcut(name, position, pidl):
+    return main.Shortcut(name, position, pidl)
+
+
+def make_layout(*shortcuts):
+    layout = main.DesktopLayout("plan")
+    for s in shortcuts:
+        layout.add_shortcut(s)
+    return layout
+
+
+def test_match_by_pidl_before_name():
+    backend = main.InMemoryShellBackend.generate(3)
+    items = items_of(backend)
+    layout = make_layout(shortcut("Другое имя", (500, 0), items[1]['pidl']))
+    plan = main.RestorePlan.build(layout, items)
+    assert [(s.name, item['index']) for s, item in plan.moves] == [("Другое имя", 1)]
+
+
+def test_unique_name_fallback():
+    items = items_of(main.InMemoryShellBackend.generate(3))
+    layout = make_layout(shortcut(items[2]['name'], (500, 0), b"\x01other"))
+    plan = main.RestorePlan.build(layout, items)
+    assert [item['index'] for _, item in plan.moves] == [2]
+    assert not plan.unmatched and not plan.ambiguous
+
+
+def test_duplicate_names_are_ambiguous():
+    backend = main.InMemoryShellBackend.generate(4)
+    backend.items[0]['name'] = backend.items[1]['name'] = "X"
+    items = items_of(backend)
+    layout = make_layout(shortcut("X", (500, 500), b"\x01a"), shortcut("X", (600, 600), b"\x01b"),
+                         shortcut("Нет на столе", (0, 0), b"\x01c"))
+    plan = main.RestorePlan.build(layout, items)
+    assert not plan.moves
+    assert [s.name for s in plan.ambiguous] == ["X", "X"]
+    assert [s.name for s in plan.unmatched] == ["Нет на столе"]
+
+
+def test_pidl_match_is_used_once():
+    items = items_of(main.InMemoryShellBackend.generate(2))
+    pidl = items[0]['pidl']
+    layout = make_layout(shortcut("A", (100, 100), pidl), shortcut("A copy", (200, 200), pidl))
+    plan = main.RestorePlan.build(layout, items)
+    assert len(plan.moves) == 1
+    assert [s.name for s in plan.unmatched] == ["A copy"]
+
+
+def test_tolerance_skips_icons_in_place():
+    items = items_of(main.InMemoryShellBackend.generate(2))
+    layout = make_layout(shortcut("a", (items[0]['position'][0] + 3, items[0]['position'][1]), items[0]['pidl']),
+                         shortcut("b", (999, 999), items[1]['pidl']))
+    plan = main.RestorePlan.build(layout, items, tolerance=5)
+    assert [s.name for s, _ in plan.in_place] == ["a"]
+    assert [s.name for s, _ in plan.moves] == ["b"]
+    assert len(main.RestorePlan.build(layout, items).moves) == 2
+
+
+def test_restore_moves_icons(manager, backend):
+    layout = manager.create_layout("moved")
+    for s in layout.shortcuts:
+        s.update(position=(s.position[0] + 1000, s.position[1]))
+    restored = manager.restore_layout(layout)
+    assert restored == len(layout.shortcuts)
+    assert [tuple(item['position']) for item in backend.items] == [s.position for s in layout.shortcuts]
+
+
+def test_preview_matches_restore(tmp_path):
+    backend = main.InMemoryShellBackend.generate(4)
+    backend.items[0]['name'] = backend.items[1]['name'] = "X"
+    manager = main.DesktopIconManager(backend=backend, layouts_dir=str(tmp_path))
+    layout = make_layout(shortcut("X", (500, 500), b"\x01a"), shortcut("X", (600, 600), b"\x01b"),
+                         shortcut(backend.items[2]['name'], (700, 700), backend.items[2]['pidl']))
+
+    summary = main.summarize_diff(manager.preview_restore(layout))
+    manager.restore_layout(layout)
+    stats = manager.last_restore_plan.stats()
+    assert summary[main.DiffEntry.MOVED] == stats['moves_issued'] == 1
+    assert summary[main.DiffEntry.AMBIGUOUS] == stats['ambiguous'] == 2
+
+
+def test_diff_with_file_streams_other_side(manager, layout):
+    manager.save_layout(layout)
+    other = manager.create_layout("другой")
+    other.shortcuts[0].update(position=(900, 900))
+    other.shortcuts[1].update(tags=["новый"])
+    other.remove_shortcut_by_id(other.shortcuts[2].id)
+    manager.save_layout(other)
+    other.shortcuts[3].update(position=(800, 800))
+    manager.save_layout(other)  # правка в журнале
+
+    manager.layout_cache = main.LayoutCache()
+    entries = manager.diff_layouts(layout, "другой.json")
+    assert not isinstance(entries, list)
+    summary = main.summarize_diff(entries)
+    # Первый ярлык layout еще и отличается метаданными из фикстуры
+    assert summary == {'added': 0, 'removed': 1, 'moved': 2, 'changed': 2, 'ambiguous': 0}
+    assert not manager.layout_cache.entries
+
+
+def test_diff_with_missing_file(manager, layout):
+    errors = []
+    manager.error_handler = lambda title, message: errors.append(message)
+    assert manager.diff_layouts(layout, "нет.json") is None
+    assert len(errors) == 1
+
+
+class FailingBackend(main.InMemoryShellBackend):
+    def position_item(self, index, position):
+        raise OSError(f"нет доступа к {index}")
+
+    def get_display_name(self, pidl):
+        raise OSError("нет имени")
+
+
+def test_failed_moves_are_reported_once(manager, layout, monkeypatch, capsys):
+    for shortcut in layout.shortcuts[:7]:
+        shortcut.update(position=(shortcut.position[0] + 1000, 0))
+    manager.save_layout(layout)
+    manager.backend = FailingBackend(manager.backend.items)
+    monkeypatch.setattr(manager.backend, 'get_names', lambda: {})
+    monkeypatch.setattr(main, 'DesktopIconManager', lambda layouts_dir: manager)
+
+    assert main.main(['--layouts-dir', manager.layouts_dir, 'restore', layout.name, '--json']) == 0
+    out, err = capsys.readouterr()
+    result = json.loads(out)
+    assert (result['moves_issued'], result['moves_failed']) == (0, 7)
+    assert err.count("Не удалось переместить 7 иконок") == 1
+    assert "и еще 2" in err
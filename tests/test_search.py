@@ -0,0 +1,49 @@
+import os
+
+import main
+
+
+def names(hits):
+    return sorted(hit['name'] for hit in hits)
+
+
+def test_facets_and_words(manager, layout):
+    layout.shortcuts[1].update(icon_type="игра", tags=["Steam"], importance=4)
+    layout.shortcuts[2].update(icon_type="игра", importance=2)
+    manager.save_layout(layout)
+
+    assert names(manager.search_shortcuts("type:игра tag:steam importance>=4")) == [layout.shortcuts[1].name]
+    assert names(manager.search_shortcuts("type:игра -tag:steam")) == [layout.shortcuts[2].name]
+    assert layout.shortcuts[0].name in names(manager.search_shortcuts("кавыч"))
+
+
+def test_journal_save_appends_only_changes(manager):
+    layout = manager.create_layout("big")
+    manager.save_layout(layout)
+    manager.search_shortcuts("")
+    index_size = os.path.getsize(manager.search_index.index_path)
+    layout.shortcuts[7].update(tags=["после"])
+    manager.save_layout(layout)
+    assert os.path.getsize(manager.search_index.index_path) - index_size < 300
+    assert [hit['index'] for hit in manager.search_shortcuts("tag:после")] == [7]
+
+
+def test_index_survives_reload_and_matches_rebuild(manager, layout):
+    manager.save_layout(layout)
+    for i in range(5):
+        layout.shortcuts[i].update(tags=[f"t{i % 2}"], importance=1 + i)
+        manager.save_layout(layout)
+    expected = manager.search_shortcuts("")
+
+    reopened = main.DesktopIconManager(layouts_dir=manager.layouts_dir)
+    assert reopened.search_shortcuts("") == expected
+    os.remove(manager.search_index.index_path)
+    rebuilt = main.DesktopIconManager(layouts_dir=manager.layouts_dir)
+    assert rebuilt.search_shortcuts("") == expected
+
+
+def test_deleted_layout_is_forgotten(manager, layout):
+    manager.save_layout(layout)
+    assert manager.search_shortcuts("layout:test_layout")
+    manager.delete_layout(manager.layout_filename(layout.name))
+    assert manager.search_shortcuts("layout:test_layout") == []
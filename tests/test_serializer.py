@@ -0,0 +1,72 @@
+import io
+import json
+
+import pytest
+
+import main
+
+
+def dump_json(layout):
+    return json.dumps(layout.to_dict(), indent=2, ensure_ascii=False)
+
+
+def test_write_matches_json_dump(layout):
+    f = io.StringIO()
+    main.LayoutSerializer(fast=False).write(f, layout)
+    assert f.getvalue() == dump_json(layout)
+
+
+def test_orjson_write_matches_json_dump(layout):
+    # Без orjson fast=True идет тем же путем json, что и fast=False - проверять нечего
+    pytest.importorskip("orjson")
+    serializer = main.LayoutSerializer(fast=True)
+    assert serializer.orjson is not None
+    f = io.StringIO()
+    serializer.write(f, layout)
+    assert f.getvalue() == dump_json(layout)
+
+
+def test_write_empty_layout():
+    layout = main.DesktopLayout("пусто")
+    f = io.StringIO()
+    main.LayoutSerializer().write(f, layout)
+    assert f.getvalue() == dump_json(layout)
+
+
+def test_write_many_batches(layout, monkeypatch):
+    monkeypatch.setattr(main.LayoutSerializer, 'BATCH_SIZE', 4)
+    f = io.StringIO()
+    main.LayoutSerializer().write(f, layout)
+    assert f.getvalue() == dump_json(layout)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 256 * 1024])
+def test_read_across_chunk_boundaries(layout, monkeypatch, chunk_size):
+    monkeypatch.setattr(main.LayoutSerializer, 'READ_CHUNK_SIZE', chunk_size)
+    data = layout.to_dict()
+    data['trailing'] = [1.5, 10 ** 20, None]  # поля после shortcuts и числа на границе блока
+    header, records = main.LayoutSerializer().read_records(io.StringIO(json.dumps(data, indent=2)))
+    assert list(records) == json.loads(json.dumps(data['shortcuts']))
+    assert header['trailing'] == data['trailing']
+    assert header['name'] == data['name']
+
+
+def test_read_compact_and_empty_json():
+    text = json.dumps({'name': 'a', 'shortcuts': [], 'version': main.LAYOUT_VERSION}, separators=(',', ':'))
+    header, records = main.LayoutSerializer().read_records(io.StringIO(text))
+    assert list(records) == []
+    assert header == {'name': 'a', 'version': main.LAYOUT_VERSION}
+
+
+def test_read_truncated_file_fails(layout):
+    text = dump_json(layout)[:-20]
+    with pytest.raises(ValueError):
+        _, records = main.LayoutSerializer().read_records(io.StringIO(text))
+        list(records)
+
+
+def test_save_load_round_trip(manager, layout):
+    assert manager.save_layout(layout)
+    manager.layout_cache = main.LayoutCache()
+    loaded = manager.load_layout(manager.layout_filename(layout.name))
+    assert loaded.to_dict() == layout.to_dict()
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import pytest
+
+import main
+
+
+def test_shortcut_has_no_dict():
+    shortcut = main.Shortcut("a", (1, 2), b"\x01")
+    assert not hasattr(shortcut, '__dict__')
+    with pytest.raises(AttributeError):
+        shortcut.extra = 1
+
+
+def test_tags_and_types_are_interned():
+    first = main.Shortcut("a", (0, 0), b"\x01", "".join(["игр", "а"]), ["".join(["st", "eam"])])
+    second = main.Shortcut("b", (0, 0), b"\x02", "игра", ["steam"])
+    assert first.icon_type is second.icon_type
+    assert first.tags[0] is second.tags[0]
+    assert main.Shortcut("c", (0, 0), b"\x03").tags is main.Shortcut("d", (0, 0), b"\x04", tags=[]).tags
+
+
+def test_shortcut_round_trip(layout):
+    for shortcut in layout.shortcuts:
+        data = shortcut.to_dict()
+        assert main.Shortcut.from_dict(data).to_dict() == data
+
+
+@pytest.mark.parametrize("value", ["2025-09-22T15:34:18+03:00", "2025-09-22T12:34:18.5Z"])
+def test_aware_timestamp_is_converted_to_local_time(value):
+    shortcut = main.Shortcut.from_dict({'name': "a", 'position': (0, 0), 'pidl': None,
+                                        'created': value, 'modified': value})
+    expected = datetime.fromisoformat(value).astimezone().replace(tzinfo=None)
+    assert datetime.fromisoformat(shortcut.created) == expected
+    assert shortcut.modified == shortcut.created
+    assert main.Shortcut.from_dict(shortcut.to_dict()).to_dict() == shortcut.to_dict()
+
+
+def test_unparsed_timestamp_is_kept():
+    data = {'name': "a", 'position': (0, 0), 'pidl': None, 'created': "вчера", 'modified': "сегодня"}
+    shortcut = main.Shortcut.from_dict(data)
+    assert (shortcut.created, shortcut.modified) == ("вчера", "сегодня")
+
+    layout = main.DesktopLayout("raw")
+    layout.add_shortcut(shortcut)
+    columnar = main.ColumnarDesktopLayout.from_layout(layout)
+    assert columnar.to_dict()['shortcuts'][0]['created'] == "вчера"
+    assert columnar.shortcuts[0].modified == "сегодня"
+
+
+def test_columnar_layout_matches_layout(layout):
+    columnar = main.ColumnarDesktopLayout.from_dict(layout.to_dict())
+    assert columnar.to_dict() == layout.to_dict()
+    assert columnar.to_layout().to_dict() == layout.to_dict()
+    pidl = layout.shortcuts[3].pidl
+    assert columnar.get_shortcut(pidl).to_dict() == layout.get_shortcut(pidl).to_dict()
+
+
+def test_pidl_index_keeps_lists_only_for_collisions():
+    layout = main.DesktopLayout("pidl")
+    first = main.Shortcut("a", (0, 0), b"\x01")
+    second = main.Shortcut("b", (0, 0), b"\x01")
+    layout.add_shortcut(first)
+    assert layout.by_pidl[b"\x01"] is first
+
+    layout.add_shortcut(second)
+    assert layout.by_pidl[b"\x01"] == [first, second]
+    assert layout.get_shortcut(b"\x01") is first
+
+    first.update(pidl=b"\x02")
+    assert layout.by_pidl == {b"\x01": second, b"\x02": first}
+    layout.remove_shortcut(b"\x01")
+    assert layout.shortcuts_with_pidl(b"\x01") == [] and layout.get_shortcut(b"\x01") is None
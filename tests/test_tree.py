@@ -0,0 +1,67 @@
+import benchmarks
+import main
+
+
+def make_layout(count):
+    layout = main.DesktopLayout("tree")
+    for i in range(count):
+        layout.add_shortcut(main.Shortcut(f"s{i}", (i, 0), i.to_bytes(2, "little")))
+    return layout
+
+
+def test_only_current_page_is_in_widget():
+    tree = benchmarks.StubTreeview()
+    view = main.PagedShortcutsTree(tree, page_size=10)
+    view.show(make_layout(25))
+    assert sorted(tree.items, key=int) == [str(i) for i in range(1, 11)]
+    assert view.page_label() == "1-10 из 25"
+
+    view.set_page(5)
+    assert view.page == 2
+    assert sorted(tree.items, key=int) == [str(i) for i in range(21, 26)]
+    assert view.page_label() == "21-25 из 25"
+
+
+def test_edit_touches_one_row():
+    tree = benchmarks.StubTreeview()
+    view = main.PagedShortcutsTree(tree, page_size=10)
+    layout = make_layout(25)
+    view.show(layout)
+
+    tree.calls = 0
+    view.show(layout)
+    assert tree.calls == 0
+
+    layout.shortcuts[3].update(name="Новое имя")
+    view.update_row(layout.shortcuts[3])
+    assert tree.calls == 1
+    assert tree.items['4'][0] == "Новое имя"
+    view.refresh()
+    assert tree.calls == 1
+
+    # Ярлык с другой страницы виджет не трогает
+    layout.shortcuts[20].update(name="Не видно")
+    view.update_row(layout.shortcuts[20])
+    assert tree.calls == 1
+
+
+def test_removal_shifts_page():
+    tree = benchmarks.StubTreeview()
+    view = main.PagedShortcutsTree(tree, page_size=10)
+    layout = make_layout(12)
+    view.show(layout)
+
+    tree.calls = 0
+    layout.remove_shortcut_by_id(1)
+    view.refresh()
+    # Одно удаление и вставка строки, которая переехала на страницу
+    assert tree.calls == 2
+    assert sorted(tree.items, key=int) == [str(i) for i in range(2, 12)]
+
+
+def test_without_pages_all_rows_are_shown():
+    tree = benchmarks.StubTreeview()
+    view = main.PagedShortcutsTree(tree, page_size=None)
+    view.show(make_layout(25))
+    assert len(tree.items) == 25
+    assert view.page_label() == "25 ярлыков"
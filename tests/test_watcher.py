@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+import main
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def desktop(manager):
+    manager.backend = main.SimulatedShellBackend(main.InMemoryShellBackend.generate(20).items, seed=3)
+    return manager.backend
+
+
+def make_watcher(manager, **kwargs):
+    layout = manager.create_layout("наблюдение")
+    manager.save_layout(layout)
+    clock = Clock()
+    watcher = main.DesktopWatcher(manager, layout, debounce=1.0, clock=clock, **kwargs)
+    manager.backend.calls = dict.fromkeys(manager.backend.calls, 0)
+    return watcher, clock
+
+
+def test_idle_polls_are_cheap(manager, desktop):
+    watcher, clock = make_watcher(manager, fingerprint_every=5)
+    for _ in range(10):
+        assert watcher.step() == 0
+        clock.now += 2.0
+    assert desktop.calls == {'count': 10, 'fingerprint': 2, 'view_items': 0, 'names': 0}
+    assert watcher.syncs == 0
+
+
+def test_moves_are_debounced_into_one_sync(manager, desktop):
+    watcher, clock = make_watcher(manager, fingerprint_every=1)
+    for now in (0.0, 0.5, 1.0):
+        clock.now = now
+        desktop.move_random(2)
+        assert watcher.step() == 0
+    clock.now = 1.5
+    assert watcher.step() == 0  # с последнего изменения прошло меньше debounce
+    clock.now = 2.0
+    assert watcher.step() > 0
+    for now in (3.0, 4.0, 5.0):
+        clock.now = now
+        assert watcher.step() == 0
+
+    assert watcher.syncs == 1
+    assert (desktop.calls['view_items'], desktop.calls['names']) == (1, 1)
+    assert [(s.pidl, s.position) for s in watcher.layout.shortcuts] == \
+        [(item['pidl'], item['position']) for item in desktop.items]
+    # Перемещения записаны журналом, без полной перезаписи файла
+    assert os.path.exists(watcher.layout.source_path + ".journal")
+
+
+def test_added_and_removed_icons(manager, desktop):
+    watcher, clock = make_watcher(manager)
+    desktop.add_item("Новая")
+    desktop.remove_random(2)
+    watcher.step()
+    clock.now = 1.0
+    assert watcher.step() == 3
+    assert desktop.calls['view_items'] == 1
+    assert sorted(s.pidl for s in watcher.layout.shortcuts) == sorted(item['pidl'] for item in desktop.items)
+    assert manager.load_layout("наблюдение.json").get_shortcut(desktop.items[-1]['pidl']).name == "Новая"
+
+
+def test_saves_to_loaded_file(manager, desktop):
+    layout = manager.create_layout("внутреннее имя")
+    main.atomic_write_json(os.path.join(manager.layouts_dir, "watched.json"), layout.to_dict())
+    layout = manager.load_layout("watched.json")
+    clock = Clock()
+    watcher = main.DesktopWatcher(manager, layout, debounce=0, clock=clock, fingerprint_every=1)
+    desktop.move_random()
+    assert watcher.step() == 1
+    assert sorted(name for name in os.listdir(manager.layouts_dir) if name.endswith('.json')) == ["watched.json"]
+    assert manager.load_layout("watched.json").to_dict() == layout.to_dict()